@@ -0,0 +1,84 @@
+"""Micro-benchmark for decoding OpenTripPlanner plan responses.
+
+Compares the previous decoding path, stdlib JSON parsing followed by validation with
+per-key regex remapping of every itinerary, leg and step, against single-pass
+validation from raw bytes with precomputed aliases. Also times decoding the same plan
+as answered to the summary template.
+
+Usage: python -m benchmarks.decode_plan [--payload recording.json] [--rounds 50]
+"""
+
+from argparse import ArgumentParser
+from timeit import repeat
+import json
+from benchmarks.fixtures import build_summary_payload, load_plan_payload
+from core.utils import to_snake_case
+from services.schemas.open_trip_planner import (
+    OTPPlanGraphQLResponse,
+    OTPPlanResponseModel,
+    OTPSummaryPlanGraphQLResponse,
+    OTPSummaryPlanResponseModel,
+)
+
+
+def _remap(values: dict) -> dict:
+    """Remap keys the way the former model_validator(mode="before") hooks did."""
+
+    for key in list(values.keys()):
+        if key == "from":
+            values["from_"] = values.pop("from")
+        else:
+            values[to_snake_case(key)] = values.pop(key)
+    return values
+
+
+def decode_legacy(payload: bytes) -> OTPPlanResponseModel:
+    plan = _remap(json.loads(payload)["data"]["plan"])
+    for itinerary in plan["itineraries"]:
+        _remap(itinerary)
+        for leg in itinerary["legs"]:
+            _remap(leg)
+            for step in leg["steps"]:
+                _remap(step)
+    return OTPPlanResponseModel.model_validate(plan)
+
+
+def decode_fast(payload: bytes) -> OTPPlanResponseModel:
+    return OTPPlanGraphQLResponse.model_validate_json(payload).data.plan
+
+
+def decode_summary(payload: bytes) -> OTPSummaryPlanResponseModel:
+    return OTPSummaryPlanGraphQLResponse.model_validate_json(payload).data.plan
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payload", help="Path to a recorded OTP plan response")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    payload = load_plan_payload(args.payload)
+    if decode_legacy(payload) != decode_fast(payload):
+        raise SystemExit("Decoding paths produced different results.")
+
+    print(f"Payload size: {len(payload) / 1024:.1f} KiB")
+    results = {}
+    for name, decode in (("legacy", decode_legacy), ("fast", decode_fast)):
+        timings = repeat(lambda: decode(payload), number=1, repeat=args.rounds)
+        results[name] = min(timings)
+        print(
+            f"{name:>8}: best {min(timings) * 1000:.2f} ms, "
+            f"mean {sum(timings) / len(timings) * 1000:.2f} ms"
+        )
+    print(f"Speedup: {results['legacy'] / results['fast']:.2f}x")
+
+    summary_payload = json.dumps(build_summary_payload(json.loads(payload))).encode()
+    timings = repeat(lambda: decode_summary(summary_payload), number=1, repeat=args.rounds)
+    print(
+        f"Summary payload size: {len(summary_payload) / 1024:.1f} KiB, "
+        f"best {min(timings) * 1000:.2f} ms, {results['fast'] / min(timings):.2f}x faster than full"
+    )
+
+
+if __name__ == "__main__":
+    main()
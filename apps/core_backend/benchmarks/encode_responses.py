@@ -0,0 +1,132 @@
+"""Micro-benchmark for serializing and compressing routing responses.
+
+Compares the previous serialization path, response model validation followed by a
+dump to Python objects and stdlib JSON encoding, against direct serialization to JSON
+bytes. Then reports the size and time of gzip and brotli compression for a plan
+response and a detailed itinerary.
+
+Usage: python -m benchmarks.encode_responses [--payload recording.json] [--rounds 50]
+"""
+
+from argparse import ArgumentParser
+from timeit import repeat
+from uuid import uuid4
+import json
+from pydantic import BaseModel
+from benchmarks.fixtures import load_plan_payload
+from core.compression import BrotliCompressor, GzipCompressor
+from core.polyline import simplify_polylines
+from schemas.coordinates import Coordinates
+from schemas.routing import (
+    ItineraryResponseModel,
+    ItinerarySummary,
+    LegDetailed,
+    LegSummary,
+    RoutingPlanResponseModel,
+    Step,
+)
+from services.schemas.open_trip_planner import OTPPlanGraphQLResponse
+
+
+def build_responses(payload: bytes) -> tuple[RoutingPlanResponseModel, ItineraryResponseModel]:
+    """Build a plan response and the first detailed itinerary from an OTP plan response."""
+
+    plan = OTPPlanGraphQLResponse.model_validate_json(payload).data.plan
+    origin = Coordinates(lat=plan.from_.lat, lon=plan.from_.lon)
+    destination = Coordinates(lat=plan.to.lat, lon=plan.to.lon)
+    itineraries = [
+        ItineraryResponseModel(
+            itinerary_id=uuid4(),
+            duration=itinerary.duration,
+            start_time=itinerary.start_time,
+            end_time=itinerary.end_time,
+            origin=origin,
+            destination=destination,
+            legs=[
+                LegDetailed(
+                    mode=leg.mode,
+                    duration=int(leg.duration),
+                    distance=round(leg.distance),
+                    geometry=leg.leg_geometry.points,
+                    steps=[
+                        Step(
+                            distance=step.distance,
+                            lon=step.lon,
+                            lat=step.lat,
+                            relative_direction=step.relative_direction.value,
+                            absolute_direction=step.absolute_direction.value,
+                            street_name=step.street_name,
+                            bogus_name=step.bogus_name,
+                        )
+                        for step in leg.steps
+                    ],
+                )
+                for leg in itinerary.legs
+            ],
+        )
+        for itinerary in plan.itineraries
+    ]
+    plan_response = RoutingPlanResponseModel(
+        itineraries=[
+            ItinerarySummary(
+                **itinerary.model_dump(exclude={"legs"}),
+                legs=[
+                    LegSummary(mode=leg.mode, duration=leg.duration, distance=leg.distance, geometry=geometry)
+                    for leg, geometry in zip(
+                        itinerary.legs, simplify_polylines([leg.geometry for leg in itinerary.legs], 5.0)
+                    )
+                ],
+            )
+            for itinerary in itineraries
+        ]
+    )
+    return plan_response, itineraries[0]
+
+
+def serialize_legacy(model: BaseModel) -> bytes:
+    content = type(model).model_validate(model).model_dump(mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def serialize_fast(model: BaseModel) -> bytes:
+    return model.model_dump_json().encode()
+
+
+def best_time(function, rounds: int) -> float:
+    return min(repeat(function, number=1, repeat=rounds))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payload", help="Path to a recorded OTP plan response")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    responses = build_responses(load_plan_payload(args.payload))
+    for name, response in zip(("plan", "itinerary"), responses):
+        if json.loads(serialize_legacy(response)) != json.loads(serialize_fast(response)):
+            raise SystemExit("Serialization paths produced different results.")
+
+        legacy_time = best_time(lambda: serialize_legacy(response), args.rounds)
+        fast_time = best_time(lambda: serialize_fast(response), args.rounds)
+        body = serialize_fast(response)
+        print(f"{name}: {len(body) / 1024:.1f} KiB")
+        print(
+            f"  serialization: legacy {legacy_time * 1000:.3f} ms, fast {fast_time * 1000:.3f} ms "
+            f"({legacy_time / fast_time:.2f}x)"
+        )
+
+        compressors = [(f"gzip {level}", lambda level=level: GzipCompressor(level)) for level in (1, 6, 9)] + [
+            (f"br {quality}", lambda quality=quality: BrotliCompressor(quality)) for quality in (1, 4, 6, 11)
+        ]
+        for compressor_name, build_compressor in compressors:
+            size = len(build_compressor().compress(body, final=True))
+            compression_time = best_time(lambda: build_compressor().compress(body, final=True), args.rounds)
+            print(
+                f"  {compressor_name:>7}: {size / 1024:>6.1f} KiB ({size / len(body):>4.0%}), "
+                f"{compression_time * 1000:.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""OpenTripPlanner and Pelias response payloads for benchmarks.
+
+Recorded responses can be placed in benchmarks/recordings/ as plan.json and
+autocomplete.json. Without recordings, deterministic payloads with the same shape as
+OpenTripPlanner plan and Pelias autocomplete responses are generated instead.
+"""
+
+from datetime import datetime
+from pathlib import Path
+import json
+import math
+import random
+from core.polyline import encode_polyline
+
+RECORDINGS_DIR = Path(__file__).parent / "recordings"
+
+# Kaiserslautern Hauptbahnhof
+ORIGIN = (49.4362, 7.7683)
+DESTINATION = (49.4447, 7.7521)
+
+RELATIVE_DIRECTIONS = ["DEPART", "LEFT", "RIGHT", "CONTINUE", "SLIGHTLY_LEFT", "SLIGHTLY_RIGHT"]
+ABSOLUTE_DIRECTIONS = ["NORTH", "NORTHEAST", "EAST", "SOUTHEAST", "SOUTH", "SOUTHWEST", "WEST", "NORTHWEST"]
+
+
+def _random_path(rng: random.Random, start: tuple[float, float], points: int):
+    """Build a path of roughly 10 m steps along straight streets with occasional turns."""
+
+    lat, lon = start
+    heading = rng.uniform(0, 2 * math.pi)
+    path = [(lat, lon)]
+    for _ in range(points - 1):
+        if rng.random() < 0.05:
+            heading += rng.uniform(-math.pi / 2, math.pi / 2)
+        lat += 0.00009 * math.cos(heading) + rng.uniform(-0.000002, 0.000002)
+        lon += 0.00014 * math.sin(heading) + rng.uniform(-0.000002, 0.000002)
+        path.append((lat, lon))
+    return path
+
+
+def _place(lat: float, lon: float, arrival: int | None, departure: int | None, stop: dict | None):
+    return {
+        "name": stop["name"] if stop else "Street",
+        "vertexType": "TRANSIT" if stop else "NORMAL",
+        "lat": lat,
+        "lon": lon,
+        "arrivalTime": arrival,
+        "departureTime": departure,
+        "stop": stop,
+    }
+
+
+def build_plan_payload(
+    num_itineraries: int = 5,
+    num_legs: int = 10,
+    num_steps: int = 30,
+    geometry_points: int = 200,
+    start_time: int = 1_900_000_000_000,
+    seed: int = 0,
+) -> dict:
+    """Build an OpenTripPlanner plan response alternating walking and bus legs."""
+
+    rng = random.Random(seed)
+    itineraries = []
+    for itinerary_index in range(num_itineraries):
+        itinerary_start = start_time + itinerary_index * 600_000
+        leg_start = itinerary_start
+        position = ORIGIN
+        legs = []
+        for leg_index in range(num_legs):
+            transit_leg = leg_index % 2 == 1
+            duration = rng.randint(120, 900)
+            path = _random_path(rng, position, geometry_points)
+            from_stop = to_stop = None
+            route = trip = None
+            if transit_leg:
+                from_stop = {"id": f"1:{leg_index}", "gtfsId": f"1:{leg_index}", "name": f"Stop {leg_index}", "lat": path[0][0], "lon": path[0][1]}
+                to_stop = {"id": f"1:{leg_index + 1}", "gtfsId": f"1:{leg_index + 1}", "name": f"Stop {leg_index + 1}", "lat": path[-1][0], "lon": path[-1][1]}
+                route = {"id": f"1:{100 + leg_index}", "shortName": str(100 + leg_index), "mode": "BUS"}
+                trip_id = f"1:trip-{itinerary_index}-{leg_index}"
+                trip = {"id": trip_id, "gtfsId": trip_id, "route": route, "tripShortName": None, "tripHeadsign": "Hauptbahnhof"}
+            legs.append(
+                {
+                    "startTime": leg_start,
+                    "endTime": leg_start + duration * 1000,
+                    "departureDelay": 0,
+                    "arrivalDelay": 0,
+                    "mode": "BUS" if transit_leg else "WALK",
+                    "duration": float(duration),
+                    "legGeometry": {"length": len(path), "points": encode_polyline(path)},
+                    "realTime": False,
+                    "realtimeState": "SCHEDULED" if transit_leg else None,
+                    "serviceDate": datetime.fromtimestamp(leg_start / 1000).strftime("%Y%m%d") if transit_leg else None,
+                    "distance": rng.uniform(100, 3000),
+                    "transitLeg": transit_leg,
+                    "from": _place(*path[0], None, leg_start, from_stop),
+                    "to": _place(*path[-1], leg_start + duration * 1000, None, to_stop),
+                    "route": route,
+                    "trip": trip,
+                    "intermediateStops": [
+                        {"id": f"1:i{i}", "name": f"Stop i{i}", "lat": lat, "lon": lon}
+                        for i, (lat, lon) in enumerate(path[:: max(1, geometry_points // 8)])
+                    ]
+                    if transit_leg
+                    else None,
+                    "headsign": "Hauptbahnhof" if transit_leg else None,
+                    "pickupType": "SCHEDULED" if transit_leg else None,
+                    "dropoffType": "SCHEDULED" if transit_leg else None,
+                    "accessibilityScore": None,
+                    "steps": []
+                    if transit_leg
+                    else [
+                        {
+                            "distance": rng.uniform(5, 200),
+                            "lon": lon,
+                            "lat": lat,
+                            "relativeDirection": rng.choice(RELATIVE_DIRECTIONS),
+                            "absoluteDirection": rng.choice(ABSOLUTE_DIRECTIONS),
+                            "streetName": f"Street {step_index}",
+                            "bogusName": False,
+                        }
+                        for step_index, (lat, lon) in enumerate(path[:num_steps])
+                    ],
+                }
+            )
+            leg_start += duration * 1000
+            position = path[-1]
+        itineraries.append(
+            {
+                "startTime": itinerary_start,
+                "endTime": leg_start,
+                "duration": (leg_start - itinerary_start) // 1000,
+                "legs": legs,
+                "accessibilityScore": None,
+            }
+        )
+
+    return {
+        "data": {
+            "plan": {
+                "date": start_time,
+                "from": {"lat": ORIGIN[0], "lon": ORIGIN[1]},
+                "to": {"lat": DESTINATION[0], "lon": DESTINATION[1]},
+                "itineraries": itineraries,
+            }
+        }
+    }
+
+
+def build_summary_payload(plan_payload: dict) -> dict:
+    """Project a plan response onto the fields requested by the summary template."""
+
+    plan = plan_payload["data"]["plan"]
+    return {
+        "data": {
+            "plan": {
+                "from": plan["from"],
+                "to": plan["to"],
+                "itineraries": [
+                    {
+                        "startTime": itinerary["startTime"],
+                        "endTime": itinerary["endTime"],
+                        "duration": itinerary["duration"],
+                        "legs": [
+                            {
+                                "mode": leg["mode"],
+                                "duration": leg["duration"],
+                                "distance": leg["distance"],
+                                "legGeometry": leg["legGeometry"],
+                                "serviceDate": leg["serviceDate"],
+                                "trip": {"gtfsId": leg["trip"]["gtfsId"]} if leg["trip"] else None,
+                            }
+                            for leg in itinerary["legs"]
+                        ],
+                    }
+                    for itinerary in plan["itineraries"]
+                ],
+            }
+        }
+    }
+
+
+def build_trip_payload(plan_payload: dict, trip_id: str, delay: int = 0) -> dict:
+    """Build an OpenTripPlanner trip response with the stop times of a trip ridden in a plan response."""
+
+    for itinerary in plan_payload["data"]["plan"]["itineraries"]:
+        for leg in itinerary["legs"]:
+            if not leg["trip"] or leg["trip"]["gtfsId"] != trip_id:
+                continue
+            service_day = int(datetime.strptime(leg["serviceDate"], "%Y%m%d").timestamp())
+            departure = leg["startTime"] // 1000 - service_day
+            arrival = leg["endTime"] // 1000 - service_day
+            stoptimes = [
+                {
+                    "stop": {"gtfsId": place["stop"]["gtfsId"]},
+                    "serviceDay": service_day,
+                    "scheduledArrival": time,
+                    "realtimeArrival": time + delay,
+                    "arrivalDelay": delay,
+                    "scheduledDeparture": time,
+                    "realtimeDeparture": time + delay,
+                    "departureDelay": delay,
+                    "realtime": delay != 0,
+                }
+                for place, time in ((leg["from"], departure), (leg["to"], arrival))
+            ]
+            return {"data": {"trip": {"gtfsId": trip_id, "stoptimesForDate": stoptimes}}}
+    return {"data": {"trip": None}}
+
+
+def build_autocomplete_payload(text: str, size: int = 10, seed: int = 0) -> dict:
+    """Build a Pelias autocomplete response with places matching the text."""
+
+    rng = random.Random(f"{seed}:{text}")
+    features = []
+    for index in range(size):
+        lat = ORIGIN[0] + rng.uniform(-0.05, 0.05)
+        lon = ORIGIN[1] + rng.uniform(-0.05, 0.05)
+        name = f"{text.title()} {index}"
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {
+                    "id": f"node/{rng.randint(1, 10**9)}",
+                    "layer": "venue",
+                    "name": name,
+                    "street": "Bahnhofstraße",
+                    "postalcode": "67655",
+                    "locality": "Kaiserslautern",
+                    "label": f"{name}, Kaiserslautern, Germany",
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+STREET_NAMES = [
+    "Bahnhofstraße", "Pariser Straße", "Mannheimer Straße", "Fackelstraße", "Marktstraße",
+    "Eisenbahnstraße", "Rudolf-Breitscheid-Straße", "Trippstadter Straße", "Mühlstraße",
+    "Kaiserstraße", "Richard-Wagner-Straße", "Logenstraße", "Schillerstraße", "Goethestraße",
+    "Königstraße", "Barbarossastraße", "Altenwoogstraße", "Lauterstraße", "Stiftsplatz",
+    "Pfaffplatz", "Schneiderstraße", "Glockenstraße", "Kanalstraße", "Gaustraße",
+]
+POI_NAMES = [
+    "Hauptbahnhof", "Rathaus", "Stadtpark", "Apotheke", "Bäckerei", "Rewe", "Edeka", "Schule",
+    "Kindergarten", "Klinikum", "Bibliothek", "Museum", "Kirche", "Sporthalle", "Friedhof",
+]
+LOCALITIES = [("Kaiserslautern", "67655"), ("Kaiserslautern", "67657"), ("Mannheim", "68159"), ("Mannheim", "68161")]
+
+
+def build_place_extract(num_places: int = 100_000, seed: int = 0) -> dict:
+    """Build a GeoJSON extract of addresses and points of interest around the origin."""
+
+    rng = random.Random(seed)
+    features = []
+    for index in range(num_places):
+        street = rng.choice(STREET_NAMES)
+        housenumber = str(rng.randint(1, 150))
+        locality, postcode = rng.choice(LOCALITIES)
+        name = f"{rng.choice(POI_NAMES)} {street}" if index % 10 == 0 else f"{street} {housenumber}"
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [ORIGIN[1] + rng.uniform(-0.1, 0.1), ORIGIN[0] + rng.uniform(-0.06, 0.06)],
+                },
+                "properties": {
+                    "id": f"local/{index}",
+                    "name": name,
+                    "street": street,
+                    "housenumber": housenumber,
+                    "postalcode": postcode,
+                    "locality": locality,
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def load_plan_payload(path: str | None = None) -> bytes:
+    """Load a recorded plan response, or build one if none is available."""
+
+    recording = Path(path) if path else RECORDINGS_DIR / "plan.json"
+    if recording.exists():
+        return recording.read_bytes()
+    return json.dumps(build_plan_payload()).encode()
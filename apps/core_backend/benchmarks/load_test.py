@@ -0,0 +1,285 @@
+"""Load-test benchmark for the core backend against local stand-ins.
+
+Starts the OpenTripPlanner and Pelias stand-ins, optionally an in-memory Redis, and the
+backend in a separate process. Then drives /v1/routing/plan, /v1/routing/itinerary/{id},
+its realtime refresh and /v1/geocoding/autocomplete at a fixed concurrency, reporting throughput, latency
+percentiles, backend CPU time and transferred bytes per request. Results can be saved and compared
+against a saved baseline.
+
+Usage: python -m benchmarks.load_test [--concurrency 16] [--requests 500] [--fake-redis]
+    [--otp-instances 1] [--stall-rate 0.0] [--save results.json] [--baseline baseline.json]
+    [--max-regression 0.1]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import quantiles
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.stand_ins import StandIns, start_fake_redis
+
+APP_DIR = Path(__file__).parent.parent
+
+AUTOCOMPLETE_TERMS = ["Kaiserslautern Hbf", "Pfaffplatz", "Stiftsplatz", "Uni Ost", "Betzenberg", "Rathaus"]
+
+# Metrics where a lower value is better, all others are better when higher
+LOWER_IS_BETTER = {"p50_ms", "p95_ms", "p99_ms", "cpu_ms_per_request", "bytes_per_response", "error_rate"}
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_process_cpu_time(pid: int) -> float | None:
+    """Get the user and system CPU time of a process in seconds, on Linux."""
+
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def build_plan_request(rng: random.Random) -> dict:
+    # Spread origins so that requests do not share plan cache entries
+    return {
+        "origin": {"lat": 49.40 + rng.random() * 0.08, "lon": 7.70 + rng.random() * 0.12},
+        "destination": {"lat": 49.4447, "lon": 7.7521},
+        "date": "2030-03-17",
+        "time": "08:00:00",
+        "transport_modes": ["WALK", "BUS"],
+    }
+
+
+def build_matrix_request(rng: random.Random) -> dict:
+    # Places are picked from a small lattice, so that matrices share cells
+    places = [
+        {"lat": 49.40 + row * 0.01, "lon": 7.70 + column * 0.01}
+        for row in range(6)
+        for column in range(6)
+    ]
+    return {
+        "origins": rng.sample(places, 3),
+        "destinations": rng.sample(places, 3),
+        "date": "2030-03-17",
+        "time": "08:00:00",
+        "transport_modes": [["WALK", "BUS"]],
+    }
+
+
+def build_autocomplete_params(rng: random.Random) -> dict:
+    term = rng.choice(AUTOCOMPLETE_TERMS)
+    return {
+        "timestamp": "2030-03-17T08:00:00",
+        "query": term[: rng.randint(3, len(term))],
+        "focus_point_lat": 49.40 + rng.random() * 0.08,
+        "focus_point_lon": 7.70 + rng.random() * 0.12,
+    }
+
+
+async def run_scenario(
+    name: str,
+    make_request,
+    client: httpx.AsyncClient,
+    concurrency: int,
+    num_requests: int,
+    app_pid: int,
+) -> tuple[dict, list[httpx.Response]]:
+    """Issue requests at a fixed concurrency and summarize their latencies."""
+
+    latencies, responses, errors, num_bytes = [], [], 0, 0
+    remaining = iter(range(num_requests))
+
+    async def worker():
+        nonlocal errors, num_bytes
+        for index in remaining:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client, index)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            num_bytes += response.num_bytes_downloaded
+            if response.status_code != 200:
+                errors += 1
+            else:
+                responses.append(response)
+
+    cpu_start = get_process_cpu_time(app_pid)
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall_time = time.perf_counter() - wall_start
+    cpu_end = get_process_cpu_time(app_pid)
+
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    result = {
+        "requests": num_requests,
+        "error_rate": round(errors / num_requests, 4),
+        "throughput_rps": round(num_requests / wall_time, 2),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+        "cpu_ms_per_request": round((cpu_end - cpu_start) * 1000 / num_requests, 3)
+        if cpu_start is not None and cpu_end is not None
+        else None,
+        "bytes_per_response": round(num_bytes / len(latencies)) if latencies else None,
+    }
+    print(
+        f"{name:>17}: {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+        f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+        f"cpu {result['cpu_ms_per_request']} ms/req  {result['bytes_per_response']} B/resp  "
+        f"errors {result['error_rate']:.2%}"
+    )
+    return result, responses
+
+
+def compare_to_baseline(results: dict, baseline: dict, max_regression: float) -> bool:
+    """Print relative changes against a baseline and report whether any metric regressed."""
+
+    regressed = False
+    print("\nChange against baseline:")
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            baseline_value = baseline.get(scenario, {}).get(metric)
+            if metric == "requests" or value is None or not baseline_value:
+                continue
+            change = (value - baseline_value) / baseline_value
+            worse = change > max_regression if metric in LOWER_IS_BETTER else change < -max_regression
+            regressed = regressed or worse
+            print(f"{scenario:>17} {metric:>19}: {change:+.1%}{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+async def run_benchmark(args) -> dict:
+    otp_ports = [get_free_port() for _ in range(args.otp_instances)]
+    pelias_port, app_port = get_free_port(), get_free_port()
+    env = {
+        **os.environ,
+        "OPEN_TRIP_PLANNER_URL": ",".join(f"http://127.0.0.1:{otp_port}/otp/gtfs/v1" for otp_port in otp_ports),
+        "GEOCODING_PROVIDER": "pelias",
+        "GEOCODING_PROVIDER_API_URL": f"http://127.0.0.1:{pelias_port}/",
+        "GEOCODING_PROVIDER_API_KEY": "benchmark",
+        # All requests come from a single client
+        "ADMISSION_CLIENT_RATE_LIMITING_ENABLED": "false",
+    }
+    if args.fake_redis:
+        redis_port = get_free_port()
+        start_fake_redis(redis_port)
+        env.update({"REDIS_HOST": "127.0.0.1", "REDIS_PORT": str(redis_port)})
+
+    stand_ins = StandIns(
+        otp_ports, pelias_port, args.latency, args.jitter, args.stall_rate, args.stall_duration
+    )
+    await stand_ins.start()
+
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=APP_DIR,
+        env=env,
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=60
+        ) as client:
+            # Wait for the backend to start
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+            rng = random.Random(args.seed)
+            results = {}
+
+            async def plan(client, index):
+                return await client.post("/v1/routing/plan", json=build_plan_request(rng))
+
+            results["plan"], plan_responses = await run_scenario(
+                "plan", plan, client, args.concurrency, args.requests, app.pid
+            )
+
+            itinerary_ids = [
+                itinerary["itinerary_id"]
+                for response in plan_responses
+                for itinerary in response.json()["itineraries"]
+            ]
+            if not itinerary_ids:
+                raise SystemExit("No itineraries were planned, cannot benchmark itinerary requests.")
+
+            async def itinerary(client, index):
+                return await client.get(f"/v1/routing/itinerary/{itinerary_ids[index % len(itinerary_ids)]}")
+
+            results["itinerary"], _ = await run_scenario(
+                "itinerary", itinerary, client, args.concurrency, args.requests, app.pid
+            )
+
+            async def itinerary_refresh(client, index):
+                return await client.get(
+                    f"/v1/routing/itinerary/{itinerary_ids[index % len(itinerary_ids)]}",
+                    params={"refresh": "true"},
+                )
+
+            results["itinerary_refresh"], _ = await run_scenario(
+                "itinerary_refresh", itinerary_refresh, client, args.concurrency, args.requests, app.pid
+            )
+
+            async def matrix(client, index):
+                return await client.post("/v1/routing/matrix", json=build_matrix_request(rng))
+
+            results["matrix"], _ = await run_scenario(
+                "matrix", matrix, client, args.concurrency, args.requests, app.pid
+            )
+
+            async def autocomplete(client, index):
+                return await client.get("/v1/geocoding/autocomplete", params=build_autocomplete_params(rng))
+
+            results["autocomplete"], _ = await run_scenario(
+                "autocomplete", autocomplete, client, args.concurrency, args.requests, app.pid
+            )
+            return results
+    finally:
+        app.terminate()
+        app.wait()
+        await stand_ins.stop()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Stand-in jitter in seconds")
+    parser.add_argument("--otp-instances", type=int, default=1, help="OpenTripPlanner stand-ins")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of stalled OTP requests")
+    parser.add_argument("--stall-duration", type=float, default=1.0, help="OTP stall in seconds")
+    parser.add_argument("--fake-redis", action="store_true", help="Use an in-memory Redis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare results against this JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if compare_to_baseline(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark for the local geocoding provider's place index.
+
+Builds an index from a GeoJSON or CSV extract, or from a generated extract of the
+same shape, saves and memory-maps it, then reports build and load times, the size of
+the index, autocomplete latency percentiles for prefixes of place names and reverse
+lookup latency percentiles around places.
+
+Usage: python -m benchmarks.local_geocoding [--extract places.geojson] [--places 100000]
+    [--queries 2000]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+import json
+import random
+import time
+from benchmarks.fixtures import ORIGIN, build_place_extract
+from core.config import settings
+from schemas.coordinates import Coordinates
+from services.index.places import PlaceIndex, read_places
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--extract", help="Path to a CSV or GeoJSON place extract")
+    parser.add_argument("--places", type=int, default=100_000, help="Places in a generated extract")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        extract_path = Path(args.extract) if args.extract else Path(directory) / "places.geojson"
+        if not args.extract:
+            extract_path.write_text(json.dumps(build_place_extract(args.places, seed=args.seed)))
+
+        start = time.perf_counter()
+        records = list(read_places(extract_path))
+        index = PlaceIndex.build(records)
+        build_time = time.perf_counter() - start
+
+        index_directory = Path(directory) / "place_index"
+        index.save(index_directory)
+        start = time.perf_counter()
+        index = PlaceIndex.load(index_directory)
+        load_time = time.perf_counter() - start
+        index_size = sum(path.stat().st_size for path in index_directory.iterdir())
+
+        print(
+            f"Places: {len(index)}, tokens: {len(index.tokens)}, postings: {len(index.postings)}, "
+            f"index size: {index_size / 2**20:.1f} MiB"
+        )
+        print(f"Build: {build_time:.2f} s, load: {load_time * 1000:.2f} ms")
+
+        rng = random.Random(args.seed)
+        latencies, num_results = [], 0
+        for _ in range(args.queries):
+            name = rng.choice(records).name
+            query = name[: rng.randint(3, len(name))]
+            focus_point = Coordinates(
+                lat=ORIGIN[0] + rng.uniform(-0.05, 0.05), lon=ORIGIN[1] + rng.uniform(-0.05, 0.05)
+            )
+            start = time.perf_counter()
+            num_results += len(index.search(query, focus_point, limit=10))
+            latencies.append(time.perf_counter() - start)
+
+        percentiles = quantiles(latencies, n=100)
+        print(
+            f"Autocomplete: p50 {percentiles[49] * 1000:.3f} ms, p95 {percentiles[94] * 1000:.3f} ms, "
+            f"p99 {percentiles[98] * 1000:.3f} ms, {num_results / args.queries:.1f} results per query"
+        )
+
+        # Reverse lookups around the places of the extract, within the default distance
+        latencies, num_results = [], 0
+        for _ in range(args.queries):
+            record = rng.choice(records)
+            lat, lon = record.lat + rng.uniform(-0.0005, 0.0005), record.lon + rng.uniform(-0.0005, 0.0005)
+            start = time.perf_counter()
+            num_results += index.find_nearest(lat, lon, settings.REVERSE_GEOCODING_MAX_DISTANCE) is not None
+            latencies.append(time.perf_counter() - start)
+
+        percentiles = quantiles(latencies, n=100)
+        print(
+            f"Reverse: p50 {percentiles[49] * 1000:.3f} ms, p95 {percentiles[94] * 1000:.3f} ms, "
+            f"p99 {percentiles[98] * 1000:.3f} ms, {num_results / args.queries:.1%} found"
+        )
+
+
+if __name__ == "__main__":
+    main()
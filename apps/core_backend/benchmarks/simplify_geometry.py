@@ -0,0 +1,41 @@
+"""Micro-benchmark for simplifying plan summary geometries.
+
+Reports the encoded size of all leg geometries of an OpenTripPlanner plan response
+and the time taken to simplify them, at full precision and at several tolerances
+and map zoom levels.
+
+Usage: python -m benchmarks.simplify_geometry [--payload recording.json] [--rounds 20]
+"""
+
+from argparse import ArgumentParser
+from timeit import repeat
+from benchmarks.fixtures import ORIGIN, load_plan_payload
+from core.polyline import simplify_polylines, zoom_to_tolerance
+from services.schemas.open_trip_planner import OTPPlanGraphQLResponse
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payload", help="Path to a recorded OTP plan response")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    plan = OTPPlanGraphQLResponse.model_validate_json(load_plan_payload(args.payload)).data.plan
+    geometries = [leg.leg_geometry.points for itinerary in plan.itineraries for leg in itinerary.legs]
+    full_size = sum(map(len, geometries))
+    print(f"Geometries: {len(geometries)} legs, {full_size / 1024:.1f} KiB")
+
+    tolerances = [("1 m", 1.0), ("5 m", 5.0), ("20 m", 20.0)] + [
+        (f"zoom {zoom}", zoom_to_tolerance(zoom, ORIGIN[0])) for zoom in (17, 15, 13)
+    ]
+    for name, tolerance in tolerances:
+        size = sum(map(len, simplify_polylines(geometries, tolerance)))
+        timings = repeat(lambda: simplify_polylines(geometries, tolerance), number=1, repeat=args.rounds)
+        print(
+            f"{name:>8}: {size / 1024:>6.1f} KiB ({size / full_size:>4.0%}), "
+            f"best {min(timings) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Local stand-ins for OpenTripPlanner, Pelias and Redis.
+
+The OpenTripPlanner and Pelias stand-ins replay recorded responses from
+benchmarks/recordings/ (plan.json, autocomplete.json), or generated responses of the
+same shape, after a configurable latency with jitter. Trip queries are answered with
+the stop times of the trips in the plan response, with random delays. Several
+OpenTripPlanner instances can be started, which occasionally stall to mimic garbage
+collection pauses. Redis can be replaced by an
+in-memory fake, which requires the benchmark dependency group (fakeredis).
+
+Usage: python -m benchmarks.stand_ins [--latency 0.05] [--jitter 0.02] [--otp-instances 1]
+    [--stall-rate 0.0] [--stall-duration 1.0] [--fake-redis]
+"""
+
+from argparse import ArgumentParser
+from fastapi import FastAPI, Request, Response
+from threading import Thread
+import asyncio
+import json
+import random
+import uvicorn
+from benchmarks.fixtures import (
+    RECORDINGS_DIR,
+    build_autocomplete_payload,
+    build_summary_payload,
+    build_trip_payload,
+    load_plan_payload,
+)
+
+
+class Latency:
+    def __init__(
+        self,
+        latency: float,
+        jitter: float,
+        seed: int = 0,
+        stall_rate: float = 0.0,
+        stall_duration: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.stall_rate = stall_rate
+        self.stall_duration = stall_duration
+
+    async def wait(self):
+        latency = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if self.random.random() < self.stall_rate:
+            latency += self.stall_duration
+        await asyncio.sleep(max(0.0, latency))
+
+
+def build_open_trip_planner_stand_in(latency: Latency) -> FastAPI:
+    """Build an app answering GraphQL trip queries with stop times and all others with a plan response.
+
+    Plan summary queries are answered with the summary fields of the same plan response.
+    """
+
+    app = FastAPI()
+    plan_payload = load_plan_payload()
+    parsed_plan_payload = json.loads(plan_payload)
+    summary_payload = json.dumps(build_summary_payload(parsed_plan_payload))
+    delays = random.Random(0)
+
+    @app.post("/otp/gtfs/v1")
+    async def graphql(request: Request):
+        body = await request.json()
+        await latency.wait()
+
+        # Behave like a server supporting automatic persisted queries
+        if "query" not in body and "extensions" in body:
+            return Response(
+                content=json.dumps({"errors": [{"message": "PersistedQueryNotFound"}]}),
+                media_type="application/json",
+            )
+        if "tripId" in body.get("variables", {}):
+            # Most trips run on time, the others are delayed by up to five minutes
+            delay = delays.choice([0, 0, 0, delays.randint(60, 300)])
+            return build_trip_payload(parsed_plan_payload, body["variables"]["tripId"], delay)
+        if "RoutingPlanSummary" in body["query"]:
+            return Response(content=summary_payload, media_type="application/json")
+        return Response(content=plan_payload, media_type="application/json")
+
+    return app
+
+
+def build_pelias_stand_in(latency: Latency) -> FastAPI:
+    """Build an app answering autocomplete requests with a recorded or generated response."""
+
+    app = FastAPI()
+    recording = RECORDINGS_DIR / "autocomplete.json"
+    recorded_payload = recording.read_bytes() if recording.exists() else None
+
+    @app.get("/v1/autocomplete")
+    async def autocomplete(text: str, size: int = 10):
+        await latency.wait()
+        if recorded_payload is not None:
+            return Response(content=recorded_payload, media_type="application/json")
+        return build_autocomplete_payload(text, size=size)
+
+    return app
+
+
+def start_fake_redis(port: int):
+    """Start an in-memory Redis server in a background thread."""
+
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise SystemExit(
+            "An in-memory Redis requires fakeredis, install the benchmark dependency group."
+        ) from None
+
+    server = TcpFakeServer(("127.0.0.1", port))
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StandIns:
+    """The OpenTripPlanner and Pelias stand-ins, served on the running event loop."""
+
+    def __init__(
+        self,
+        otp_ports: list[int],
+        pelias_port: int,
+        latency: float,
+        jitter: float,
+        stall_rate: float = 0.0,
+        stall_duration: float = 0.0,
+    ):
+        apps = [
+            (
+                build_open_trip_planner_stand_in(
+                    Latency(latency, jitter, seed=1 + 2 * index, stall_rate=stall_rate, stall_duration=stall_duration)
+                ),
+                otp_port,
+            )
+            for index, otp_port in enumerate(otp_ports)
+        ]
+        apps.append((build_pelias_stand_in(Latency(latency, jitter, seed=2)), pelias_port))
+        self.servers = [
+            uvicorn.Server(
+                uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+            )
+            for app, port in apps
+        ]
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(server.serve()) for server in self.servers]
+        while not all(server.started for server in self.servers):
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        for server in self.servers:
+            server.should_exit = True
+        await asyncio.gather(*self.tasks)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--otp-port", type=int, default=8081, help="Port of the first instance")
+    parser.add_argument("--otp-instances", type=int, default=1)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of stalled OTP requests")
+    parser.add_argument("--stall-duration", type=float, default=1.0, help="Seconds")
+    parser.add_argument("--pelias-port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Seconds")
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument("--redis-port", type=int, default=6380)
+    args = parser.parse_args()
+
+    async def run():
+        if args.fake_redis:
+            start_fake_redis(args.redis_port)
+            print(f"Redis: 127.0.0.1:{args.redis_port}")
+        otp_ports = [args.otp_port + index for index in range(args.otp_instances)]
+        await StandIns(
+            otp_ports, args.pelias_port, args.latency, args.jitter, args.stall_rate, args.stall_duration
+        ).start()
+        print(
+            "OpenTripPlanner: "
+            + ",".join(f"http://127.0.0.1:{otp_port}/otp/gtfs/v1" for otp_port in otp_ports)
+        )
+        print(f"Pelias: http://127.0.0.1:{args.pelias_port}/")
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+
+# The settings are read on import, tests never reach the upstreams they point to
+os.environ.setdefault("OPEN_TRIP_PLANNER_URL", "http://otp.test/otp/gtfs/v1")
+os.environ.setdefault("GEOCODING_PROVIDER", "pelias")
+os.environ.setdefault("GEOCODING_PROVIDER_API_URL", "http://pelias.test/")
+os.environ.setdefault("GEOCODING_PROVIDER_API_KEY", "test")
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis_client():
+    """An in-memory Redis, empty for every test."""
+
+    return fakeredis.FakeAsyncRedis()
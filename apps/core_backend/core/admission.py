@@ -0,0 +1,237 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from core.config import settings
+from core.metrics import admission_decisions
+import asyncio
+import math
+import time
+
+
+class TokenBuckets:
+    """Rate limits of the clients of a route class, dropping the least recently seen clients once full."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, client: str) -> float:
+        """Take a token of a client, returning 0 if one was available, else the seconds until one is."""
+
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self.buckets[client] = (tokens, now)
+        if len(self.buckets) > settings.ADMISSION_CLIENT_BUCKETS:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class RouteClass:
+    """Limits the requests of a class of routes in flight, queueing a bounded number of others.
+
+    Slots freed by finished requests are handed to queued requests in arrival order, so
+    that newly arriving requests cannot overtake them.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, client_rate: float, client_burst: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.client_buckets = TokenBuckets(client_rate, client_burst)
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.results = {
+            result: 0 for result in ("admitted", "queued", "rate_limited", "queue_full", "queue_timeout")
+        }
+
+    def record(self, result: str):
+        self.results[result] += 1
+        admission_decisions.inc((self.name, result))
+
+    async def acquire(self) -> str:
+        """Wait for a slot, returning whether the request was admitted right away, after queueing or rejected."""
+
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            return "admitted"
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+
+        # Released slots are handed over by resolving the future, without freeing them
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, settings.ADMISSION_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.waiters.remove(waiter)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+        return "queued"
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict[str, any]:
+        return {
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "clients": len(self.client_buckets.buckets),
+            **self.results,
+        }
+
+
+class AdmissionControl:
+    """Decides which requests to expensive routes are let through, per class of routes.
+
+    Other routes, e.g. reading itineraries, are not held back, so that cached answers keep
+    flowing while the expensive ones are saturated. Only the work they pass on to the
+    routing engine is admitted. Limits apply per worker.
+    """
+
+    def __init__(self):
+        plan = RouteClass(
+            "plan",
+            settings.ADMISSION_PLAN_CONCURRENCY,
+            settings.ADMISSION_PLAN_QUEUE_SIZE,
+            settings.ADMISSION_PLAN_CLIENT_RATE,
+            settings.ADMISSION_PLAN_CLIENT_BURST,
+        )
+        batch = RouteClass(
+            "batch",
+            settings.ADMISSION_BATCH_CONCURRENCY,
+            settings.ADMISSION_BATCH_QUEUE_SIZE,
+            settings.ADMISSION_BATCH_CLIENT_RATE,
+            settings.ADMISSION_BATCH_CLIENT_BURST,
+        )
+        geocoding = RouteClass(
+            "geocoding",
+            settings.ADMISSION_GEOCODING_CONCURRENCY,
+            settings.ADMISSION_GEOCODING_QUEUE_SIZE,
+            settings.ADMISSION_GEOCODING_CLIENT_RATE,
+            settings.ADMISSION_GEOCODING_CLIENT_BURST,
+        )
+        self.route_classes = {route_class.name: route_class for route_class in (plan, batch, geocoding)}
+        self.routes = {
+            ("POST", f"{settings.API_VERSION}/routing/plan"): plan,
+            ("POST", f"{settings.API_VERSION}/routing/plan/stream"): plan,
+            ("POST", f"{settings.API_VERSION}/routing/plan/batch"): batch,
+            ("POST", f"{settings.API_VERSION}/routing/matrix"): batch,
+            ("GET", f"{settings.API_VERSION}/geocoding/autocomplete"): geocoding,
+            ("GET", f"{settings.API_VERSION}/geocoding/reverse"): geocoding,
+        }
+
+    def get_route_class(self, method: str, path: str) -> RouteClass | None:
+        return self.routes.get((method, path))
+
+    @asynccontextmanager
+    async def admit(self, name: str) -> AsyncIterator[None]:
+        """Hold a slot of a route class for upstream work of routes that are otherwise cheap.
+
+        Reading an itinerary only reaches the routing engine to fetch its details or to
+        refresh it, which then counts against the same limits as planning.
+        """
+
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            yield
+            return
+        route_class = self.route_classes[name]
+        result = await route_class.acquire()
+        route_class.record(result)
+        if result not in ("admitted", "queued"):
+            raise HTTPException(
+                status_code=503,
+                detail="Service overloaded.",
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+            )
+        try:
+            yield
+        finally:
+            route_class.release()
+
+    def get_client(self, scope) -> str:
+        """Identify the client of a request by its address, or the one a trusted proxy saw if configured."""
+
+        if settings.ADMISSION_CLIENT_HEADER:
+            # Only the last address was added by the proxy, earlier ones could be made up by the client
+            forwarded_for = Headers(scope=scope).get(settings.ADMISSION_CLIENT_HEADER)
+            if forwarded_for:
+                return forwarded_for.rsplit(",", 1)[-1].strip()
+        client = scope.get("client")
+        return client[0] if client else "-"
+
+    def stats(self) -> dict[str, any]:
+        """Produce the slots in use, queue lengths and decisions per route class for this worker."""
+
+        return {name: route_class.stats() for name, route_class in self.route_classes.items()}
+
+
+admission_control = AdmissionControl()
+
+
+class AdmissionControlMiddleware:
+    """Rejects requests to saturated routes before they are parsed, with a hint when to retry."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = (
+            admission_control.get_route_class(scope["method"], scope["path"])
+            if scope["type"] == "http"
+            else None
+        )
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Clients over their rate are told when their next request would be let through
+        if settings.ADMISSION_CLIENT_RATE_LIMITING_ENABLED:
+            wait = route_class.client_buckets.take(admission_control.get_client(scope))
+            if wait > 0:
+                route_class.record("rate_limited")
+                response = JSONResponse(
+                    {"detail": "Too many requests."},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+                await response(scope, receive, send)
+                return
+
+        result = await route_class.acquire()
+        route_class.record(result)
+        if result not in ("admitted", "queued"):
+            response = JSONResponse(
+                {"detail": "Service overloaded."},
+                status_code=503,
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+
+        # Streamed responses hold their slot until they are complete
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release()
@@ -0,0 +1,299 @@
+from collections import deque
+from typing import Awaitable, Callable
+from httpx import HTTPError, Response
+from core.config import settings
+from core.http_clients import http_clients, Upstream
+from core.metrics import upstream_requests, upstream_hedges
+import asyncio
+import time
+
+# Latencies kept per operation to derive the hedging delay, and how many are needed first
+HEDGING_WINDOW = 1000
+HEDGING_MIN_SAMPLES = 20
+
+# Recompute the hedging delay after this many new latencies
+HEDGING_DELAY_UPDATE_INTERVAL = 50
+
+
+class NoBackendAvailable(Exception):
+    """Raised when the circuits of all backends of a pool are open."""
+
+
+class Backend:
+    """A single replica of an upstream, with its health and circuit breaker state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.consecutive_failures = 0
+        self.circuit_opened_at: float | None = None
+        self.trial_in_flight = False
+
+    def get_circuit_state(self) -> str:
+        if self.circuit_opened_at is None:
+            return "closed"
+        if time.monotonic() - self.circuit_opened_at < settings.OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_RESET_TIMEOUT:
+            return "open"
+        return "half_open"
+
+    def is_available(self) -> bool:
+        """Whether the circuit breaker lets a request through, a single trial when half open."""
+
+        state = self.get_circuit_state()
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.circuit_opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if (
+            self.circuit_opened_at is not None
+            or self.consecutive_failures >= settings.OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_THRESHOLD
+        ):
+            self.circuit_opened_at = time.monotonic()
+
+
+class BackendPool:
+    """Spreads requests to an upstream over its replicas.
+
+    Requests go to the healthy replica with the fewest outstanding requests whose circuit
+    breaker is closed, failing over to another replica on errors. Optionally, a request
+    slower than a percentile of recent latencies is hedged with a duplicate to a second
+    replica, taking whichever answers first.
+    """
+
+    def __init__(self, upstream: Upstream, urls: list[str], health_check_payload: dict):
+        self.upstream = upstream
+        self.backends = [Backend(url) for url in urls]
+        self.health_check_payload = health_check_payload
+        self.health_check_task: asyncio.Task | None = None
+        self.latencies: dict[str, deque[float]] = {}
+        self.hedging_delays: dict[str, float] = {}
+        self.requests = 0
+        self.hedged_requests = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+    async def startup(self):
+        """Start checking the health of all backends in the background."""
+
+        if self.health_check_task is None:
+            self.health_check_task = asyncio.create_task(self._check_health_periodically())
+
+    async def shutdown(self):
+        if self.health_check_task is not None:
+            self.health_check_task.cancel()
+            self.health_check_task = None
+
+    async def _check_health(self, backend: Backend):
+        try:
+            response = await http_clients.get(self.upstream).post(
+                backend.url,
+                json=self.health_check_payload,
+                timeout=settings.OPEN_TRIP_PLANNER_HEALTH_CHECK_TIMEOUT,
+            )
+            backend.healthy = response.status_code == 200
+        except HTTPError:
+            backend.healthy = False
+
+    async def check_health(self) -> bool:
+        """Check the health of all backends at once, returning whether any is healthy."""
+
+        await asyncio.gather(*[self._check_health(backend) for backend in self.backends])
+        return any(backend.healthy for backend in self.backends)
+
+    async def _check_health_periodically(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.OPEN_TRIP_PLANNER_HEALTH_CHECK_INTERVAL)
+
+    def _select(self, exclude: set[Backend]) -> Backend | None:
+        """Select the available backend with the fewest outstanding requests, preferring healthy ones."""
+
+        candidates = [
+            backend
+            for backend in self.backends
+            if backend not in exclude and backend.is_available()
+        ]
+        # Rather try backends failing health checks than none at all
+        healthy_candidates = [backend for backend in candidates if backend.healthy]
+        return min(
+            healthy_candidates or candidates,
+            key=lambda backend: backend.outstanding,
+            default=None,
+        )
+
+    def _record_latency(self, operation: str, latency: float):
+        latencies = self.latencies.setdefault(operation, deque(maxlen=HEDGING_WINDOW))
+        latencies.append(latency)
+        if len(latencies) >= HEDGING_MIN_SAMPLES and (
+            operation not in self.hedging_delays
+            or len(latencies) % HEDGING_DELAY_UPDATE_INTERVAL == 0
+        ):
+            sorted_latencies = sorted(latencies)
+            index = int(settings.OPEN_TRIP_PLANNER_HEDGING_PERCENTILE * (len(sorted_latencies) - 1))
+            self.hedging_delays[operation] = sorted_latencies[index]
+
+    def _get_hedging_delay(self, operation: str) -> float | None:
+        """Get how long to wait for a response before hedging, or None if the request may not be hedged."""
+
+        if not settings.OPEN_TRIP_PLANNER_HEDGING_ENABLED or len(self.backends) < 2:
+            return None
+        # Cap the extra load hedging puts on the upstream
+        if self.hedged_requests >= settings.OPEN_TRIP_PLANNER_HEDGING_MAX_RATIO * self.requests:
+            return None
+        return self.hedging_delays.get(operation)
+
+    async def _send(
+        self,
+        backend: Backend,
+        operation: str,
+        send: Callable[[str], Awaitable[Response]],
+    ) -> Response:
+        start = time.perf_counter()
+        try:
+            response = await send(backend.url)
+        except HTTPError:
+            backend.record_failure()
+            upstream_requests.inc((self.upstream.value, backend.url, "error"))
+            raise
+
+        if response.status_code >= 500:
+            backend.record_failure()
+            upstream_requests.inc((self.upstream.value, backend.url, "error"))
+        else:
+            backend.record_success()
+            upstream_requests.inc((self.upstream.value, backend.url, "success"))
+            self._record_latency(operation, time.perf_counter() - start)
+        return response
+
+    async def request(
+        self, operation: str, send: Callable[[str], Awaitable[Response]]
+    ) -> Response:
+        """Send a request to the pool, passing send the URL of the selected backend.
+
+        Raises an HTTP error if every backend tried failed, or NoBackendAvailable if none could be tried.
+        """
+
+        self.requests += 1
+        tried: set[Backend] = set()
+        tasks: list[asyncio.Task] = []
+
+        def launch(hedge: bool = False) -> asyncio.Task | None:
+            backend = self._select(exclude=tried)
+            if backend is None:
+                return None
+            tried.add(backend)
+            backend.requests += 1
+            if hedge:
+                backend.hedges += 1
+
+            # Count the request as outstanding and claim the single trial request of a
+            # half open circuit right away, so that concurrent selections see it
+            trial = backend.get_circuit_state() == "half_open"
+            backend.trial_in_flight = backend.trial_in_flight or trial
+            backend.outstanding += 1
+
+            def release(_):
+                backend.outstanding -= 1
+                if trial:
+                    backend.trial_in_flight = False
+
+            task = asyncio.ensure_future(self._send(backend, operation, send))
+            task.add_done_callback(release)
+            tasks.append(task)
+            return task
+
+        first_task = launch()
+        if first_task is None:
+            raise NoBackendAvailable(f"No {self.upstream.value} backend is available.")
+
+        hedging_delay = self._get_hedging_delay(operation)
+        hedge_task = None
+        pending = {first_task}
+        response: Response | None = None
+        error: HTTPError | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=hedging_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # The first request is slow, race it against a duplicate to another backend
+                    hedging_delay = None
+                    hedge_task = launch(hedge=True)
+                    if hedge_task is not None:
+                        self.hedged_requests += 1
+                        upstream_hedges.inc((self.upstream.value, "sent"))
+                        pending.add(hedge_task)
+                    continue
+
+                for task in done:
+                    try:
+                        response = task.result()
+                    except HTTPError as e:
+                        error = e
+                        continue
+                    if response.status_code < 500:
+                        if task is hedge_task:
+                            self.hedges_won += 1
+                            upstream_hedges.inc((self.upstream.value, "won"))
+                        return response
+
+                # Fail over to another backend once every request in flight has failed
+                if not pending:
+                    hedging_delay = None
+                    failover_task = launch()
+                    if failover_task is not None:
+                        self.failovers += 1
+                        pending.add(failover_task)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Every backend tried failed, server errors are raised like connection errors
+        if response is not None:
+            response.raise_for_status()
+        raise error
+
+    def stats(self) -> dict[str, any]:
+        """Produce backend selection and hedging statistics for this worker."""
+
+        return {
+            "requests": self.requests,
+            "hedged_requests": self.hedged_requests,
+            "hedges_won": self.hedges_won,
+            "hedge_rate": round(self.hedged_requests / self.requests, 4) if self.requests else 0,
+            "failovers": self.failovers,
+            "hedging_delays_ms": {
+                operation: round(delay * 1000, 1) for operation, delay in self.hedging_delays.items()
+            },
+            "backends": [
+                {
+                    "url": backend.url,
+                    "healthy": backend.healthy,
+                    "circuit": backend.get_circuit_state(),
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "hedges": backend.hedges,
+                    "selection_ratio": round(backend.requests / self.requests, 4) if self.requests else 0,
+                }
+                for backend in self.backends
+            ],
+        }
+
+
+open_trip_planner_backends = BackendPool(
+    Upstream.OPEN_TRIP_PLANNER,
+    urls=[url.strip() for url in settings.OPEN_TRIP_PLANNER_URL.split(",") if url.strip()],
+    # The cheapest query any GraphQL server answers
+    health_check_payload={"query": "{ __typename }"},
+)
@@ -0,0 +1,29 @@
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+from core.config import settings
+
+# Connections are opened lazily on first use and shared by all requests of a worker
+redis_pool = ConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+)
+redis_client = Redis(connection_pool=redis_pool)
+
+
+async def ping_redis() -> bool:
+    """Check that Redis answers, opening a pooled connection if none is open yet."""
+
+    try:
+        return await redis_client.ping()
+    except RedisError:
+        return False
+
+
+async def close_redis():
+    """Close all pooled Redis connections."""
+
+    await redis_client.aclose()
+    await redis_pool.disconnect()
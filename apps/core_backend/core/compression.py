@@ -0,0 +1,151 @@
+from starlette.datastructures import Headers, MutableHeaders
+from core.metrics import stage_timer
+import brotli
+import zlib
+
+# Supported content encodings, in order of preference
+CONTENT_ENCODINGS = ("br", "gzip")
+
+# Media types worth compressing
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Parse an Accept-Encoding header into content encodings and their quality values."""
+
+    encodings = {}
+    for item in accept_encoding.split(","):
+        name, *params = (part.strip() for part in item.split(";"))
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name.lower()] = quality
+    return encodings
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Check whether an Accept-Encoding header allows a content encoding."""
+
+    encodings = parse_accept_encoding(accept_encoding)
+    return encodings.get(encoding, encodings.get("*", 0.0)) > 0
+
+
+def select_encoding(accept_encoding: str) -> str | None:
+    """Select the preferred supported content encoding allowed by an Accept-Encoding header."""
+
+    encodings = parse_accept_encoding(accept_encoding)
+    qualities = {
+        encoding: encodings.get(encoding, encodings.get("*", 0.0))
+        for encoding in CONTENT_ENCODINGS
+    }
+    encoding = max(CONTENT_ENCODINGS, key=lambda encoding: qualities[encoding])
+    return encoding if qualities[encoding] > 0 else None
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.process(data) + (
+            self.compressor.finish() if final else self.compressor.flush()
+        )
+
+
+class CompressionMiddleware:
+    """Compresses responses with the content encoding preferred by the client.
+
+    Responses that are already encoded pass through untouched, as do small ones.
+    Streamed responses are flushed per chunk, so that clients receive items as they are produced.
+    """
+
+    def __init__(self, app, minimum_size: int, gzip_level: int, brotli_quality: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _build_compressor(self, encoding: str) -> GzipCompressor | BrotliCompressor:
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            # Decide on the first body chunk, once the size of single-chunk responses is known
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                media_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                compressor = self._build_compressor(encoding)
+                with stage_timer("response", "compression"):
+                    body = compressor.compress(body, final=not more_body)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                start_message["headers"] = headers.raw
+                await send(start_message)
+                start_message = None
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if compressor is not None:
+                with stage_timer("response", "compression"):
+                    body = compressor.compress(body, final=not more_body)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -8,24 +8,163 @@ class Settings(BaseSettings):
     API_VERSION: str = "/v1"
     DEBUG: bool = False
 
+    # Server settings, workers default to the available CPUs and durations are in seconds
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8010
+    SERVER_WORKERS: int | None = None
+    SERVER_LOOP: str = "uvloop"
+    SERVER_HTTP: str = "httptools"
+    SERVER_DRAIN_DELAY: float = 5.0
+    SERVER_GRACEFUL_SHUTDOWN_TIMEOUT: int = 30
+    SERVER_WARM_UP_RETRY_INTERVAL: float = 2.0
+    # Directory through which several workers share their metrics and stats, see server.py
+    SERVER_WORKER_SNAPSHOT_DIR: str | None = None
+    SERVER_WORKER_SNAPSHOT_INTERVAL: float = 5.0
+
     # Directory and path settings
     TEMPLATES_DIR: str = "./templates"
 
     # Redis settings
     REDIS_HOST: str = "navi4all-redis"
     REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 5.0
 
-    # Adaptor settings
+    # Adaptor settings, several OpenTripPlanner replicas are given as comma-separated URLs
     OPEN_TRIP_PLANNER_URL: str
     OPEN_TRIP_PLANNER_PLAN_TEMPLATE: str = "plan.graphql"
+    OPEN_TRIP_PLANNER_SUMMARY_TEMPLATE: str = "plan_summary.graphql"
+    OPEN_TRIP_PLANNER_REFRESH_TEMPLATE: str = "itinerary_refresh.graphql"
+    OPEN_TRIP_PLANNER_TRAVEL_TIME_TEMPLATE: str = "travel_time.graphql"
+    OPEN_TRIP_PLANNER_PERSISTED_QUERIES: bool = False
+    # Plan with the summary template, fetching full itineraries once they are first requested
+    OPEN_TRIP_PLANNER_LAZY_DETAILS: bool = True
+    # Seconds planned itineraries may have moved by realtime updates until their details are fetched
+    OPEN_TRIP_PLANNER_DETAIL_MATCH_TOLERANCE: float = 900.0
+    OPEN_TRIP_PLANNER_TIMEOUT: float = 30.0
+    OPEN_TRIP_PLANNER_MAX_CONNECTIONS: int = 50
+    OPEN_TRIP_PLANNER_MAX_KEEPALIVE_CONNECTIONS: int = 20
+
+    # OpenTripPlanner backend pool settings, durations in seconds
+    OPEN_TRIP_PLANNER_HEALTH_CHECK_INTERVAL: float = 10.0
+    OPEN_TRIP_PLANNER_HEALTH_CHECK_TIMEOUT: float = 2.0
+    OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_THRESHOLD: int = 5
+    OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_RESET_TIMEOUT: float = 30.0
+    OPEN_TRIP_PLANNER_HEDGING_ENABLED: bool = False
+    OPEN_TRIP_PLANNER_HEDGING_PERCENTILE: float = 0.95
+    OPEN_TRIP_PLANNER_HEDGING_MAX_RATIO: float = 0.1
 
-    GEOCODING_PROVIDER: SupportedGeocodingProviders
+    # Autocomplete queries every provider at once, preferring them in the given order,
+    # GEOCODING_PROVIDER alone configures a single provider
+    GEOCODING_PROVIDER: SupportedGeocodingProviders | None = None
+    GEOCODING_PROVIDERS: list[SupportedGeocodingProviders] = []
     GEOCODING_PROVIDER_API_URL: str | None = None
     GEOCODING_PROVIDER_API_KEY: str | None = None
+    GEOCODING_PROVIDER_TIMEOUT: float = 5.0
+    GEOCODING_PROVIDER_MAX_CONNECTIONS: int = 100
+    GEOCODING_PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    GEOCODING_LOCAL_SOURCE_PATH: str | None = None
+    GEOCODING_LOCAL_INDEX_DIR: str = "./data/place_index"
+
+    # Autocomplete racing settings, the deadline in seconds and the merge distance in meters
+    GEOCODING_RACE_DEADLINE: float = 0.3
+    GEOCODING_RACE_SUFFICIENT_RESULTS: int = 5
+    GEOCODING_MERGE_DISTANCE: float = 50.0
+
+    # Reverse geocoding settings, the distance in meters and the cache size in places
+    REVERSE_GEOCODING_MAX_DISTANCE: float = 50.0
+    REVERSE_GEOCODING_CACHE_SIZE: int = 100000
+    REVERSE_GEOCODING_REMOTE_FALLBACK: bool = True
+
+    # Batch routing settings
+    ROUTING_BATCH_MAX_REQUESTS: int = 1000
+    ROUTING_BATCH_MAX_CONCURRENCY: int = 4
+
+    # Travel time matrix settings, the cache size in cells and its TTL in seconds
+    ROUTING_MATRIX_MAX_CELLS: int = 10000
+    ROUTING_MATRIX_NUM_ITINERARIES: int = 3
+    ROUTING_MATRIX_CACHE_SIZE: int = 100000
+    ROUTING_MATRIX_CACHE_TTL: int = 600
+
+    # Summary geometry settings, tolerance in meters
+    PLAN_GEOMETRY_TOLERANCE: float = 5.0
+
+    # Itinerary cache settings, sizes in bytes
+    ITINERARY_CACHE_COMPRESSION: bool = True
+    ITINERARY_CACHE_COMPRESSION_MIN_SIZE: int = 1024
+    ITINERARY_CACHE_COMPRESSION_LEVEL: int = 6
+    ITINERARY_CACHE_MEMORY_BUDGET: int = 256 * 1024 * 1024
+    ITINERARY_CACHE_EVICTION_BATCH_SIZE: int = 100
+
+    # Plan cache settings, grid size in degrees and durations in seconds
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_GRID_SIZE: float = 0.001
+    PLAN_CACHE_TIME_BUCKET: int = 60
+    PLAN_CACHE_TTL: int = 300
+
+    # Autocomplete cache settings, durations in seconds
+    AUTOCOMPLETE_CACHE_ENABLED: bool = True
+    AUTOCOMPLETE_CACHE_REDIS_ENABLED: bool = False
+    AUTOCOMPLETE_CACHE_SIZE: int = 10000
+    AUTOCOMPLETE_CACHE_TTL: int = 3600
+    AUTOCOMPLETE_CACHE_GEOHASH_PRECISION: int = 5
+    AUTOCOMPLETE_CACHE_MIN_PREFIX_LENGTH: int = 3
+
+    # Request coalescing settings, durations in seconds
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_REDIS_ENABLED: bool = False
+    SINGLE_FLIGHT_REDIS_LOCK_TIMEOUT: float = 30.0
+    SINGLE_FLIGHT_REDIS_POLL_INTERVAL: float = 0.05
+
+    # Request supersession settings
+    SUPERSESSION_ENABLED: bool = True
+
+    # Admission control settings, rates per second and durations in seconds. Clients are
+    # identified by the address of the connection. Behind a trusted reverse proxy that
+    # appends the address it saw to a header, e.g. X-Forwarded-For, set the header to
+    # identify clients by its last entry instead. Clients reaching the backend directly
+    # could otherwise make up any address in it. Per-client rate limits are off by default,
+    # as all clients behind one NAT share an address and would share its limits.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_PLAN_CONCURRENCY: int = 32
+    ADMISSION_PLAN_QUEUE_SIZE: int = 64
+    ADMISSION_PLAN_CLIENT_RATE: float = 2.0
+    ADMISSION_PLAN_CLIENT_BURST: int = 10
+    ADMISSION_BATCH_CONCURRENCY: int = 4
+    ADMISSION_BATCH_QUEUE_SIZE: int = 16
+    ADMISSION_BATCH_CLIENT_RATE: float = 0.2
+    ADMISSION_BATCH_CLIENT_BURST: int = 2
+    ADMISSION_GEOCODING_CONCURRENCY: int = 64
+    ADMISSION_GEOCODING_QUEUE_SIZE: int = 128
+    ADMISSION_GEOCODING_CLIENT_RATE: float = 10.0
+    ADMISSION_GEOCODING_CLIENT_BURST: int = 20
+    ADMISSION_QUEUE_TIMEOUT: float = 2.0
+    ADMISSION_RETRY_AFTER: int = 1
+    ADMISSION_CLIENT_RATE_LIMITING_ENABLED: bool = False
+    ADMISSION_CLIENT_HEADER: str | None = None
+    ADMISSION_CLIENT_BUCKETS: int = 100000
+
+    # Response compression settings, minimum size in bytes
+    RESPONSE_COMPRESSION_ENABLED: bool = True
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024
+    RESPONSE_COMPRESSION_GZIP_LEVEL: int = 6
+    RESPONSE_COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # HTTP client settings
+    HTTP2_ENABLED: bool = False
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
 
     @model_validator(mode="after")
     def validate_geocoding_provider(cls, values: "Settings") -> dict[str, any]:
-        if values.GEOCODING_PROVIDER != SupportedGeocodingProviders.NONE:
+        if not values.GEOCODING_PROVIDERS:
+            if values.GEOCODING_PROVIDER is None:
+                raise ValueError("GEOCODING_PROVIDER or GEOCODING_PROVIDERS must be set")
+            values.GEOCODING_PROVIDERS = [values.GEOCODING_PROVIDER]
+        if any(
+            provider
+            not in (SupportedGeocodingProviders.NONE, SupportedGeocodingProviders.LOCAL)
+            for provider in values.GEOCODING_PROVIDERS
+        ):
             if values.GEOCODING_PROVIDER_API_URL is None:
                 raise ValueError("GEOCODING_PROVIDER_API_URL must be set")
             if values.GEOCODING_PROVIDER_API_KEY is None:
@@ -0,0 +1,102 @@
+from enum import Enum
+from httpx import AsyncClient, Limits, Request, Timeout
+from core.config import settings
+
+
+class Upstream(str, Enum):
+    OPEN_TRIP_PLANNER = "open_trip_planner"
+    GEOCODING = "geocoding"
+
+
+class HTTPClientRegistry:
+    """Long-lived, connection-pooled HTTP clients shared by all requests, one per upstream."""
+
+    def __init__(self):
+        self._clients: dict[Upstream, AsyncClient] = {}
+        self._limits: dict[Upstream, Limits] = {}
+        self._request_counts: dict[Upstream, int] = {}
+
+    def _build_client(
+        self,
+        upstream: Upstream,
+        timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+    ) -> AsyncClient:
+        """Build a pooled client with keep-alive for a single upstream."""
+
+        limits = Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        self._limits[upstream] = limits
+        self._request_counts[upstream] = 0
+
+        async def count_request(request: Request):
+            self._request_counts[upstream] += 1
+
+        return AsyncClient(
+            http2=settings.HTTP2_ENABLED,
+            timeout=Timeout(timeout),
+            limits=limits,
+            event_hooks={"request": [count_request]},
+        )
+
+    async def startup(self):
+        """Open a client for every configured upstream."""
+
+        self._clients[Upstream.OPEN_TRIP_PLANNER] = self._build_client(
+            Upstream.OPEN_TRIP_PLANNER,
+            timeout=settings.OPEN_TRIP_PLANNER_TIMEOUT,
+            max_connections=settings.OPEN_TRIP_PLANNER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPEN_TRIP_PLANNER_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self._clients[Upstream.GEOCODING] = self._build_client(
+            Upstream.GEOCODING,
+            timeout=settings.GEOCODING_PROVIDER_TIMEOUT,
+            max_connections=settings.GEOCODING_PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GEOCODING_PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    async def shutdown(self):
+        """Close all clients and release their pooled connections."""
+
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def get(self, upstream: Upstream) -> AsyncClient:
+        """Get the shared client for an upstream."""
+
+        client = self._clients.get(upstream)
+        if client is None:
+            raise RuntimeError(
+                f"No HTTP client available for {upstream.value}, has the application started?"
+            )
+        return client
+
+    def stats(self) -> dict[str, dict[str, any]]:
+        """Produce connection pool statistics for every upstream."""
+
+        stats = {}
+        for upstream, client in self._clients.items():
+            # httpx does not expose its pool publicly, fall back gracefully if internals change
+            pool = getattr(client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            requests = list(getattr(pool, "_requests", []))
+            limits = self._limits[upstream]
+            stats[upstream.value] = {
+                "http2": settings.HTTP2_ENABLED,
+                "max_connections": limits.max_connections,
+                "max_keepalive_connections": limits.max_keepalive_connections,
+                "connections": len(connections),
+                "idle_connections": sum(1 for c in connections if c.is_idle()),
+                "active_requests": len(requests),
+                "queued_requests": sum(1 for r in requests if r.is_queued()),
+                "requests": self._request_counts[upstream],
+            }
+        return stats
+
+
+http_clients = HTTPClientRegistry()
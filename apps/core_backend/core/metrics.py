@@ -0,0 +1,228 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bisect import bisect_left
+from typing import Iterable
+import time
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the request currently being handled, for the Server-Timing header
+request_timings: ContextVar[dict[str, float] | None] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def snapshot(self) -> list:
+        return [[list(labels), counts, self.sums[labels]] for labels, counts in self.counts.items()]
+
+    def merge(self, snapshot: list):
+        """Add up the observations of a snapshot, e.g. of another worker."""
+
+        for labels, counts, total in snapshot:
+            labels = tuple(labels)
+            merged_counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            for index, count in enumerate(counts):
+                merged_counts[index] += count
+            self.sums[labels] = self.sums.get(labels, 0.0) + total
+
+    def empty(self) -> "Histogram":
+        return Histogram(self.name, self.description, self.label_names, self.buckets)
+
+    def expose(self) -> list[str]:
+        """Produce the histogram in the Prometheus text exposition format."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, counts in self.counts.items():
+            label_pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+            cumulative_count = 0
+            for bucket, count in zip((*map(str, self.buckets), "+Inf"), counts):
+                cumulative_count += count
+                bucket_labels = ",".join([*label_pairs, f'le="{bucket}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative_count}")
+            lines.append(f"{self.name}_sum{{{','.join(label_pairs)}}} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{{{','.join(label_pairs)}}} {cumulative_count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: dict[tuple[str, ...], int] = {}
+
+    def inc(self, labels: tuple[str, ...], value: int = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def snapshot(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, snapshot: list):
+        """Add up the values of a snapshot, e.g. of another worker."""
+
+        for labels, value in snapshot:
+            self.inc(tuple(labels), value)
+
+    def empty(self) -> "Counter":
+        return Counter(self.name, self.description, self.label_names)
+
+    def expose(self) -> list[str]:
+        """Produce the counter in the Prometheus text exposition format."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            label_pairs = ",".join(
+                f'{name}="{value}"' for name, value in zip(self.label_names, labels)
+            )
+            lines.append(f"{self.name}{{{label_pairs}}} {value}")
+        return lines
+
+
+stage_duration = Histogram(
+    "navi4all_stage_duration_seconds",
+    "Duration of processing stages per operation.",
+    ("operation", "stage"),
+    LATENCY_BUCKETS,
+)
+stage_errors = Counter(
+    "navi4all_stage_errors_total",
+    "Processing stages that failed per operation.",
+    ("operation", "stage"),
+)
+upstream_requests = Counter(
+    "navi4all_upstream_requests_total",
+    "Requests sent to each upstream backend by outcome.",
+    ("upstream", "backend", "outcome"),
+)
+upstream_hedges = Counter(
+    "navi4all_upstream_hedges_total",
+    "Hedged upstream requests sent and won.",
+    ("upstream", "result"),
+)
+itinerary_cache_writes = Counter(
+    "navi4all_itinerary_cache_writes_total",
+    "Itineraries written to the cache, by whether an identical body was already stored.",
+    ("result",),
+)
+itinerary_cache_reads = Counter(
+    "navi4all_itinerary_cache_reads_total",
+    "Itinerary cache lookups by result.",
+    ("result",),
+)
+geocoding_provider_results = Counter(
+    "navi4all_geocoding_provider_results_total",
+    "Autocomplete requests to each geocoding provider by how their answer was used.",
+    ("provider", "result"),
+)
+admission_decisions = Counter(
+    "navi4all_admission_decisions_total",
+    "Requests to each route class by whether they were admitted, queued or rejected.",
+    ("route_class", "result"),
+)
+itinerary_cache_evictions = Counter(
+    "navi4all_itinerary_cache_evictions_total",
+    "Itinerary bodies removed from the cache, by whether they expired or exceeded the memory budget.",
+    ("reason",),
+)
+
+
+@contextmanager
+def stage_timer(operation: str, stage: str):
+    """Time a processing stage of an operation, recording it in the metrics and the current request's timings."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc((operation, stage))
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stage_duration.observe((operation, stage), duration)
+        timings = request_timings.get()
+        if timings is not None:
+            name = f"{operation}-{stage}"
+            timings[name] = timings.get(name, 0.0) + duration
+
+
+METRICS = (
+    stage_duration,
+    stage_errors,
+    upstream_requests,
+    upstream_hedges,
+    itinerary_cache_writes,
+    itinerary_cache_reads,
+    itinerary_cache_evictions,
+    geocoding_provider_results,
+    admission_decisions,
+)
+
+
+def snapshot_metrics() -> dict[str, list]:
+    """Capture the metrics of this worker, to be added up with those of other workers."""
+
+    return {metric.name: metric.snapshot() for metric in METRICS}
+
+
+def expose_metrics(snapshots: Iterable[dict[str, list]] | None = None) -> str:
+    """Produce all metrics in the Prometheus text exposition format.
+
+    Given the snapshots of all workers, their sums are produced instead of those of this worker.
+    """
+
+    metrics = METRICS
+    if snapshots is not None:
+        metrics = [metric.empty() for metric in METRICS]
+        for snapshot in snapshots:
+            for metric in metrics:
+                metric.merge(snapshot.get(metric.name, []))
+    return "\n".join(line for metric in metrics for line in metric.expose()) + "\n"
+
+
+class ServerTimingMiddleware:
+    """Reports the stage timings of each request in a Server-Timing response header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_server_timing(message):
+            if message["type"] == "http.response.start":
+                entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in timings.items()]
+                entries.append(f"total;dur={(time.perf_counter() - start) * 1000:.1f}")
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", ", ".join(entries).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            request_timings.reset(token)
@@ -0,0 +1,130 @@
+import numpy as np
+
+# Precision of the Google encoded polyline format, as used by OpenTripPlanner
+POLYLINE_PRECISION = 5
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+# Ground resolution of a 256 px web map tile pixel at zoom level 0 on the equator, in meters
+ZOOM_0_METERS_PER_PIXEL = 156543.03
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> np.ndarray:
+    """Decode an encoded polyline into an array of (lat, lon) pairs."""
+
+    if not encoded:
+        return np.empty((0, 2))
+
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+
+    # Each value is spread over 5 bit chunks, the last of which has no continuation bit
+    value_ends = np.flatnonzero(chunks < 0x20)
+    value_starts = np.concatenate(([0], value_ends[:-1] + 1))
+    chunk_positions = np.arange(len(chunks)) - np.repeat(value_starts, value_ends - value_starts + 1)
+    values = np.add.reduceat((chunks & 0x1F) << (5 * chunk_positions), value_starts)
+
+    # Values are zigzag encoded deltas to the previous coordinate
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+
+
+def encode_polyline(coordinates, precision: int = POLYLINE_PRECISION) -> str:
+    """Encode (lat, lon) pairs into an encoded polyline."""
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if not len(coordinates):
+        return ""
+
+    scaled = np.round(coordinates * 10**precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Split values into 5 bit chunks, setting the continuation bit on all but the last
+    chunks = (values[:, None] >> (5 * np.arange(7))) & 0x1F
+    num_chunks = 1 + (values[:, None] >= 32 ** np.arange(1, 7)).sum(axis=1)
+    chunk_positions = np.arange(7)[None, :]
+    chunks = chunks | np.where(chunk_positions < num_chunks[:, None] - 1, 0x20, 0)
+    return (chunks[chunk_positions < num_chunks[:, None]] + 63).astype(np.uint8).tobytes().decode("ascii")
+
+
+def zoom_to_tolerance(zoom: float, lat: float) -> float:
+    """Get the ground distance in meters covered by a single pixel at a web map zoom level."""
+
+    return float(ZOOM_0_METERS_PER_PIXEL * np.cos(np.radians(lat)) / 2**zoom)
+
+
+def _douglas_peucker(x: np.ndarray, y: np.ndarray, keep: np.ndarray, tolerance: float) -> np.ndarray:
+    """Extend a mask of kept points with the Douglas-Peucker algorithm, splitting all segments at once."""
+
+    index = np.arange(len(x))
+    settled = keep.copy()
+    while True:
+        candidates = np.flatnonzero(~settled)
+        if not len(candidates):
+            return keep
+
+        # Every remaining point lies on the segment between its nearest kept neighbours
+        starts = np.maximum.accumulate(np.where(keep, index, 0))[candidates]
+        ends = np.minimum.accumulate(np.where(keep, index, len(x) - 1)[::-1])[::-1][candidates]
+
+        # Squared distances of the points to their segments
+        start_x, start_y = x[starts], y[starts]
+        segment_x, segment_y = x[ends] - start_x, y[ends] - start_y
+        offset_x, offset_y = x[candidates] - start_x, y[candidates] - start_y
+        segment_lengths = segment_x * segment_x + segment_y * segment_y
+        projections = np.clip(
+            (offset_x * segment_x + offset_y * segment_y) / np.where(segment_lengths > 0, segment_lengths, 1.0),
+            0.0,
+            1.0,
+        )
+        offset_x -= projections * segment_x
+        offset_y -= projections * segment_y
+        distances = offset_x * offset_x + offset_y * offset_y
+
+        # Split every segment at its farthest point if that exceeds the tolerance
+        group_starts = np.flatnonzero(np.diff(starts, prepend=-1))
+        group_ids = np.repeat(np.arange(len(group_starts)), np.diff(group_starts, append=len(candidates)))
+        group_distances = np.maximum.reduceat(distances, group_starts)[group_ids]
+        split = group_distances > tolerance**2
+        farthest = np.flatnonzero(split & (distances == group_distances))
+        farthest = farthest[np.diff(group_ids[farthest], prepend=-1) != 0]
+
+        keep[candidates[farthest]] = True
+        settled[candidates[farthest]] = True
+        settled[candidates[~split]] = True
+
+
+def simplify_lines(lines: list[np.ndarray], tolerance: float) -> list[np.ndarray]:
+    """Simplify lines of (lat, lon) pairs with the Douglas-Peucker algorithm, tolerance in meters."""
+
+    if tolerance <= 0 or not lines:
+        return lines
+
+    # Simplify all lines in one pass, keeping the end points of each so that segments stay within lines
+    coordinates = np.concatenate(lines)
+    line_lengths = np.array([len(line) for line in lines])
+    line_ends = np.cumsum(line_lengths)
+    line_starts = line_ends - line_lengths
+    keep = np.zeros(len(coordinates), dtype=bool)
+    keep[line_starts[line_lengths > 0]] = True
+    keep[line_ends[line_lengths > 0] - 1] = True
+
+    # Project onto a local plane in meters, which is accurate enough at the scale of a journey
+    lat, lon = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    x, y = lon * np.cos(lat.mean()) * EARTH_RADIUS, lat * EARTH_RADIUS
+
+    keep = _douglas_peucker(x, y, keep, tolerance)
+    return [coordinates[start:end][keep[start:end]] for start, end in zip(line_starts, line_ends)]
+
+
+def simplify_polylines(polylines: list[str], tolerance: float) -> list[str]:
+    """Simplify encoded polylines, tolerance in meters."""
+
+    if tolerance <= 0:
+        return polylines
+    lines = [decode_polyline(polyline) for polyline in polylines]
+    return [
+        polyline if len(simplified) == len(line) else encode_polyline(simplified)
+        for polyline, line, simplified in zip(polylines, lines, simplify_lines(lines, tolerance))
+    ]
@@ -0,0 +1,94 @@
+from typing import Awaitable, Callable
+from core.config import settings
+import asyncio
+import signal
+import threading
+
+WarmUpCheck = Callable[[], Awaitable[bool]]
+
+
+class Readiness:
+    """Tracks whether this worker should receive traffic.
+
+    A worker becomes ready once every warm-up check has passed, retrying failed checks in
+    the background. It stops being ready as soon as it is asked to shut down, and keeps
+    serving for a drain delay so that load balancers stop routing to it first.
+    """
+
+    def __init__(self):
+        self.checks: dict[str, bool] = {}
+        self.warmed_up = False
+        self.draining = False
+        self.warm_up_task: asyncio.Task | None = None
+
+    async def startup(self, checks: dict[str, WarmUpCheck]):
+        """Start warming up in the background and delay shutdown signals by the drain delay."""
+
+        self.checks = {name: False for name in checks}
+        self.warm_up_task = asyncio.create_task(self._warm_up(checks))
+        self._install_drain_handler()
+
+    async def shutdown(self):
+        if self.warm_up_task is not None:
+            self.warm_up_task.cancel()
+            self.warm_up_task = None
+
+    async def _run_check(self, name: str, check: WarmUpCheck):
+        try:
+            self.checks[name] = await check()
+        except Exception:
+            self.checks[name] = False
+
+    async def _warm_up(self, checks: dict[str, WarmUpCheck]):
+        while True:
+            await asyncio.gather(
+                *[self._run_check(name, check) for name, check in checks.items() if not self.checks[name]]
+            )
+            # Once ready, upstream failures are left to the backend pool rather than
+            # taking every worker out of rotation at once
+            if all(self.checks.values()):
+                self.warmed_up = True
+                return
+            await asyncio.sleep(settings.SERVER_WARM_UP_RETRY_INTERVAL)
+
+    def _install_drain_handler(self):
+        """Wrap the server's SIGTERM handler, so that it only runs after the drain delay."""
+
+        # Signal handlers can only be set from the main thread, e.g. not under a test client
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        if (
+            settings.SERVER_DRAIN_DELAY <= 0
+            or not callable(previous_handler)
+            or threading.current_thread() is not threading.main_thread()
+        ):
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(sig, frame):
+            # A second signal shuts down right away
+            if self.draining:
+                previous_handler(sig, frame)
+                return
+            self.draining = True
+            loop.call_soon_threadsafe(
+                loop.call_later, settings.SERVER_DRAIN_DELAY, previous_handler, sig, frame
+            )
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def is_ready(self) -> bool:
+        return self.warmed_up and not self.draining
+
+    def stats(self) -> dict[str, any]:
+        """Produce the readiness of this worker with the outcome of each warm-up check."""
+
+        return {
+            "ready": self.is_ready(),
+            "warmed_up": self.warmed_up,
+            "draining": self.draining,
+            "checks": dict(self.checks),
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,23 @@
+from fastapi import Response
+from pydantic import BaseModel
+from core.metrics import stage_timer
+
+
+def model_response(model: BaseModel, operation: str) -> Response:
+    """Serialize a response model to JSON, timing serialization as a stage of the operation."""
+
+    with stage_timer(operation, "serialize"):
+        content = model.model_dump_json()
+    return Response(content=content, media_type="application/json")
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check whether an If-None-Match header matches an entity tag, using weak comparison."""
+
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
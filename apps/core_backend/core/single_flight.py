@@ -0,0 +1,119 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+from uuid import uuid4
+from redis.asyncio import Redis
+from core.config import settings
+
+T = TypeVar("T")
+
+# Deletes a lock only while it is still held with the given token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into a single in-flight call.
+
+    Optionally extends across workers, where a Redis lock elects one worker to make the
+    call while the others wait for its result to appear in a shared cache. Calls nobody
+    waits for any more can be cancelled, to free upstream connections.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis_client: Redis | None = None,
+        cancel_abandoned: bool = False,
+    ):
+        self.name = name
+        self.redis_client = redis_client
+        self.cancel_abandoned = cancel_abandoned
+        self.calls: dict[str, asyncio.Task] = {}
+        self.waiters: dict[str, int] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.remote_followers = 0
+        self.abandoned = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        fetch_shared: Callable[[], Awaitable[T | None]] | None = None,
+    ) -> T:
+        """Run fn, or join the call already in flight for the same key."""
+
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await fn()
+
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            # Run independently of the caller, so its cancellation does not fail the others
+            task = asyncio.ensure_future(self._run(key, fn, fetch_shared))
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.followers += 1
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.waiters[key] -= 1
+            if not self.waiters[key]:
+                del self.waiters[key]
+                if self.cancel_abandoned and not task.done():
+                    self.abandoned += 1
+                    task.cancel()
+
+    async def _run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        fetch_shared: Callable[[], Awaitable[T | None]] | None,
+    ) -> T:
+        if self.redis_client is None or fetch_shared is None:
+            return await fn()
+
+        lock_key = f"single_flight:{self.name}:{key}"
+        lock_timeout = settings.SINGLE_FLIGHT_REDIS_LOCK_TIMEOUT
+        lock_token = uuid4().hex
+        if await self.redis_client.set(lock_key, lock_token, nx=True, px=int(lock_timeout * 1000)):
+            try:
+                return await fn()
+            finally:
+                # The lock may have expired and been taken by another worker meanwhile
+                await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+
+        # Another worker is already making this call, wait for it to share the result
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lock_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(settings.SINGLE_FLIGHT_REDIS_POLL_INTERVAL)
+            result = await fetch_shared()
+            if result is not None:
+                self.remote_followers += 1
+                return result
+            if not await self.redis_client.exists(lock_key):
+                break
+
+        # The other worker failed or did not share its result, make the call ourselves
+        return await fn()
+
+    def stats(self) -> dict[str, any]:
+        """Produce coalescing counters for this worker."""
+
+        coalesced = self.followers + self.remote_followers
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self.calls),
+            "upstream_calls": self.leaders - self.remote_followers,
+            "coalesced_calls": coalesced,
+            "coalescing_ratio": round(coalesced / total, 4) if total else 0,
+            "abandoned_calls": self.abandoned,
+        }
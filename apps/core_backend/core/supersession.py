@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, TypeVar
+from core.config import settings
+
+T = TypeVar("T")
+
+
+class Superseded(Exception):
+    """Raised for a request replaced by a newer request of the same client session."""
+
+
+class Supersession:
+    """Keeps only the latest request of each client session in flight.
+
+    A request with a newer timestamp cancels the request still in flight for the same
+    session, and a request older than the one in flight is superseded before it starts.
+    Timestamps without a time zone are taken to be in UTC.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latest: dict[str, tuple[datetime, asyncio.Task]] = {}
+        self.started = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    async def run(
+        self,
+        session_id: str | None,
+        timestamp: datetime,
+        fn: Callable[[], Awaitable[T]],
+    ) -> T:
+        """Run fn as the latest request of a session, raising Superseded if a newer request replaces it."""
+
+        if session_id is None or not settings.SUPERSESSION_ENABLED:
+            return await fn()
+
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        latest = self.latest.get(session_id)
+        if latest is not None:
+            latest_timestamp, latest_task = latest
+            if timestamp < latest_timestamp:
+                self.rejected += 1
+                raise Superseded()
+            latest_task.cancel()
+
+        self.started += 1
+        task = asyncio.ensure_future(fn())
+        self.latest[session_id] = (timestamp, task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Tell cancellation by a newer request apart from cancellation of the caller
+            if self.latest.get(session_id, (None, None))[1] is task or asyncio.current_task().cancelling():
+                raise
+            self.cancelled += 1
+            raise Superseded()
+        finally:
+            if self.latest.get(session_id, (None, None))[1] is task:
+                del self.latest[session_id]
+
+    def stats(self) -> dict[str, any]:
+        """Produce supersession counters for this worker."""
+
+        superseded = self.cancelled + self.rejected
+        total = self.started + self.rejected
+        return {
+            "in_flight": len(self.latest),
+            "cancelled_calls": self.cancelled,
+            "rejected_calls": self.rejected,
+            "superseded_ratio": round(superseded / total, 4) if total else 0,
+        }
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from types import MappingProxyType
+from graphql import GraphQLError, parse
+from core.config import settings
+
+
+@dataclass(frozen=True)
+class GraphQLTemplate:
+    name: str
+    query: str
+    sha256_hash: str
+
+
+class GraphQLTemplateRegistry:
+    """Immutable registry of GraphQL query templates, loaded and validated once at startup."""
+
+    def __init__(self):
+        self._templates: MappingProxyType[str, GraphQLTemplate] | None = None
+
+    def load(self):
+        """Load and validate all templates from the templates directory."""
+
+        templates_dir = Path(settings.TEMPLATES_DIR)
+        if not templates_dir.is_dir():
+            raise FileNotFoundError(f"GraphQL templates directory not found at {templates_dir}")
+
+        templates = {}
+        for path in sorted(templates_dir.glob("*.graphql")):
+            query = path.read_text()
+            try:
+                parse(query)
+            except GraphQLError as e:
+                raise ValueError(f"Invalid GraphQL query template at {path}: {e.message}")
+            templates[path.name] = GraphQLTemplate(
+                name=path.name,
+                query=query,
+                sha256_hash=sha256(query.encode()).hexdigest(),
+            )
+
+        for template_name in (
+            settings.OPEN_TRIP_PLANNER_PLAN_TEMPLATE,
+            settings.OPEN_TRIP_PLANNER_SUMMARY_TEMPLATE,
+            settings.OPEN_TRIP_PLANNER_REFRESH_TEMPLATE,
+            settings.OPEN_TRIP_PLANNER_TRAVEL_TIME_TEMPLATE,
+        ):
+            if template_name not in templates:
+                raise FileNotFoundError(
+                    f"GraphQL query template {template_name} not found in {templates_dir}"
+                )
+
+        self._templates = MappingProxyType(templates)
+
+    def get(self, template_name: str) -> GraphQLTemplate:
+        """Get a loaded template by its file name."""
+
+        if self._templates is None:
+            raise RuntimeError("GraphQL templates have not been loaded, has the application started?")
+        template = self._templates.get(template_name)
+        if template is None:
+            raise FileNotFoundError(f"GraphQL query template {template_name} not found")
+        return template
+
+
+graphql_templates = GraphQLTemplateRegistry()
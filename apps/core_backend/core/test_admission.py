@@ -0,0 +1,152 @@
+import asyncio
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from core.admission import AdmissionControl, AdmissionControlMiddleware, RouteClass, TokenBuckets
+from core.config import settings
+
+PLAN_PATH = f"{settings.API_VERSION}/routing/plan"
+
+
+def test_token_buckets_allow_bursts_then_refill_at_their_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("core.admission.time.monotonic", lambda: now[0])
+    buckets = TokenBuckets(rate=2.0, burst=3)
+
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == pytest.approx(0.5)
+    assert buckets.take("b") == 0
+
+    # Waiting clients took no token, so the next one is due after the same time
+    now[0] += 0.5
+    assert buckets.take("a") == 0
+    assert buckets.take("a") == pytest.approx(0.5)
+
+    # Tokens do not pile up beyond the burst
+    now[0] += 60
+    assert [buckets.take("a") for _ in range(4)][-1] > 0
+
+
+def test_token_buckets_drop_the_least_recently_seen_clients(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CLIENT_BUCKETS", 2)
+    buckets = TokenBuckets(rate=1.0, burst=1)
+    for client in ("a", "b", "a", "c"):
+        buckets.take(client)
+    assert list(buckets.buckets) == ["a", "c"]
+
+
+async def test_released_slots_are_handed_to_queued_requests_in_order():
+    route_class = RouteClass("plan", concurrency=1, queue_size=2, client_rate=1.0, client_burst=1)
+    assert await route_class.acquire() == "admitted"
+
+    admitted = []
+
+    async def wait(name: str):
+        admitted.append((name, await route_class.acquire()))
+
+    waiters = [asyncio.ensure_future(wait(name)) for name in ("first", "second")]
+    await asyncio.sleep(0.01)
+    assert await route_class.acquire() == "queue_full"
+
+    # The slot is handed over, newly arriving requests queue behind the waiting ones
+    route_class.release()
+    await asyncio.sleep(0.01)
+    assert admitted == [("first", "queued")]
+    assert route_class.active == 1
+    route_class.release()
+    await asyncio.gather(*waiters)
+    assert admitted == [("first", "queued"), ("second", "queued")]
+
+    route_class.release()
+    assert (route_class.active, len(route_class.waiters)) == (0, 0)
+
+
+async def test_queued_requests_time_out(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+    route_class = RouteClass("plan", concurrency=1, queue_size=1, client_rate=1.0, client_burst=1)
+    await route_class.acquire()
+
+    assert await route_class.acquire() == "queue_timeout"
+    assert not route_class.waiters
+
+
+async def test_cancelled_requests_leave_the_queue_and_free_handed_over_slots():
+    route_class = RouteClass("plan", concurrency=1, queue_size=2, client_rate=1.0, client_burst=1)
+    await route_class.acquire()
+
+    waiter = asyncio.ensure_future(route_class.acquire())
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert not route_class.waiters
+
+    # A request cancelled right after its slot was handed over either gives it back or
+    # is admitted, depending on whether the cancellation reached it first
+    waiter = asyncio.ensure_future(route_class.acquire())
+    await asyncio.sleep(0.01)
+    route_class.release()
+    waiter.cancel()
+    try:
+        assert await waiter == "queued"
+        route_class.release()
+    except asyncio.CancelledError:
+        pass
+    assert (route_class.active, len(route_class.waiters)) == (0, 0)
+
+
+def test_clients_are_identified_by_their_address_unless_a_proxy_header_is_trusted(monkeypatch):
+    admission_control = AdmissionControl()
+    scope = {
+        "type": "http",
+        "client": ("10.0.0.2", 4711),
+        "headers": [(b"x-forwarded-for", b"1.2.3.4, 203.0.113.7")],
+    }
+    assert admission_control.get_client(scope) == "10.0.0.2"
+
+    monkeypatch.setattr(settings, "ADMISSION_CLIENT_HEADER", "X-Forwarded-For")
+    assert admission_control.get_client(scope) == "203.0.113.7"
+    assert admission_control.get_client({**scope, "headers": []}) == "10.0.0.2"
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_QUEUE_SIZE", 0)
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_CLIENT_BURST", 2)
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_CLIENT_RATE", 0.1)
+    monkeypatch.setattr("core.admission.admission_control", AdmissionControl())
+
+    async def plan(request):
+        await asyncio.sleep(0.05)
+        return JSONResponse({})
+
+    async def itinerary(request):
+        return JSONResponse({})
+
+    app = Starlette(
+        routes=[Route(PLAN_PATH, plan, methods=["POST"]), Route("/itinerary", itinerary)]
+    )
+    transport = httpx.ASGITransport(app=AdmissionControlMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def test_requests_beyond_the_capacity_are_rejected(client):
+    responses = await asyncio.gather(*[client.post(PLAN_PATH) for _ in range(2)], client.get("/itinerary"))
+
+    assert sorted(response.status_code for response in responses[:2]) == [200, 503]
+    assert next(response for response in responses if response.status_code == 503).headers["Retry-After"] == "1"
+
+    # Routes outside the route classes are never held back
+    assert responses[2].status_code == 200
+
+
+async def test_clients_over_their_rate_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CLIENT_RATE_LIMITING_ENABLED", True)
+    responses = [await client.post(PLAN_PATH) for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers["Retry-After"] == "10"
@@ -0,0 +1,170 @@
+import asyncio
+import httpx
+import pytest
+from core.backend_pool import HEDGING_MIN_SAMPLES, BackendPool, NoBackendAvailable
+from core.config import settings
+from core.http_clients import Upstream
+
+URLS = ["http://a.test/otp", "http://b.test/otp", "http://c.test/otp"]
+
+
+class Replicas:
+    """Answers requests per replica URL, failing or slowing down the configured ones."""
+
+    def __init__(self):
+        self.down: set[str] = set()
+        self.status_codes: dict[str, int] = {}
+        self.delays: dict[str, float] = {}
+        self.requests: list[str] = []
+
+    async def send(self, url: str) -> httpx.Response:
+        self.requests.append(url)
+        await asyncio.sleep(self.delays.get(url, 0))
+        if url in self.down:
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(
+            self.status_codes.get(url, 200), json={"url": url}, request=httpx.Request("POST", url)
+        )
+
+
+@pytest.fixture
+def pool() -> BackendPool:
+    return BackendPool(Upstream.OPEN_TRIP_PLANNER, URLS, health_check_payload={})
+
+
+async def test_fails_over_to_another_backend(pool):
+    replicas = Replicas()
+    replicas.down = {URLS[0]}
+    response = await pool.request("plan", replicas.send)
+
+    assert response.json()["url"] != URLS[0]
+    assert replicas.requests[0] == URLS[0]
+    assert pool.failovers == 1
+
+
+async def test_server_errors_fail_over_and_raise_once_every_backend_failed(pool):
+    replicas = Replicas()
+    replicas.status_codes = {URLS[0]: 503, URLS[1]: 500}
+    replicas.down = {URLS[2]}
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await pool.request("plan", replicas.send)
+    assert sorted(replicas.requests) == URLS
+
+
+async def test_client_errors_are_returned_without_failing_over(pool):
+    replicas = Replicas()
+    replicas.status_codes = {url: 400 for url in URLS}
+    response = await pool.request("plan", replicas.send)
+
+    assert response.status_code == 400
+    assert len(replicas.requests) == 1
+
+
+async def test_prefers_backends_with_fewer_outstanding_requests(pool):
+    replicas = Replicas()
+    replicas.delays = {url: 0.05 for url in URLS}
+    responses = await asyncio.gather(*[pool.request("plan", replicas.send) for _ in range(6)])
+    assert sorted(response.json()["url"] for response in responses) == sorted(URLS * 2)
+
+
+async def test_prefers_healthy_backends(pool):
+    replicas = Replicas()
+    pool.backends[0].healthy = False
+    pool.backends[1].healthy = False
+    responses = [await pool.request("plan", replicas.send) for _ in range(3)]
+    assert {response.json()["url"] for response in responses} == {URLS[2]}
+
+
+async def test_circuit_opens_after_consecutive_failures(pool, monkeypatch):
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_RESET_TIMEOUT", 0.05)
+    replicas = Replicas()
+    replicas.down = set(URLS)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await pool.request("plan", replicas.send)
+    assert [backend.get_circuit_state() for backend in pool.backends] == ["open"] * 3
+
+    # Open circuits let no requests through until they reset
+    with pytest.raises(NoBackendAvailable):
+        await pool.request("plan", replicas.send)
+    assert len(replicas.requests) == 6
+
+
+async def test_half_open_circuit_lets_a_single_trial_through(pool, monkeypatch):
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_CIRCUIT_BREAKER_RESET_TIMEOUT", 0.05)
+    pool = BackendPool(Upstream.OPEN_TRIP_PLANNER, URLS[:1], health_check_payload={})
+    replicas = Replicas()
+    replicas.down = {URLS[0]}
+    with pytest.raises(httpx.ConnectError):
+        await pool.request("plan", replicas.send)
+    await asyncio.sleep(0.06)
+    backend = pool.backends[0]
+    assert backend.get_circuit_state() == "half_open"
+
+    # While the trial is in flight, other requests find no backend
+    replicas.down = set()
+    replicas.delays = {URLS[0]: 0.05}
+    trial = asyncio.ensure_future(pool.request("plan", replicas.send))
+    await asyncio.sleep(0.01)
+    with pytest.raises(NoBackendAvailable):
+        await pool.request("plan", replicas.send)
+
+    # A successful trial closes the circuit again
+    assert (await trial).status_code == 200
+    assert backend.get_circuit_state() == "closed"
+
+    # A failed trial opens it right away
+    replicas.down = {URLS[0]}
+    replicas.delays = {}
+    backend.circuit_opened_at = 0.0
+    with pytest.raises(httpx.ConnectError):
+        await pool.request("plan", replicas.send)
+    assert backend.get_circuit_state() == "open"
+
+
+async def test_slow_requests_are_hedged_to_another_backend(pool, monkeypatch):
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_HEDGING_ENABLED", True)
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_HEDGING_MAX_RATIO", 1.0)
+    replicas = Replicas()
+
+    # Learn the usual latency first, no request is hedged before
+    for _ in range(HEDGING_MIN_SAMPLES):
+        await pool.request("plan", replicas.send)
+    assert pool.hedged_requests == 0
+    assert "plan" in pool.hedging_delays
+
+    slow_url = min(pool.backends, key=lambda backend: backend.outstanding).url
+    replicas.delays = {url: 1.0 if url == slow_url else 0 for url in URLS}
+    response = await asyncio.wait_for(pool.request("plan", replicas.send), timeout=0.5)
+
+    assert response.json()["url"] != slow_url
+    assert (pool.hedged_requests, pool.hedges_won) == (1, 1)
+
+    # The losing request is cancelled, releasing its backend
+    await asyncio.sleep(0)
+    assert all(backend.outstanding == 0 for backend in pool.backends)
+
+
+async def test_hedging_is_capped(pool, monkeypatch):
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_HEDGING_ENABLED", True)
+    monkeypatch.setattr(settings, "OPEN_TRIP_PLANNER_HEDGING_MAX_RATIO", 0.1)
+    pool.hedging_delays["plan"] = 0.001
+    pool.requests = 10
+    assert pool._get_hedging_delay("plan") == 0.001
+    pool.hedged_requests = 1
+    assert pool._get_hedging_delay("plan") is None
+
+
+async def test_health_checks_mark_backends(pool, monkeypatch):
+    class Client:
+        async def post(self, url, json, timeout):
+            if url == URLS[1]:
+                raise httpx.ConnectError("Connection refused")
+            return httpx.Response(503 if url == URLS[2] else 200)
+
+    monkeypatch.setattr("core.backend_pool.http_clients.get", lambda upstream: Client())
+    assert await pool.check_health()
+    assert [backend.healthy for backend in pool.backends] == [True, False, False]
@@ -0,0 +1,120 @@
+import brotli
+import gzip
+import zlib
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from core.compression import CompressionMiddleware, accepts_encoding, select_encoding
+
+BODY = b'{"itineraries":[' + b'{"duration":1234},' * 200 + b"{}]}"
+
+
+def test_parses_quality_values():
+    assert select_encoding("gzip, deflate, br") == "br"
+    assert select_encoding("br;q=0.5, gzip") == "gzip"
+    assert select_encoding("br;q=0, gzip;q=0") is None
+    assert select_encoding("*") == "br"
+    assert select_encoding("identity") is None
+    assert select_encoding("gzip;q=invalid, br") == "br"
+
+
+def test_accepts_encoding():
+    assert accepts_encoding("GZIP", "gzip")
+    assert accepts_encoding("*;q=0.1", "gzip")
+    assert not accepts_encoding("br", "gzip")
+    assert not accepts_encoding("gzip;q=0", "gzip")
+
+
+def build_client() -> TestClient:
+    async def json_endpoint(request):
+        return Response(BODY, media_type="application/json")
+
+    async def small_endpoint(request):
+        return Response(b"{}", media_type="application/json")
+
+    async def encoded_endpoint(request):
+        return Response(
+            gzip.compress(BODY), media_type="application/json", headers={"Content-Encoding": "gzip"}
+        )
+
+    async def image_endpoint(request):
+        return Response(BODY, media_type="image/png")
+
+    async def text_endpoint(request):
+        return PlainTextResponse(BODY.decode())
+
+    app = Starlette(
+        routes=[
+            Route("/json", json_endpoint),
+            Route("/small", small_endpoint),
+            Route("/encoded", encoded_endpoint),
+            Route("/image", image_endpoint),
+            Route("/text", text_endpoint),
+        ]
+    )
+    return TestClient(
+        CompressionMiddleware(app, minimum_size=1024, gzip_level=6, brotli_quality=4)
+    )
+
+
+def test_compresses_with_the_preferred_encoding():
+    client = build_client()
+    for accept_encoding, decompress in (("br", brotli.decompress), ("gzip", gzip.decompress)):
+        with client.stream("GET", "/json", headers={"Accept-Encoding": accept_encoding}) as response:
+            data = b"".join(response.iter_raw())
+        assert response.headers["content-encoding"] == accept_encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) == len(data) < len(BODY)
+        assert decompress(data) == BODY
+
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_leaves_small_encoded_and_binary_responses_as_they_are():
+    client = build_client()
+    for path in ("/small", "/image"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    with client.stream("GET", "/encoded", headers={"Accept-Encoding": "br"}) as response:
+        data = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(data) == BODY
+
+    response = build_client().get("/json", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == BODY
+
+
+async def test_compresses_streams_chunk_by_chunk():
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        for more_body in (True, True, False):
+            await send({"type": "http.response.body", "body": BODY + b"\n", "more_body": more_body})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    middleware = CompressionMiddleware(app, minimum_size=1024, gzip_level=6, brotli_quality=4)
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    await middleware(scope, None, send)
+
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    # Every chunk is flushed, so that clients can read an item before the next is produced
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for message in messages[1:]:
+        assert decompressor.decompress(message["body"]) == BODY + b"\n"
+    assert decompressor.eof
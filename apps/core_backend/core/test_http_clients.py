@@ -0,0 +1,56 @@
+import httpx
+import pytest
+from core.config import settings
+from core.http_clients import HTTPClientRegistry, Upstream
+
+
+async def test_clients_are_shared_per_upstream():
+    registry = HTTPClientRegistry()
+    await registry.startup()
+    try:
+        client = registry.get(Upstream.OPEN_TRIP_PLANNER)
+        assert registry.get(Upstream.OPEN_TRIP_PLANNER) is client
+        assert registry.get(Upstream.GEOCODING) is not client
+    finally:
+        await registry.shutdown()
+
+
+async def test_clients_are_pooled_with_configured_limits():
+    registry = HTTPClientRegistry()
+    await registry.startup()
+    try:
+        stats = registry.stats()
+    finally:
+        await registry.shutdown()
+
+    assert stats["open_trip_planner"]["max_connections"] == settings.OPEN_TRIP_PLANNER_MAX_CONNECTIONS
+    assert (
+        stats["geocoding"]["max_keepalive_connections"]
+        == settings.GEOCODING_PROVIDER_MAX_KEEPALIVE_CONNECTIONS
+    )
+    assert stats["open_trip_planner"]["http2"] == settings.HTTP2_ENABLED
+
+
+async def test_requests_are_counted_per_upstream():
+    registry = HTTPClientRegistry()
+    client = registry._build_client(
+        Upstream.GEOCODING, timeout=1.0, max_connections=1, max_keepalive_connections=1
+    )
+    client._transport = httpx.MockTransport(lambda request: httpx.Response(200))
+    registry._clients[Upstream.GEOCODING] = client
+
+    await client.get("http://pelias.test/v1/autocomplete")
+    await client.get("http://pelias.test/v1/autocomplete")
+    assert registry.stats()["geocoding"]["requests"] == 2
+    await registry.shutdown()
+
+
+async def test_clients_are_unavailable_before_startup_and_after_shutdown():
+    registry = HTTPClientRegistry()
+    with pytest.raises(RuntimeError):
+        registry.get(Upstream.GEOCODING)
+
+    await registry.startup()
+    await registry.shutdown()
+    with pytest.raises(RuntimeError):
+        registry.get(Upstream.GEOCODING)
@@ -0,0 +1,96 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from core.metrics import (
+    Counter,
+    Histogram,
+    ServerTimingMiddleware,
+    expose_metrics,
+    request_timings,
+    stage_duration,
+    stage_errors,
+    stage_timer,
+)
+
+
+def test_histogram_exposes_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test durations.", ("operation",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(("plan",), value)
+
+    lines = histogram.expose()
+    assert 'test_seconds_bucket{operation="plan",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{operation="plan",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{operation="plan",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{operation="plan"} 2.65' in lines
+    assert 'test_seconds_count{operation="plan"} 4' in lines
+
+
+def test_counter_exposes_values_per_labels():
+    counter = Counter("test_total", "Test events.", ("upstream", "outcome"))
+    counter.inc(("otp", "error"))
+    counter.inc(("otp", "error"), value=2)
+    counter.inc(("otp", "success"))
+
+    lines = counter.expose()
+    assert 'test_total{upstream="otp",outcome="error"} 3' in lines
+    assert 'test_total{upstream="otp",outcome="success"} 1' in lines
+
+
+def test_stage_timer_records_durations_and_errors():
+    count = sum(stage_duration.counts.get(("test", "decode"), [0]))
+    with pytest.raises(ValueError):
+        with stage_timer("test", "decode"):
+            raise ValueError()
+
+    assert sum(stage_duration.counts[("test", "decode")]) == count + 1
+    assert stage_errors.values[("test", "decode")] >= 1
+
+
+def test_stage_timer_adds_up_repeated_stages_of_a_request():
+    token = request_timings.set({})
+    try:
+        with stage_timer("plan", "redis_read"):
+            pass
+        with stage_timer("plan", "redis_read"):
+            pass
+        assert list(request_timings.get()) == ["plan-redis_read"]
+    finally:
+        request_timings.reset(token)
+
+
+def test_responses_report_their_stages_in_server_timing():
+    async def endpoint(request):
+        with stage_timer("plan", "otp_request"):
+            pass
+        return PlainTextResponse("ok")
+
+    app = ServerTimingMiddleware(Starlette(routes=[Route("/", endpoint)]))
+    response = TestClient(app).get("/")
+
+    entries = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert entries == ["plan-otp_request", "total"]
+    assert request_timings.get() is None
+
+
+def test_metrics_of_several_workers_are_added_up():
+    histogram = Histogram("test_seconds", "Test durations.", ("operation",), (0.1, 1.0))
+    counter = Counter("test_total", "Test events.", ("outcome",))
+    histogram.observe(("plan",), 0.05)
+    counter.inc(("error",))
+    snapshot = {histogram.name: histogram.snapshot(), counter.name: counter.snapshot()}
+
+    merged_histogram, merged_counter = histogram.empty(), counter.empty()
+    for _ in range(2):
+        merged_histogram.merge(snapshot[histogram.name])
+        merged_counter.merge(snapshot[counter.name])
+    assert 'test_seconds_count{operation="plan"} 2' in merged_histogram.expose()
+    assert 'test_total{outcome="error"} 2' in merged_counter.expose()
+
+
+def test_exposes_the_sums_of_worker_snapshots():
+    counter_snapshot = {stage_errors.name: [[["plan", "decode"], 3]]}
+    lines = expose_metrics([counter_snapshot, counter_snapshot, {}]).splitlines()
+    assert 'navi4all_stage_errors_total{operation="plan",stage="decode"} 6' in lines
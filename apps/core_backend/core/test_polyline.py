@@ -0,0 +1,81 @@
+import numpy as np
+from core.polyline import (
+    decode_polyline,
+    encode_polyline,
+    simplify_lines,
+    simplify_polylines,
+    zoom_to_tolerance,
+)
+
+
+def test_encodes_the_reference_polyline():
+    # The example of the encoded polyline algorithm format documentation
+    coordinates = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(coordinates) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_decodes_what_it_encodes():
+    rng = np.random.default_rng(0)
+    coordinates = np.round(
+        np.column_stack([rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)]), 5
+    )
+    np.testing.assert_allclose(decode_polyline(encode_polyline(coordinates)), coordinates)
+
+
+def test_empty_polylines():
+    assert encode_polyline([]) == ""
+    assert decode_polyline("").shape == (0, 2)
+
+
+def test_simplification_drops_points_within_tolerance():
+    # A straight line with a bump of about 11 m in the middle
+    line = np.array([(49.44, 7.76), (49.44, 7.761), (49.4401, 7.762), (49.44, 7.763), (49.44, 7.764)])
+
+    [simplified] = simplify_lines([line], tolerance=20.0)
+    np.testing.assert_array_equal(simplified, line[[0, 4]])
+
+    [simplified] = simplify_lines([line], tolerance=8.0)
+    np.testing.assert_array_equal(simplified, line[[0, 2, 4]])
+
+
+def test_simplification_keeps_points_farther_than_tolerance():
+    rng = np.random.default_rng(1)
+    line = np.column_stack([49.44 + rng.uniform(0, 0.01, 100), 7.76 + np.linspace(0, 0.05, 100)])
+    tolerance = 25.0
+
+    [simplified] = simplify_lines([line], tolerance)
+    assert 2 <= len(simplified) < len(line)
+
+    # Every dropped point lies within the tolerance of the simplified line
+    x = np.radians(line[:, 1]) * np.cos(np.radians(line[:, 0]).mean()) * 6371008.8
+    y = np.radians(line[:, 0]) * 6371008.8
+    kept = np.flatnonzero(np.isin(line[:, 0], simplified[:, 0]))
+    for start, end in zip(kept[:-1], kept[1:]):
+        segment = np.array([x[end] - x[start], y[end] - y[start]])
+        for index in range(start + 1, end):
+            offset = np.array([x[index] - x[start], y[index] - y[start]])
+            projection = np.clip(offset @ segment / (segment @ segment), 0, 1)
+            assert np.linalg.norm(offset - projection * segment) <= tolerance + 1e-6
+
+
+def test_simplification_keeps_the_ends_of_every_line():
+    lines = [
+        np.array([(49.44, 7.76), (49.44, 7.761), (49.44, 7.762)]),
+        np.array([(49.44, 7.762)]),
+        np.empty((0, 2)),
+        np.array([(49.44, 7.762), (49.44, 7.763), (49.44, 7.764)]),
+    ]
+    simplified = simplify_lines(lines, tolerance=10.0)
+    assert [len(line) for line in simplified] == [2, 1, 0, 2]
+    np.testing.assert_array_equal(simplified[3], lines[3][[0, 2]])
+
+
+def test_unchanged_polylines_are_passed_through():
+    polyline = encode_polyline([(49.44, 7.76), (49.45, 7.77)])
+    assert simplify_polylines([polyline], tolerance=10.0) == [polyline]
+    assert simplify_polylines([polyline], tolerance=0) == [polyline]
+
+
+def test_zoom_tolerance_halves_per_level():
+    assert zoom_to_tolerance(0, 0) == 156543.03
+    assert zoom_to_tolerance(15, 49.44) == zoom_to_tolerance(14, 49.44) / 2
@@ -0,0 +1,16 @@
+from core.responses import etag_matches
+
+ETAG = 'W/"0123456789abcdef"'
+
+
+def test_etags_match_with_weak_comparison():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches('"0123456789abcdef"', ETAG)
+    assert etag_matches('W/"other", W/"0123456789abcdef"', ETAG)
+    assert etag_matches(" * ", ETAG)
+
+
+def test_other_etags_do_not_match():
+    assert not etag_matches("", ETAG)
+    assert not etag_matches('W/"other"', ETAG)
+    assert not etag_matches('"0123456789abcdef', ETAG)
@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+from core.config import settings
+from core.single_flight import SingleFlight
+
+
+class Upstream:
+    """Counts calls and answers after a delay, like a slow upstream."""
+
+    def __init__(self, delay: float = 0.05, error: Exception | None = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.completed = 0
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.completed += 1
+        return "result"
+
+
+async def test_concurrent_calls_share_one_call():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    results = await asyncio.gather(*[flight.do("key", upstream.fetch) for _ in range(5)])
+
+    assert results == ["result"] * 5
+    assert upstream.calls == 1
+    assert flight.stats()["coalesced_calls"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_calls_after_completion_run_again():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    await flight.do("key", upstream.fetch)
+    await flight.do("key", upstream.fetch)
+    await flight.do("other", upstream.fetch)
+    assert upstream.calls == 3
+
+
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight("test")
+    upstream = Upstream(error=ValueError("failed"))
+    results = await asyncio.gather(
+        *[flight.do("key", upstream.fetch) for _ in range(3)], return_exceptions=True
+    )
+    assert upstream.calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = SingleFlight("test", cancel_abandoned=True)
+    upstream = Upstream()
+    first = asyncio.ensure_future(flight.do("key", upstream.fetch))
+    second = asyncio.ensure_future(flight.do("key", upstream.fetch))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "result"
+    assert upstream.completed == 1
+    assert flight.stats()["abandoned_calls"] == 0
+
+
+@pytest.mark.parametrize("cancel_abandoned", [True, False])
+async def test_abandoned_calls_are_cancelled_only_if_configured(cancel_abandoned):
+    flight = SingleFlight("test", cancel_abandoned=cancel_abandoned)
+    upstream = Upstream()
+    waiters = [asyncio.ensure_future(flight.do("key", upstream.fetch)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0.1)
+
+    assert upstream.completed == (0 if cancel_abandoned else 1)
+    assert flight.stats()["abandoned_calls"] == (1 if cancel_abandoned else 0)
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_disabled_single_flight_runs_every_call(monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", False)
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    await asyncio.gather(*[flight.do("key", upstream.fetch) for _ in range(3)])
+    assert upstream.calls == 3
+
+
+async def test_waits_for_the_result_of_another_worker(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_REDIS_POLL_INTERVAL", 0.01)
+    flight = SingleFlight("test", redis_client=redis_client)
+    upstream = Upstream()
+
+    # Another worker holds the lock and shares its result shortly after
+    await redis_client.set("single_flight:test:key", 1)
+
+    async def share():
+        await asyncio.sleep(0.05)
+        await redis_client.set("shared:key", "shared")
+
+    async def fetch_shared():
+        result = await redis_client.get("shared:key")
+        return result.decode() if result is not None else None
+
+    sharing = asyncio.ensure_future(share())
+    assert await flight.do("key", upstream.fetch, fetch_shared) == "shared"
+    await sharing
+    assert upstream.calls == 0
+    assert flight.stats()["upstream_calls"] == 0
+
+
+async def test_makes_the_call_when_the_other_worker_gives_up(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_REDIS_POLL_INTERVAL", 0.01)
+    flight = SingleFlight("test", redis_client=redis_client)
+    upstream = Upstream()
+    await redis_client.set("single_flight:test:key", 1, px=30)
+
+    async def fetch_shared():
+        return None
+
+    assert await flight.do("key", upstream.fetch, fetch_shared) == "result"
+    assert upstream.calls == 1
+    assert not await redis_client.exists("single_flight:test:key")
+
+
+async def test_leader_keeps_the_lock_another_worker_took_after_it_expired(
+    redis_client, monkeypatch
+):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_REDIS_LOCK_TIMEOUT", 0.03)
+    flight = SingleFlight("test", redis_client=redis_client)
+
+    async def fetch():
+        await asyncio.sleep(0.06)
+        # The lock of this call has expired, another worker now holds it
+        assert await redis_client.set("single_flight:test:key", "other", nx=True)
+        return "result"
+
+    async def fetch_shared():
+        return None
+
+    assert await flight.do("key", fetch, fetch_shared) == "result"
+    assert await redis_client.get("single_flight:test:key") == b"other"
+
+
+async def test_leader_releases_its_own_lock(redis_client):
+    flight = SingleFlight("test", redis_client=redis_client)
+    upstream = Upstream()
+
+    async def fetch_shared():
+        return None
+
+    assert await flight.do("key", upstream.fetch, fetch_shared) == "result"
+    assert not await redis_client.exists("single_flight:test:key")
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from core.config import settings
+from core.supersession import Superseded, Supersession
+
+T0 = datetime(2030, 3, 17, 8, 0, 0)
+
+
+async def slow(result, delay: float = 0.05):
+    await asyncio.sleep(delay)
+    return result
+
+
+async def test_newer_request_cancels_the_one_in_flight():
+    supersession = Supersession("test")
+    first = asyncio.ensure_future(supersession.run("session", T0, lambda: slow("first")))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(
+        supersession.run("session", T0 + timedelta(seconds=1), lambda: slow("second"))
+    )
+
+    with pytest.raises(Superseded):
+        await first
+    assert await second == "second"
+    assert supersession.stats()["cancelled_calls"] == 1
+    assert supersession.stats()["in_flight"] == 0
+
+
+async def test_older_request_is_rejected_before_it_starts():
+    supersession = Supersession("test")
+    started = []
+
+    async def fn():
+        started.append(True)
+        return await slow("older")
+
+    newer = asyncio.ensure_future(
+        supersession.run("session", T0 + timedelta(seconds=1), lambda: slow("newer"))
+    )
+    await asyncio.sleep(0)
+    with pytest.raises(Superseded):
+        await supersession.run("session", T0, fn)
+
+    assert not started
+    assert await newer == "newer"
+    assert supersession.stats()["rejected_calls"] == 1
+
+
+async def test_sessions_do_not_supersede_each_other():
+    supersession = Supersession("test")
+    results = await asyncio.gather(
+        supersession.run("a", T0, lambda: slow("a")),
+        supersession.run("b", T0 + timedelta(seconds=1), lambda: slow("b")),
+        supersession.run(None, T0, lambda: slow("none")),
+        supersession.run(None, T0, lambda: slow("none")),
+    )
+    assert results == ["a", "b", "none", "none"]
+
+
+async def test_cancelled_caller_is_not_reported_as_superseded():
+    supersession = Supersession("test")
+    caller = asyncio.ensure_future(supersession.run("session", T0, lambda: slow("first", 1.0)))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    assert supersession.stats()["cancelled_calls"] == 0
+    assert supersession.stats()["in_flight"] == 0
+
+
+async def test_disabled_supersession_runs_every_request(monkeypatch):
+    monkeypatch.setattr(settings, "SUPERSESSION_ENABLED", False)
+    supersession = Supersession("test")
+    results = await asyncio.gather(
+        supersession.run("session", T0 + timedelta(seconds=1), lambda: slow("newer")),
+        supersession.run("session", T0, lambda: slow("older")),
+    )
+    assert results == ["newer", "older"]
+
+
+async def test_naive_and_aware_timestamps_are_compared_in_utc():
+    supersession = Supersession("test")
+    aware = asyncio.ensure_future(
+        supersession.run(
+            "session",
+            datetime(2030, 3, 17, 9, 0, 1, tzinfo=timezone(timedelta(hours=1))),
+            lambda: slow("aware"),
+        )
+    )
+    await asyncio.sleep(0)
+
+    # 08:00:00 UTC is older than 08:00:01 UTC
+    with pytest.raises(Superseded):
+        await supersession.run("session", T0, lambda: slow("naive"))
+    newer = supersession.run("session", T0 + timedelta(seconds=2), lambda: slow("newer"))
+    assert await newer == "newer"
+    with pytest.raises(Superseded):
+        await aware
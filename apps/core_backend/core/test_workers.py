@@ -0,0 +1,67 @@
+import json
+import os
+import time
+import pytest
+from core.config import settings
+from core.metrics import stage_errors
+from core.workers import WorkerSnapshots
+
+
+@pytest.fixture
+def worker_snapshots(tmp_path, monkeypatch) -> WorkerSnapshots:
+    monkeypatch.setattr(settings, "SERVER_WORKER_SNAPSHOT_DIR", str(tmp_path))
+    worker_snapshots = WorkerSnapshots()
+
+    async def collect_stats():
+        return {"hits": 1}
+
+    worker_snapshots.collect_stats = collect_stats
+    return worker_snapshots
+
+
+def write_other_worker(directory, pid: int, written_at: float):
+    snapshot = {
+        "written_at": written_at,
+        "metrics": {stage_errors.name: [[["worker", "test"], 2]]},
+        "stats": {"hits": 2},
+    }
+    (directory / f"{pid}.json").write_text(json.dumps(snapshot))
+
+
+async def test_workers_answer_for_all_workers(worker_snapshots, tmp_path):
+    write_other_worker(tmp_path, 1, time.time())
+    stage_errors.inc(("worker", "test"))
+    count = stage_errors.values[("worker", "test")]
+
+    metrics = await worker_snapshots.read_metrics()
+    counts = [
+        value
+        for snapshot in metrics
+        for labels, value in snapshot[stage_errors.name]
+        if labels == ["worker", "test"]
+    ]
+    assert sorted(counts) == sorted([count, 2])
+    assert await worker_snapshots.read_stats() == {os.getpid(): {"hits": 1}, 1: {"hits": 2}}
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+async def test_stats_of_exited_workers_are_left_out(worker_snapshots, tmp_path):
+    write_other_worker(tmp_path, 1, time.time() - 3600)
+
+    assert list(await worker_snapshots.read_stats()) == [os.getpid()]
+    assert len(await worker_snapshots.read_metrics()) == 2
+
+
+async def test_workers_answer_for_themselves_without_a_shared_directory(worker_snapshots, monkeypatch):
+    monkeypatch.setattr(settings, "SERVER_WORKER_SNAPSHOT_DIR", None)
+    assert await worker_snapshots.read_stats() == {os.getpid(): {"hits": 1}}
+
+
+async def test_metrics_are_shared_without_collecting_stats(worker_snapshots):
+    async def collect_stats():
+        raise ConnectionError("Redis is unavailable")
+
+    worker_snapshots.collect_stats = collect_stats
+    assert len(await worker_snapshots.read_metrics()) == 1
+    with pytest.raises(ConnectionError):
+        await worker_snapshots.read_stats()
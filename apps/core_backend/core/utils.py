@@ -1,3 +1,4 @@
+import math
 import re
 
 def to_camel_case(string: str):
@@ -10,3 +11,43 @@ def to_snake_case(string: str):
     """Utility function to convert a camelCase string to snake_case"""
 
     return re.sub(r'(?<!^)(?=[A-Z])', '_', string).lower()
+
+def normalize_text(text: str) -> str:
+    """Utility function to normalize free text for comparison, ignoring case, punctuation and spacing"""
+
+    return " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split())
+
+EARTH_RADIUS = 6371008.8
+
+def get_distance(lat_a: float, lon_a: float, lat_b: float, lon_b: float) -> float:
+    """Utility function to compute the great-circle distance between two coordinates in meters"""
+
+    lat_a, lon_a, lat_b, lon_b = map(math.radians, (lat_a, lon_a, lat_b, lon_b))
+    a = (
+        math.sin((lat_b - lat_a) / 2) ** 2
+        + math.cos(lat_a) * math.cos(lat_b) * math.sin((lon_b - lon_a) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def to_geohash(lat: float, lon: float, precision: int):
+    """Utility function to encode a coordinate as a geohash of the given length"""
+
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
@@ -0,0 +1,103 @@
+from pathlib import Path
+from typing import Awaitable, Callable
+from core.config import settings
+from core.metrics import snapshot_metrics
+import asyncio
+import json
+import os
+import time
+
+CollectStats = Callable[[], Awaitable[dict[str, any]]]
+
+
+class WorkerSnapshots:
+    """Shares the metrics and stats of this worker with the other workers of the server.
+
+    Each worker writes a snapshot to its own file in a shared directory, periodically and
+    whenever it answers for all workers. Metrics of workers that have exited are kept, so
+    that counters added up over all workers never go back, their stats are left out.
+    Without a shared directory, a worker only answers for itself.
+    """
+
+    def __init__(self):
+        self.collect_stats: CollectStats | None = None
+        self.stats: dict[str, any] = {}
+        self.write_task: asyncio.Task | None = None
+
+    @property
+    def directory(self) -> Path | None:
+        if not settings.SERVER_WORKER_SNAPSHOT_DIR:
+            return None
+        return Path(settings.SERVER_WORKER_SNAPSHOT_DIR)
+
+    async def startup(self, collect_stats: CollectStats):
+        self.collect_stats = collect_stats
+        if self.directory is not None:
+            self.write_task = asyncio.create_task(self._write_periodically())
+
+    async def shutdown(self):
+        if self.write_task is None:
+            return
+        self.write_task.cancel()
+        self.write_task = None
+        await self.write(collect_stats=False)
+
+    async def _write_periodically(self):
+        while True:
+            await asyncio.sleep(settings.SERVER_WORKER_SNAPSHOT_INTERVAL)
+            try:
+                await self.write()
+            except Exception:
+                # Stats can depend on Redis, metrics are shared regardless
+                try:
+                    await self.write(collect_stats=False)
+                except OSError:
+                    pass
+
+    async def write(self, collect_stats: bool = True) -> dict[str, any]:
+        """Write the snapshot of this worker, replacing its previous one at once.
+
+        Unless collected again, the stats of the previous snapshot are kept.
+        """
+
+        if collect_stats and self.collect_stats is not None:
+            self.stats = await self.collect_stats()
+        snapshot = {"written_at": time.time(), "metrics": snapshot_metrics(), "stats": self.stats}
+        if self.directory is not None:
+            path = self.directory / f"{os.getpid()}.json"
+            staging_path = path.with_suffix(".tmp")
+            staging_path.write_text(json.dumps(snapshot, default=str))
+            staging_path.replace(path)
+        return snapshot
+
+    async def read(self, collect_stats: bool = True) -> dict[int, dict[str, any]]:
+        """Read the snapshots of all workers by process ID, with a fresh one of this worker."""
+
+        snapshots = {os.getpid(): await self.write(collect_stats)}
+        if self.directory is None:
+            return snapshots
+        for path in self.directory.glob("*.json"):
+            pid = int(path.stem)
+            if pid not in snapshots:
+                try:
+                    snapshots[pid] = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    async def read_metrics(self) -> list[dict[str, list]]:
+        return [snapshot["metrics"] for snapshot in (await self.read(collect_stats=False)).values()]
+
+    async def read_stats(self) -> dict[int, dict[str, any]]:
+        """Read the stats of the workers that are still running."""
+
+        # Running workers write at least once per interval
+        oldest = time.time() - 3 * settings.SERVER_WORKER_SNAPSHOT_INTERVAL
+        return {
+            pid: snapshot["stats"]
+            for pid, snapshot in (await self.read()).items()
+            if snapshot["written_at"] >= oldest
+        }
+
+
+worker_snapshots = WorkerSnapshots()
@@ -1,13 +1,18 @@
-import httpx
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from schemas.coordinates import Coordinates
-from schemas.geocoding import GeocodingAutocompleteRequestModel, GeocodingAutocompleteResponseModel
+from schemas.geocoding import (
+    GeocodingAutocompleteRequestModel,
+    GeocodingAutocompleteResponseModel,
+    GeocodingReverseRequestModel,
+    GeocodingReverseResponseModel,
+)
 from services.adaptors.geocoding import GeocodingAdaptor
 from core.config import settings
+from core.responses import model_response
 
 router = APIRouter(prefix="/geocoding")
 adaptor = GeocodingAdaptor(
-    provider=settings.GEOCODING_PROVIDER,
+    providers=settings.GEOCODING_PROVIDERS,
     api_url=settings.GEOCODING_PROVIDER_API_URL,
     api_key=settings.GEOCODING_PROVIDER_API_KEY,
 )
@@ -20,17 +25,25 @@ async def autocomplete(
     focus_point_lat: float | None = None,
     focus_point_lon: float | None = None,
     limit: int | None = 5,
+    session_id: str | None = None,
 ):
-    async with httpx.AsyncClient() as client:
-        response = await adaptor.autocomplete(
-            client,
-            GeocodingAutocompleteRequestModel(
-                timestamp=timestamp,
-                query=query,
-                focus_point=Coordinates(lat=focus_point_lat, lon=focus_point_lon)
-                if focus_point_lat is not None and focus_point_lon is not None
-                else None,
-                limit=limit,
-            ),
-        )
-    return response
+    response = await adaptor.autocomplete(
+        GeocodingAutocompleteRequestModel(
+            timestamp=timestamp,
+            query=query,
+            focus_point=Coordinates(lat=focus_point_lat, lon=focus_point_lon)
+            if focus_point_lat is not None and focus_point_lon is not None
+            else None,
+            limit=limit,
+            session_id=session_id,
+        ),
+    )
+    return model_response(response, operation="autocomplete")
+
+
+@router.get("/reverse", response_model=GeocodingReverseResponseModel)
+async def reverse(lat: float = Query(ge=-90, le=90), lon: float = Query(ge=-180, le=180)):
+    response = await adaptor.reverse(
+        GeocodingReverseRequestModel(coordinates=Coordinates(lat=lat, lon=lon)),
+    )
+    return model_response(response, operation="reverse")
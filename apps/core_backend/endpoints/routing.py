@@ -1,7 +1,17 @@
-import httpx
-from fastapi import APIRouter
-from schemas.routing import RoutingPlanRequestModel, RoutingPlanResponseModel, ItineraryResponseModel
+from uuid import UUID
+from fastapi import APIRouter, Header, Response
+from fastapi.responses import StreamingResponse
+from schemas.routing import (
+    RoutingPlanRequestModel,
+    RoutingPlanResponseModel,
+    RoutingPlanBatchRequestModel,
+    RoutingMatrixRequestModel,
+    RoutingMatrixResponseModel,
+    ItineraryResponseModel,
+)
 from services.adaptors.open_trip_planner import OpenTripPlannerAdaptor
+from core.responses import model_response, etag_matches
+from core.compression import accepts_encoding
 
 router = APIRouter(prefix="/routing")
 adaptor = OpenTripPlannerAdaptor()
@@ -9,12 +19,70 @@ adaptor = OpenTripPlannerAdaptor()
 
 @router.post("/plan", response_model=RoutingPlanResponseModel)
 async def plan(request: RoutingPlanRequestModel):
-    async with httpx.AsyncClient() as client:
-        response = await adaptor.make_plan_request(client, request)
-    return response
+    response = await adaptor.make_plan_request(request)
+    return model_response(response, operation="plan")
+
+
+@router.post("/plan/stream")
+async def plan_stream(request: RoutingPlanRequestModel):
+    """Stream itinerary summaries as newline-delimited JSON as soon as each is ready."""
+
+    async def stream_items():
+        async for item in adaptor.stream_plan_request(request):
+            yield item.model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(stream_items(), media_type="application/x-ndjson")
+
+
+@router.post("/plan/batch")
+async def plan_batch(request: RoutingPlanBatchRequestModel):
+    """Plan many requests, streaming a result per request as newline-delimited JSON."""
+
+    batch_items = adaptor.batch_plan_requests(request.requests)
+
+    async def stream_items():
+        async for item in batch_items:
+            yield item.model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(stream_items(), media_type="application/x-ndjson")
+
+
+@router.post("/matrix", response_model=RoutingMatrixResponseModel)
+async def matrix(request: RoutingMatrixRequestModel):
+    """Travel times from every origin to every destination, per set of transport modes."""
+
+    response = await adaptor.make_matrix_request(request)
+    return model_response(response, operation="matrix")
 
 
 @router.get("/itinerary/{itinerary_id}", response_model=ItineraryResponseModel)
-async def get_itinerary(itinerary_id: str):
-    response = await adaptor.get_itinerary(itinerary_id)
-    return response
+async def get_itinerary(
+    itinerary_id: UUID,
+    refresh: bool = False,
+    accept_encoding: str = Header(default=""),
+    if_none_match: str = Header(default=""),
+):
+    if refresh:
+        # Patch the realtime data of the transit legs, keeping the itinerary ID
+        stored_itinerary = await adaptor.refresh_itinerary_raw(str(itinerary_id))
+    else:
+        # Pass the stored itinerary through as is, it was validated when it was written
+        stored_itinerary = await adaptor.get_itinerary_raw(str(itinerary_id))
+
+    # Confirm unchanged itineraries without sending them again
+    etag = stored_itinerary.etag
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Serve compressed itineraries without recompressing them if the client accepts gzip
+    if stored_itinerary.is_gzipped and accepts_encoding(accept_encoding, "gzip"):
+        return Response(
+            content=stored_itinerary.data,
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding", "ETag": etag},
+        )
+    return Response(
+        content=stored_itinerary.to_json(),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from core.http_clients import http_clients
+from core.backend_pool import open_trip_planner_backends
+from core.admission import admission_control
+from core.workers import worker_snapshots
+from endpoints.routing import adaptor as routing_adaptor
+from endpoints.geocoding import adaptor as geocoding_adaptor
+import os
+
+router = APIRouter(prefix="/system")
+
+
+async def collect_stats() -> dict[str, any]:
+    """Collect the stats of this worker."""
+
+    return {
+        "http_clients": http_clients.stats(),
+        "admission": admission_control.stats(),
+        "open_trip_planner_backends": open_trip_planner_backends.stats(),
+        "itinerary_cache": await routing_adaptor.itinerary_cache.stats(),
+        "plan_cache": routing_adaptor.plan_cache.stats(),
+        "travel_time_cache": routing_adaptor.travel_time_cache.stats(),
+        "autocomplete_caches": {
+            provider.value: autocomplete_cache.stats()
+            for provider, autocomplete_cache in geocoding_adaptor.autocomplete_caches.items()
+        },
+        "geocoding_providers": geocoding_adaptor.stats(),
+        "reverse_geocoding": geocoding_adaptor.reverse_stats(),
+        "coalescing": {
+            "plan": routing_adaptor.plan_flight.stats(),
+            "itinerary_detail": routing_adaptor.itinerary_detail_flight.stats(),
+            "autocomplete": geocoding_adaptor.autocomplete_flight.stats(),
+            "reverse": geocoding_adaptor.reverse_flight.stats(),
+        },
+        "supersession": {
+            "autocomplete": geocoding_adaptor.autocomplete_supersession.stats(),
+        },
+    }
+
+
+@router.get("/stats")
+async def stats():
+    # Workers keep their stats in process, the stats of each are given under its process ID
+    return {"worker": os.getpid(), "workers": await worker_snapshots.read_stats()}
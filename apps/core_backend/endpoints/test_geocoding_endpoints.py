@@ -0,0 +1,31 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from endpoints.geocoding import adaptor, router
+
+
+@pytest.fixture
+def client(monkeypatch) -> TestClient:
+    async def fetch_reverse_place(provider, request):
+        return None
+
+    monkeypatch.setattr(adaptor, "_fetch_reverse_place", fetch_reverse_place)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "lat, lon",
+    [("90.5", "0"), ("-91", "0"), ("0", "180.1"), ("nan", "0"), ("0", "inf")],
+)
+def test_reverse_rejects_coordinates_off_the_globe(client, lat, lon):
+    response = client.get("/geocoding/reverse", params={"lat": lat, "lon": lon})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("lat, lon", [(90, 0), (-90, 180), (49.44, 7.76)])
+def test_reverse_answers_anywhere_on_the_globe(client, lat, lon):
+    response = client.get("/geocoding/reverse", params={"lat": lat, "lon": lon})
+    assert response.status_code == 200
+    assert response.json()["result"] is None
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+import asyncio
+import json
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from endpoints.routing import adaptor, router
+from schemas.routing import ItineraryPlanned, RoutingPlanRequestModel
+
+START_TIME = datetime(2030, 3, 17, 8, 0, 0)
+
+
+def build_request(**update) -> dict:
+    return {
+        "origin": {"lat": 49.44, "lon": 7.76},
+        "destination": {"lat": 49.45, "lon": 7.77},
+        "date": "2030-03-17",
+        "time": "08:00:00",
+        "transport_modes": ["WALK", "BUS"],
+        **update,
+    }
+
+
+def build_itinerary(modes: tuple[str, ...], start_time: datetime = START_TIME) -> ItineraryPlanned:
+    return ItineraryPlanned(
+        itinerary_id=uuid4(),
+        duration=600 * len(modes),
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=10 * len(modes)),
+        origin={"lat": 49.44, "lon": 7.76},
+        destination={"lat": 49.45, "lon": 7.77},
+        legs=[
+            {"mode": mode, "duration": 600, "distance": 800, "geometry": "_p~iF~ps|U"}
+            for mode in modes
+        ],
+        plan_variables={"date": "2030-03-17"},
+    )
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def read_lines(response) -> list[dict]:
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_plan_stream_sends_a_line_per_itinerary(client, monkeypatch):
+    walk = build_itinerary(("WALK",))
+
+    async def plan_itineraries(request: RoutingPlanRequestModel):
+        if request.transport_modes == ["WALK"]:
+            return [walk]
+        await asyncio.sleep(0.01)
+        # The transit search finds the walking itinerary again
+        return [walk.model_copy(update={"itinerary_id": uuid4()}), build_itinerary(("WALK", "BUS"))]
+
+    monkeypatch.setattr(adaptor, "_plan_itineraries", plan_itineraries)
+    lines = read_lines(client.post("/routing/plan/stream", json=build_request()))
+
+    assert [line["transport_modes"] for line in lines] == [["WALK"], ["WALK", "BUS"]]
+    assert [[leg["mode"] for leg in line["itinerary"]["legs"]] for line in lines] == [
+        ["WALK"],
+        ["WALK", "BUS"],
+    ]
+    assert lines[0]["itinerary"]["itinerary_id"] == str(walk.itinerary_id)
+
+
+def test_plan_stream_ends_with_an_error_line_when_a_sub_request_fails(client, monkeypatch):
+    async def plan_itineraries(request: RoutingPlanRequestModel):
+        if request.transport_modes == ["WALK"]:
+            return [build_itinerary(("WALK",))]
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=502, detail="Routing request failed.")
+
+    monkeypatch.setattr(adaptor, "_plan_itineraries", plan_itineraries)
+    response = client.post("/routing/plan/stream", json=build_request())
+    lines = read_lines(response)
+
+    # Itineraries already sent stay valid, the stream itself succeeds
+    assert response.status_code == 200
+    assert len(lines) == 2
+    assert "itinerary" in lines[0]
+    assert lines[-1] == {"transport_modes": ["WALK", "BUS"], "error": "Routing request failed."}
+
+
+def test_plan_batch_answers_every_request_by_its_index(client, monkeypatch):
+    times = ["08:00:00", "08:10:00", "08:20:00", "08:30:00"]
+
+    async def plan_itineraries(request: RoutingPlanRequestModel):
+        # Later requests are answered first
+        await asyncio.sleep(0.01 * (len(times) - times.index(request.time)))
+        if request.time == "08:20:00":
+            raise HTTPException(status_code=404, detail="No itineraries found.")
+        start_time = datetime.combine(START_TIME.date(), datetime.strptime(request.time, "%H:%M:%S").time())
+        return [build_itinerary(("WALK",), start_time)]
+
+    monkeypatch.setattr(adaptor, "_plan_itineraries", plan_itineraries)
+    response = client.post(
+        "/routing/plan/batch",
+        json={"requests": [build_request(time=time) for time in times]},
+    )
+    lines = read_lines(response)
+
+    assert [line["index"] for line in lines] == [3, 2, 1, 0]
+    results = {line["index"]: line for line in lines}
+    for index, time in enumerate(times):
+        if time == "08:20:00":
+            assert results[index] == {"index": index, "status": "FAILED", "error": "No itineraries found."}
+        else:
+            assert results[index]["status"] == "SUCCESS"
+            assert results[index]["itineraries"][0]["start_time"] == f"2030-03-17T{time}"
+
+
+def test_plan_batch_plans_identical_requests_once(client, monkeypatch):
+    planned = []
+
+    async def plan_itineraries(request: RoutingPlanRequestModel):
+        planned.append(request.time)
+        return [build_itinerary(("WALK",))]
+
+    monkeypatch.setattr(adaptor, "_plan_itineraries", plan_itineraries)
+    requests = [build_request(), build_request(time="08:10:00"), build_request()]
+    lines = read_lines(client.post("/routing/plan/batch", json={"requests": requests}))
+
+    assert sorted(planned) == ["08:00:00", "08:10:00"]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    results = {line["index"]: line for line in lines}
+    assert results[0]["itineraries"] == results[2]["itineraries"]
+    assert all(line["status"] == "SUCCESS" for line in lines)
@@ -1,26 +1,97 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from endpoints.routing import router as routing_router
 from endpoints.geocoding import router as geocoding_router
+from endpoints.system import router as system_router, collect_stats
+from endpoints.geocoding import adaptor as geocoding_adaptor
 from core.config import settings
+from core.http_clients import http_clients
+from core.backend_pool import open_trip_planner_backends
+from core.cache import close_redis, ping_redis
+from core.readiness import readiness
+from core.templates import graphql_templates
+from schemas.geocoding import SupportedGeocodingProviders
+from services.index.places import local_place_index
+from core.metrics import ServerTimingMiddleware, expose_metrics
+from core.workers import worker_snapshots
+from core.compression import CompressionMiddleware
+from core.admission import AdmissionControlMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load query templates, the local place index and open long-lived upstream connections for the lifetime of the app
+    graphql_templates.load()
+    # Reverse geocoding uses a regional extract even without the local autocomplete provider
+    if (
+        SupportedGeocodingProviders.LOCAL in settings.GEOCODING_PROVIDERS
+        or settings.GEOCODING_LOCAL_SOURCE_PATH
+    ):
+        local_place_index.load()
+    await http_clients.startup()
+    await open_trip_planner_backends.startup()
+    # Only take traffic once upstream and cache connections are open
+    await readiness.startup(
+        {
+            "redis": ping_redis,
+            "open_trip_planner": open_trip_planner_backends.check_health,
+            "geocoding": geocoding_adaptor.warm_up,
+        }
+    )
+    await worker_snapshots.startup(collect_stats)
+    yield
+    await worker_snapshots.shutdown()
+    await readiness.shutdown()
+    await open_trip_planner_backends.shutdown()
+    await http_clients.shutdown()
+    await close_redis()
+
 
 app = FastAPI(
     title="Navi4All Core Backend API",
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
+    lifespan=lifespan,
 )
 
+# Shed load before parsing requests, though inside CORS so that clients can read rejections
+if settings.ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag", "Retry-After"],
 )
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE,
+        gzip_level=settings.RESPONSE_COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY,
+    )
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(routing_router, prefix=settings.API_VERSION)
 app.include_router(geocoding_router, prefix=settings.API_VERSION)
+app.include_router(system_router, prefix=settings.API_VERSION)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Navi4All Core Backend API"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    return JSONResponse(readiness.stats(), status_code=200 if readiness.is_ready() else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Metrics add up those of all workers, whichever worker answers the scrape
+    metrics = expose_metrics(await worker_snapshots.read_metrics())
+    return PlainTextResponse(metrics, media_type="text/plain; version=0.0.4")
@@ -10,6 +10,7 @@ class SupportedGeocodingProviders(str, Enum):
     NONE = "none"
     PELIAS = "pelias"
     GOOGLE = "google"
+    LOCAL = "local"
 
 
 """Request and response models exposed via the API"""
@@ -20,6 +21,7 @@ class GeocodingAutocompleteRequestModel(BaseModel):
     timestamp: datetime
     focus_point: Coordinates | None = None
     limit: int | None = 5
+    session_id: str | None = None
 
     @field_validator("timestamp", mode="before")
     def validate_timestamp(cls, value: str | datetime) -> datetime:
@@ -35,3 +37,12 @@ class GeocodingAutocompleteRequestModel(BaseModel):
 class GeocodingAutocompleteResponseModel(BaseModel):
     timestamp: datetime
     results: list[Place]
+    superseded: bool = False
+
+
+class GeocodingReverseRequestModel(BaseModel):
+    coordinates: Coordinates
+
+
+class GeocodingReverseResponseModel(BaseModel):
+    result: Place | None = None
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, field_validator, model_validator
 from datetime import datetime
+from typing import Any
 from enum import Enum
 from uuid import UUID
 from schemas.coordinates import Coordinates
@@ -75,8 +76,28 @@ class LegSummary(BaseModel):
     geometry: str
 
 
+class TransitTrip(BaseModel):
+    trip_id: str
+    service_date: str
+    from_stop_id: str
+    to_stop_id: str
+
+
+class LegPlanned(LegSummary):
+    # The trip ridden by transit legs, to recognize the itinerary when its details are fetched
+    trip_id: str | None = None
+    service_date: str | None = None
+
+
 class LegDetailed(LegSummary):
     steps: list[Step]
+    # Times and realtime delays in seconds, with the trip of transit legs to refresh them
+    start_time: datetime | None = None
+    end_time: datetime | None = None
+    departure_delay: int = 0
+    arrival_delay: int = 0
+    real_time: bool = False
+    trip: TransitTrip | None = None
 
 
 class ItineraryBase(BaseModel):
@@ -105,6 +126,12 @@ class ItineraryDetailed(ItineraryBase):
     legs: list[LegDetailed]
 
 
+class ItineraryPlanned(ItineraryBase):
+    legs: list[LegPlanned]
+    # Query variables of the plan this itinerary came from, to fetch its details on demand
+    plan_variables: dict[str, Any]
+
+
 """Request and response models exposed via the API"""
 
 
@@ -117,6 +144,9 @@ class RoutingPlanRequestModel(BaseModel):
     transport_modes: list[Mode]
     accessible: bool = False
     num_itineraries: int = 3
+    # Simplification of summary geometries, tolerance in meters or as a map zoom level
+    geometry_tolerance: float | None = None
+    geometry_zoom: float | None = None
 
     @field_validator("date", mode="before")
     @classmethod
@@ -136,10 +166,76 @@ class RoutingPlanRequestModel(BaseModel):
         except ValueError:
             raise ValueError("Time must be in the format 'HH:MM:SS'.")
 
+    @field_validator("geometry_tolerance", "geometry_zoom")
+    @classmethod
+    def validate_geometry_simplification(cls, value: float | None):
+        if value is not None and value < 0:
+            raise ValueError("Geometry tolerance and zoom must not be negative.")
+        return value
+
 
 class RoutingPlanResponseModel(BaseModel):
     # TODO: Include additional info about the plan
     itineraries: list[ItinerarySummary]
-    
+
+
+class RoutingPlanStreamItem(BaseModel):
+    transport_modes: list[Mode]
+    itinerary: ItinerarySummary | None = None
+    error: str | None = None
+
+
+class RoutingPlanBatchRequestModel(BaseModel):
+    requests: list[RoutingPlanRequestModel]
+
+
+class RoutingPlanBatchItemStatus(str, Enum):
+    success = "SUCCESS"
+    failed = "FAILED"
+
+
+class RoutingPlanBatchItem(BaseModel):
+    index: int
+    status: RoutingPlanBatchItemStatus
+    itineraries: list[ItinerarySummary] | None = None
+    error: str | None = None
+
+
+class RoutingMatrixRequestModel(BaseModel):
+    origins: list[Coordinates]
+    destinations: list[Coordinates]
+    date: str
+    time: str
+    time_is_arrival: bool = False
+    # Each set of transport modes is routed as a separate layer of the matrix
+    transport_modes: list[list[Mode]]
+    accessible: bool = False
+
+    @field_validator("date", mode="before")
+    @classmethod
+    def validate_date(cls, value: str):
+        try:
+            datetime.strptime(value, "%Y-%m-%d")
+            return value
+        except ValueError:
+            raise ValueError("Date must be in the format 'YYYY-MM-DD'.")
+
+    @field_validator("time", mode="before")
+    @classmethod
+    def validate_time(cls, value: str):
+        try:
+            datetime.strptime(value, "%H:%M:%S")
+            return value
+        except ValueError:
+            raise ValueError("Time must be in the format 'HH:MM:SS'.")
+
+
+class RoutingMatrixResponseModel(BaseModel):
+    # Indexed by transport mode set, origin and destination, None where no itinerary was found
+    durations: list[list[list[int | None]]]
+    leg_modes: list[list[list[list[Mode] | None]]]
+    failed_cells: int = 0
+
+
 class ItineraryResponseModel(ItineraryDetailed):
     pass
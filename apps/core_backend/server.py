@@ -0,0 +1,58 @@
+"""Production entry point, serving the API from several worker processes.
+
+Run with `python server.py`, see the server settings in core/config.py.
+"""
+
+from pathlib import Path
+from core.config import settings
+import math
+import os
+import tempfile
+import uvicorn
+
+
+def get_available_cpus() -> int:
+    """Count the CPUs this process may use, respecting the CPU quota of its container."""
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def prepare_worker_snapshot_dir() -> str:
+    """Prepare an empty directory for workers to share their metrics and stats through."""
+
+    directory = Path(settings.SERVER_WORKER_SNAPSHOT_DIR or tempfile.mkdtemp(prefix="navi4all-workers-"))
+    directory.mkdir(parents=True, exist_ok=True)
+    # Snapshots of a previous run would be added up with the current ones
+    for path in directory.glob("*.json"):
+        path.unlink()
+    return str(directory)
+
+
+def main():
+    # Workers do not share in-process caches, only Redis. They share their metrics and
+    # stats through files, so that any of them can answer for all
+    workers = settings.SERVER_WORKERS or get_available_cpus()
+    if workers > 1:
+        os.environ["SERVER_WORKER_SNAPSHOT_DIR"] = prepare_worker_snapshot_dir()
+
+    uvicorn.run(
+        "main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+        log_level="debug" if settings.DEBUG else "info",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,127 @@ from schemas.geocoding import (
     SupportedGeocodingProviders,
     GeocodingAutocompleteRequestModel,
     GeocodingAutocompleteResponseModel,
+    GeocodingReverseRequestModel,
+    GeocodingReverseResponseModel,
 )
-from httpx import AsyncClient, Response
+from httpx import HTTPError, Response
 from urllib.parse import urljoin
 from fastapi import HTTPException
 from schemas.place import Place, PlaceType
 from schemas.coordinates import Coordinates
+from core.http_clients import http_clients, Upstream
+from core.cache import redis_client
+from core.config import settings
+from core.single_flight import SingleFlight
+from core.supersession import Supersession, Superseded
+from core.metrics import stage_timer, geocoding_provider_results
+from core.utils import get_distance, normalize_text
+from services.cache.autocomplete import AutocompleteCache
+from services.cache.reverse import ReverseGeocodingCache
+from services.index.places import local_place_index
+from collections import deque
+import asyncio
+import time
+
+# TODO: Make layer exclusion dynamic
+PELIAS_AUTOCOMPLETE_LAYERS = "-continent,-empire,-country,-dependency,-disputed,-region,-macrocounty,-county,-localadmin,-locality,-borough"
+PELIAS_AUTOCOMPLETE_SIZE = 10
+LOCAL_AUTOCOMPLETE_SIZE = 10
+PELIAS_REVERSE_LAYERS = "address,venue,street"
+
+# Latencies kept per provider for its statistics
+PROVIDER_LATENCY_WINDOW = 1000
+
+# How the answer of a provider was used: its places came first, were merged after those of
+# another provider, added nothing new, arrived after the race ended or failed
+PROVIDER_RESULTS = ("won", "merged", "empty", "late", "failed")
+
+
+class GeocodingProviderStats:
+    """Outcomes and recent latencies of autocomplete requests to a single provider."""
+
+    def __init__(self, provider: SupportedGeocodingProviders):
+        self.provider = provider
+        self.results = {result: 0 for result in PROVIDER_RESULTS}
+        self.latencies: deque[float] = deque(maxlen=PROVIDER_LATENCY_WINDOW)
+
+    def record(self, result: str):
+        self.results[result] += 1
+        geocoding_provider_results.inc((self.provider.value, result))
+
+    def stats(self) -> dict[str, any]:
+        requests = sum(self.results.values())
+        latencies = sorted(self.latencies)
+        return {
+            "requests": requests,
+            **self.results,
+            "win_rate": round(self.results["won"] / requests, 4) if requests else 0,
+            "latency_p50_ms": round(latencies[int(0.5 * (len(latencies) - 1))] * 1000, 1)
+            if latencies
+            else None,
+            "latency_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1)
+            if latencies
+            else None,
+        }
 
 
 class GeocodingAdaptor:
+    """Answers autocomplete requests from several providers at once.
+
+    Providers are queried concurrently. The race ends once any provider returns enough
+    places, or once the deadline has passed and any provider has returned places. Places
+    of all providers that answered by then are merged in order of preference.
+    """
+
     def __init__(
-        self, provider: SupportedGeocodingProviders, api_url: str, api_key: str
+        self, providers: list[SupportedGeocodingProviders], api_url: str, api_key: str
     ):
-        self.provider = provider
+        self.providers = providers
         self.api_url = api_url
         self.api_key = api_key
+        self.provider_stats = {
+            provider: GeocodingProviderStats(provider) for provider in providers
+        }
+
+        # Setup autocomplete caches per remote provider, optionally shared between workers via Redis
+        self.autocomplete_caches = {
+            provider: AutocompleteCache(
+                namespace=provider.value,
+                redis_client=redis_client
+                if settings.AUTOCOMPLETE_CACHE_REDIS_ENABLED
+                else None,
+            )
+            for provider in providers
+            if provider != SupportedGeocodingProviders.LOCAL
+        }
+
+        # Setup coalescing of identical concurrent autocomplete requests, cancelling
+        # provider requests once every client waiting for them has been superseded
+        self.autocomplete_flight = SingleFlight("autocomplete", cancel_abandoned=True)
+
+        # Setup cancellation of autocomplete requests superseded by a newer keystroke
+        self.autocomplete_supersession = Supersession("autocomplete")
+
+        # Setup reverse geocoding from places seen before, falling back to a remote provider
+        self.reverse_cache = ReverseGeocodingCache()
+        self.reverse_flight = SingleFlight("reverse")
+        self.reverse_sources = {"local_index": 0, "cache": 0, "remote": 0, "not_found": 0}
+
+    async def warm_up(self) -> bool:
+        """Open a connection to the remote geocoding provider, returning whether it answered."""
+
+        if all(
+            provider in (SupportedGeocodingProviders.NONE, SupportedGeocodingProviders.LOCAL)
+            for provider in self.providers
+        ):
+            return True
+
+        # Any response will do, the connection is kept alive for the first requests
+        try:
+            await http_clients.get(Upstream.GEOCODING).get(self.api_url)
+        except HTTPError:
+            return False
+        return True
 
     def _build_request_pelias_autocomplete(
         self, request: GeocodingAutocompleteRequestModel
@@ -27,14 +133,30 @@ class GeocodingAdaptor:
         request_params = {
             "api_key": self.api_key,
             "text": request.query,
-            # TODO: Make layer exclusion dynamic
-            "layers": "-continent,-empire,-country,-dependency,-disputed,-region,-macrocounty,-county,-localadmin,-locality,-borough",
+            "layers": PELIAS_AUTOCOMPLETE_LAYERS,
+            "size": PELIAS_AUTOCOMPLETE_SIZE,
         }
         if request.focus_point:
             request_params["focus.point.lat"] = request.focus_point.lat
             request_params["focus.point.lon"] = request.focus_point.lon
         return request_url, request_params
 
+    def _build_request_pelias_reverse(
+        self, request: GeocodingReverseRequestModel
+    ) -> tuple[str, dict]:
+        """Build the request URL and params for a Pelias reverse request."""
+
+        request_url = urljoin(self.api_url, "v1/reverse")
+        request_params = {
+            "api_key": self.api_key,
+            "point.lat": request.coordinates.lat,
+            "point.lon": request.coordinates.lon,
+            "boundary.circle.radius": settings.REVERSE_GEOCODING_MAX_DISTANCE / 1000,
+            "layers": PELIAS_REVERSE_LAYERS,
+            "size": 1,
+        }
+        return request_url, request_params
+
     def _build_request_google_autocomplete(
         self, request: GeocodingAutocompleteRequestModel
     ) -> tuple[str, dict]:
@@ -72,17 +194,35 @@ class GeocodingAdaptor:
         # TODO: Implement
         pass
 
-    async def autocomplete(
-        self, async_client: AsyncClient, request: GeocodingAutocompleteRequestModel
+    def _get_autocomplete_layers(self, provider: SupportedGeocodingProviders) -> str | None:
+        """Get the layers a provider searches for autocomplete requests."""
+
+        if provider == SupportedGeocodingProviders.PELIAS:
+            return PELIAS_AUTOCOMPLETE_LAYERS
+        return None
+
+    def _is_complete_result(
+        self, provider: SupportedGeocodingProviders, places: list[Place]
+    ) -> bool:
+        """Whether a provider response contains every match, rather than a single page."""
+
+        if provider == SupportedGeocodingProviders.PELIAS:
+            return len(places) < PELIAS_AUTOCOMPLETE_SIZE
+        return False
+
+    async def _fetch_autocomplete_places(
+        self,
+        provider: SupportedGeocodingProviders,
+        request: GeocodingAutocompleteRequestModel,
     ) -> list[Place]:
-        """Make an autocomplete geocoding request."""
+        """Fetch autocomplete places from a remote geocoding provider."""
 
         # Build request URL and params
-        if self.provider == SupportedGeocodingProviders.PELIAS:
+        if provider == SupportedGeocodingProviders.PELIAS:
             request_url, request_params = self._build_request_pelias_autocomplete(
                 request
             )
-        elif self.provider == SupportedGeocodingProviders.GOOGLE:
+        elif provider == SupportedGeocodingProviders.GOOGLE:
             request_url, request_params = self._build_request_google_autocomplete(
                 request
             )
@@ -91,11 +231,12 @@ class GeocodingAdaptor:
                 status_code=400, detail="Unsupported geocoding provider."
             )
 
-        # Make request to selected geocoding provider
-        response = await async_client.get(
-            url=request_url,
-            params=request_params,
-        )
+        # Make request to the geocoding provider
+        with stage_timer("autocomplete", f"{provider.value}_request"):
+            response = await http_clients.get(Upstream.GEOCODING).get(
+                url=request_url,
+                params=request_params,
+            )
 
         if response.status_code != 200:
             raise HTTPException(
@@ -104,16 +245,288 @@ class GeocodingAdaptor:
 
         # Process response
         places: list[Place] = []
-        if self.provider == SupportedGeocodingProviders.PELIAS:
-            places = self._process_response_pelias(response)
-        elif self.provider == SupportedGeocodingProviders.GOOGLE:
-            places = self._process_response_google(response)
+        with stage_timer("autocomplete", "decode"):
+            if provider == SupportedGeocodingProviders.PELIAS:
+                places = self._process_response_pelias(response)
+            elif provider == SupportedGeocodingProviders.GOOGLE:
+                places = self._process_response_google(response)
+
+        return places
+
+    async def _fetch_autocomplete(
+        self,
+        provider: SupportedGeocodingProviders,
+        request: GeocodingAutocompleteRequestModel,
+        layers: str | None,
+    ) -> list[Place]:
+        """Fetch autocomplete places from a remote provider and write them to cache."""
 
-        # Clip length of response if limit is set
-        if request.limit and len(places) > request.limit:
-            places = places[: request.limit]
+        places = await self._fetch_autocomplete_places(provider, request)
+        if settings.AUTOCOMPLETE_CACHE_ENABLED:
+            with stage_timer("autocomplete", "cache_write"):
+                await self.autocomplete_caches[provider].set(
+                    request.query,
+                    request.focus_point,
+                    request.limit,
+                    layers,
+                    places,
+                    complete=self._is_complete_result(provider, places),
+                )
+        return places
+
+    def _search_local(self, request: GeocodingAutocompleteRequestModel) -> list[Place]:
+        """Search the local place index, which answers faster than any cache."""
+
+        with stage_timer("autocomplete", "local_search"):
+            return local_place_index.get().search(
+                request.query,
+                request.focus_point,
+                limit=request.limit or LOCAL_AUTOCOMPLETE_SIZE,
+            )
+
+    async def _get_autocomplete_places(
+        self,
+        provider: SupportedGeocodingProviders,
+        request: GeocodingAutocompleteRequestModel,
+    ) -> list[Place]:
+        """Get autocomplete places of a provider from cache, or from the provider on a cache miss."""
+
+        if provider == SupportedGeocodingProviders.LOCAL:
+            return self._search_local(request)
+
+        layers = self._get_autocomplete_layers(provider)
+        autocomplete_cache = self.autocomplete_caches[provider]
+
+        places = None
+        if settings.AUTOCOMPLETE_CACHE_ENABLED:
+            with stage_timer("autocomplete", "cache_read"):
+                places = await autocomplete_cache.get(
+                    request.query, request.focus_point, request.limit, layers
+                )
+
+        if places is None:
+            # Identical concurrent requests share a single provider request
+            places = await self.autocomplete_flight.do(
+                autocomplete_cache.build_key(
+                    request.query, request.focus_point, request.limit, layers
+                ),
+                lambda: self._fetch_autocomplete(provider, request, layers),
+            )
+        return places
+
+    async def _get_provider_places(
+        self,
+        provider: SupportedGeocodingProviders,
+        request: GeocodingAutocompleteRequestModel,
+    ) -> list[Place]:
+        start = time.perf_counter()
+        places = await self._get_autocomplete_places(provider, request)
+        self.provider_stats[provider].latencies.append(time.perf_counter() - start)
+        return places
+
+    def _is_duplicate(self, place: Place, other: Place) -> bool:
+        """Whether two places found by different providers are the same."""
+
+        if normalize_text(place.address) == normalize_text(other.address):
+            return True
+        return (
+            normalize_text(place.name) == normalize_text(other.name)
+            and get_distance(
+                place.coordinates.lat,
+                place.coordinates.lon,
+                other.coordinates.lat,
+                other.coordinates.lon,
+            )
+            <= settings.GEOCODING_MERGE_DISTANCE
+        )
+
+    def _merge_places(
+        self,
+        results: dict[SupportedGeocodingProviders, list[Place]],
+        limit: int | None,
+    ) -> list[Place]:
+        """Merge the places of all providers in order of preference, dropping duplicates."""
+
+        places: list[Place] = []
+        for provider in self.providers:
+            if provider not in results:
+                continue
+            provider_places = [
+                place
+                for place in results[provider]
+                if not any(self._is_duplicate(place, other) for other in places)
+            ][: limit - len(places) if limit else None]
+
+            # Providers win a request when their places come first
+            if not provider_places:
+                self.provider_stats[provider].record("empty")
+            elif not places:
+                self.provider_stats[provider].record("won")
+            else:
+                self.provider_stats[provider].record("merged")
+            places.extend(provider_places)
+        return places
+
+    async def _race_autocomplete_places(
+        self, request: GeocodingAutocompleteRequestModel
+    ) -> list[Place]:
+        """Query all providers at once, returning the merged places available when the race ends."""
+
+        sufficient_results = min(
+            request.limit or LOCAL_AUTOCOMPLETE_SIZE,
+            settings.GEOCODING_RACE_SUFFICIENT_RESULTS,
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.GEOCODING_RACE_DEADLINE
+        tasks = {
+            asyncio.ensure_future(self._get_provider_places(provider, request)): provider
+            for provider in self.providers
+        }
+        results: dict[SupportedGeocodingProviders, list[Place]] = {}
+        errors: dict[SupportedGeocodingProviders, Exception] = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                # Past the deadline, wait for whichever provider returns places first
+                remaining = deadline - loop.time()
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=remaining if remaining > 0 else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    provider = tasks[task]
+                    # Any failure of one provider leaves the race to the others
+                    try:
+                        results[provider] = task.result()
+                    except Exception as e:
+                        errors[provider] = e
+                        self.provider_stats[provider].record("failed")
+
+                if any(len(places) >= sufficient_results for places in results.values()):
+                    break
+                if loop.time() >= deadline and any(results.values()):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+                self.provider_stats[tasks[task]].record("late")
+
+        # Only fail when every provider failed, with the error of the preferred one
+        if not results:
+            raise next(errors[provider] for provider in self.providers if provider in errors)
+
+        # Places found remotely answer later reverse lookups nearby
+        for provider, places in results.items():
+            if provider != SupportedGeocodingProviders.LOCAL:
+                self.reverse_cache.add(places)
+        return self._merge_places(results, request.limit)
+
+    async def autocomplete(
+        self, request: GeocodingAutocompleteRequestModel
+    ) -> list[Place]:
+        """Make an autocomplete geocoding request."""
+
+        # The local index answers faster than the cache, so it is searched directly
+        if self.providers == [SupportedGeocodingProviders.LOCAL]:
+            return GeocodingAutocompleteResponseModel(
+                timestamp=request.timestamp,
+                results=self._search_local(request),
+            )
+
+        # Only the latest keystroke of a session is worth an answer
+        try:
+            places = await self.autocomplete_supersession.run(
+                request.session_id,
+                request.timestamp,
+                lambda: self._race_autocomplete_places(request),
+            )
+        except Superseded:
+            return GeocodingAutocompleteResponseModel(
+                timestamp=request.timestamp,
+                results=[],
+                superseded=True,
+            )
 
         return GeocodingAutocompleteResponseModel(
             timestamp=request.timestamp,
             results=places,
         )
+
+    def stats(self) -> dict[str, any]:
+        """Produce the outcomes and latencies of autocomplete requests per provider for this worker."""
+
+        return {
+            provider.value: provider_stats.stats()
+            for provider, provider_stats in self.provider_stats.items()
+        }
+
+    def _get_reverse_provider(self) -> SupportedGeocodingProviders | None:
+        """Get the preferred remote provider supporting reverse requests."""
+
+        return next(
+            (provider for provider in self.providers if provider == SupportedGeocodingProviders.PELIAS),
+            None,
+        )
+
+    async def _fetch_reverse_place(
+        self,
+        provider: SupportedGeocodingProviders,
+        request: GeocodingReverseRequestModel,
+    ) -> Place | None:
+        """Fetch the closest place from a remote geocoding provider and remember it."""
+
+        request_url, request_params = self._build_request_pelias_reverse(request)
+        with stage_timer("reverse", f"{provider.value}_request"):
+            response = await http_clients.get(Upstream.GEOCODING).get(
+                url=request_url,
+                params=request_params,
+            )
+
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code, detail="Reverse geocoding request failed."
+            )
+
+        with stage_timer("reverse", "decode"):
+            places = self._process_response_pelias(response)
+        self.reverse_cache.add(places)
+        return places[0] if places else None
+
+    async def reverse(
+        self, request: GeocodingReverseRequestModel
+    ) -> GeocodingReverseResponseModel:
+        """Find the place at a location, from places known in process or else a remote provider."""
+
+        lat, lon = request.coordinates.lat, request.coordinates.lon
+        max_distance = settings.REVERSE_GEOCODING_MAX_DISTANCE
+
+        # Take the closest of the places found in the regional extract and seen before
+        with stage_timer("reverse", "local_lookup"):
+            nearest = {"cache": self.reverse_cache.find_nearest(lat, lon, max_distance)}
+            if local_place_index.is_loaded():
+                nearest["local_index"] = local_place_index.get().find_nearest(lat, lon, max_distance)
+        found = {source: result for source, result in nearest.items() if result is not None}
+        if found:
+            source = min(found, key=lambda source: found[source][0])
+            self.reverse_sources[source] += 1
+            return GeocodingReverseResponseModel(result=found[source][1])
+
+        # Only go remote on a miss, coalescing lookups of the same spot
+        provider = self._get_reverse_provider()
+        place = None
+        if settings.REVERSE_GEOCODING_REMOTE_FALLBACK and provider is not None:
+            place = await self.reverse_flight.do(
+                f"{provider.value}:{lat:.5f}:{lon:.5f}",
+                lambda: self._fetch_reverse_place(provider, request),
+            )
+        self.reverse_sources["remote" if place is not None else "not_found"] += 1
+        return GeocodingReverseResponseModel(result=place)
+
+    def reverse_stats(self) -> dict[str, any]:
+        """Produce where reverse lookups were answered from, with the cache statistics for this worker."""
+
+        return {
+            "sources": dict(self.reverse_sources),
+            "cache": self.reverse_cache.stats(),
+        }
@@ -1,34 +1,66 @@
+from fastapi import HTTPException
+from httpx import HTTPError
 from core.config import settings
-from pathlib import Path
-from httpx import AsyncClient
-import os
 from core.utils import to_camel_case
-from redis import Redis
+from core.http_clients import http_clients, Upstream
+from core.cache import redis_client
+from core.backend_pool import open_trip_planner_backends, NoBackendAvailable
+from core.admission import admission_control
+from core.single_flight import SingleFlight
+from core.metrics import stage_timer
+from core.polyline import simplify_polylines, zoom_to_tolerance
+from core.templates import graphql_templates, GraphQLTemplate
 from schemas.routing import (
+    Mode,
     RoutingPlanRequestModel,
     RoutingPlanResponseModel,
+    RoutingPlanStreamItem,
+    RoutingPlanBatchItem,
+    RoutingPlanBatchItemStatus,
+    RoutingMatrixRequestModel,
+    RoutingMatrixResponseModel,
     ItinerarySummary,
     LegSummary,
+    LegPlanned,
     LegDetailed,
     Step,
+    TransitTrip,
     Coordinates,
     ItineraryResponseModel,
     ItineraryDetailed,
+    ItineraryPlanned,
 )
 from services.schemas.open_trip_planner import (
     OTPInputCoordinates,
     OTPPlanRequestModel,
-    OTPPlanResponseModel,
+    OTPPlanGraphQLResponse,
+    OTPSummaryPlanGraphQLResponse,
+    OTPGraphQLError,
     OTPTransportMode,
+    OTPLeg,
+    OTPStoptime,
+    OTPTripGraphQLResponse,
+    OTPTravelTimeGraphQLResponse,
 )
+from services.cache.itinerary import ItineraryCache, StoredItinerary, get_plan_key
+from services.cache.plan import PlanCache
+from services.cache.matrix import TravelTimeCache, MAX_LEGS, NO_ITINERARY, decode_leg_modes
 from uuid import uuid4
 from datetime import datetime, timedelta
-import json
+from pydantic import BaseModel
+from typing import AsyncIterator, TypeVar
+import asyncio
+import numpy as np
+
+GraphQLResponseModel = TypeVar("GraphQLResponseModel", bound=BaseModel)
+
+# Modes that are routed without transit
+DIRECT_MODES = {Mode.walk, Mode.bicycle, Mode.scooter, Mode.car}
 
 
 class OpenTripPlannerAdaptor:
     def __init__(self):
-        """Initalize adaptor settings and setup persistent itinerary cache."""
+        """Initalize adaptor settings and setup persistent itinerary and plan caches."""
 
         # Ensure a valid URL is configured
         self.routing_engine_url = settings.OPEN_TRIP_PLANNER_URL
@@ -37,28 +69,101 @@ class OpenTripPlannerAdaptor:
                 "A valid OpenTripPlanner URL must be configured to use this adaptor."
             )
 
-        # Setup Redis client to cache itineraries
-        self.redis_client = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+        # Setup persistent caches for itineraries and plans
+        self.itinerary_cache = ItineraryCache(redis_client)
+        if settings.OPEN_TRIP_PLANNER_LAZY_DETAILS:
+            self.plan_cache = PlanCache(redis_client, ItineraryPlanned, namespace="plan_summary")
+        else:
+            self.plan_cache = PlanCache(redis_client, ItineraryDetailed, namespace="plan")
 
-    def _load_graphql_template(self, template_name: str):
-        """Load a GraphQL query template to perform a request."""
+        # Setup the in-process cache of travel time matrix cells
+        self.travel_time_cache = TravelTimeCache()
 
-        path = Path(os.path.join(settings.TEMPLATES_DIR, template_name))
-        if not path.exists():
-            raise FileNotFoundError(f"GraphQL query template not found at {path}")
-        return path.read_text()
+        # Limit concurrent routing engine requests made for batches
+        self.batch_semaphore = asyncio.Semaphore(settings.ROUTING_BATCH_MAX_CONCURRENCY)
 
-    async def make_plan_request(
-        self, async_client: AsyncClient, request: RoutingPlanRequestModel
-    ) -> RoutingPlanResponseModel:
-        """Make a plan request to the OpenTripPlanner routing engine."""
+        # Setup coalescing of identical concurrent plan requests
+        self.plan_flight = SingleFlight(
+            "plan",
+            redis_client=redis_client if settings.SINGLE_FLIGHT_REDIS_ENABLED else None,
+        )
+
+        # Setup coalescing of concurrent refreshes of the same itinerary
+        self.itinerary_refresh_flight = SingleFlight("itinerary_refresh")
+
+        # Setup coalescing of concurrent first requests for the details of the itineraries of a plan
+        self.itinerary_detail_flight = SingleFlight("itinerary_detail")
+
+    def _is_persisted_query_not_found(self, errors: list[OTPGraphQLError] | None) -> bool:
+        """Check whether the routing engine does not know a persisted query hash yet."""
+
+        return any(
+            error.message == "PersistedQueryNotFound"
+            or (error.extensions or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+            for error in errors or []
+        )
+
+    async def _send_graphql_request(
+        self,
+        payload: dict[str, any],
+        response_model: type[GraphQLResponseModel],
+        operation: str,
+    ) -> GraphQLResponseModel:
+        """Send a single GraphQL request to the routing engine and decode its response."""
+
+        # The backend pool picks a routing engine replica, hedging slow requests if enabled
+        with stage_timer(operation, "otp_request"):
+            try:
+                response = await open_trip_planner_backends.request(
+                    operation,
+                    lambda url: http_clients.get(Upstream.OPEN_TRIP_PLANNER).post(url, json=payload),
+                )
+            except NoBackendAvailable:
+                raise HTTPException(status_code=503, detail="Routing engine unavailable.")
+            except HTTPError:
+                raise HTTPException(status_code=502, detail="Routing request failed.")
+
+        # Responses are parsed and validated in a single pass from raw bytes
+        with stage_timer(operation, "decode"):
+            return response_model.model_validate_json(response.content)
+
+    async def _post_graphql_query(
+        self,
+        template: GraphQLTemplate,
+        variables: dict[str, any],
+        response_model: type[GraphQLResponseModel],
+        operation: str,
+    ) -> GraphQLResponseModel:
+        """Post a GraphQL query to the routing engine, as a persisted query if enabled."""
+
+        if not settings.OPEN_TRIP_PLANNER_PERSISTED_QUERIES:
+            return await self._send_graphql_request(
+                {"query": template.query, "variables": variables},
+                response_model,
+                operation,
+            )
+
+        # Send only the query hash, falling back to the full query if it is not yet known
+        extensions = {
+            "persistedQuery": {"version": 1, "sha256Hash": template.sha256_hash}
+        }
+        graphql_response = await self._send_graphql_request(
+            {"variables": variables, "extensions": extensions},
+            response_model,
+            operation,
+        )
+        if not self._is_persisted_query_not_found(graphql_response.errors):
+            return graphql_response
 
-        # Load GraphQL query template from file
-        request_template = self._load_graphql_template(
-            settings.OPEN_TRIP_PLANNER_PLAN_TEMPLATE
+        return await self._send_graphql_request(
+            {"query": template.query, "variables": variables, "extensions": extensions},
+            response_model,
+            operation,
         )
 
-        # Reformat request payload
+    def _build_plan_variables(self, request: RoutingPlanRequestModel) -> dict[str, any]:
+        """Build the GraphQL query variables for a plan request."""
+
         # Temporarily add 2 hrs to the request to work with UTC
         request_dict = OTPPlanRequestModel(
             date=request.date,
@@ -74,118 +179,729 @@ class OpenTripPlannerAdaptor:
                 OTPTransportMode(mode=mode) for mode in request.transport_modes
             ],
         ).model_dump()
-        request_dict = {to_camel_case(k): v for k, v in request_dict.items()}
+        return {to_camel_case(k): v for k, v in request_dict.items()}
+
+    def _build_transit_trip(self, leg: OTPLeg) -> TransitTrip | None:
+        """Reference the trip a transit leg rides, so that its realtime data can be refreshed."""
+
+        if not leg.transit_leg or leg.trip is None or leg.service_date is None:
+            return None
+        from_stop, to_stop = leg.from_.stop, leg.to.stop
+        if not (leg.trip.gtfs_id and from_stop and from_stop.gtfs_id and to_stop and to_stop.gtfs_id):
+            return None
+        return TransitTrip(
+            trip_id=leg.trip.gtfs_id,
+            service_date=leg.service_date,
+            from_stop_id=from_stop.gtfs_id,
+            to_stop_id=to_stop.gtfs_id,
+        )
+
+    async def _fetch_itineraries(
+        self, variables: dict[str, any], operation: str
+    ) -> list[ItineraryDetailed]:
+        """Fetch full itineraries for plan query variables from the routing engine."""
 
         # Make the request to the routing engine
-        router_response = await async_client.post(
-            settings.OPEN_TRIP_PLANNER_URL,
-            json={"query": request_template, "variables": request_dict},
+        graphql_response = await self._post_graphql_query(
+            graphql_templates.get(settings.OPEN_TRIP_PLANNER_PLAN_TEMPLATE),
+            variables,
+            OTPPlanGraphQLResponse,
+            operation=operation,
         )
 
+        if graphql_response.data is None:
+            raise HTTPException(status_code=502, detail="Routing request failed.")
+
         # Process routing engine response
-        router_response = OTPPlanResponseModel.model_validate(
-            router_response.json()["data"]["plan"]
+        router_response = graphql_response.data.plan
+
+        # Produce ItineraryDetailed models for full itinerary responses
+        with stage_timer(operation, "validation"):
+            return [
+                ItineraryDetailed(
+                    # Produce a unique ID for this itinerary and the journey it represents
+                    itinerary_id=str(uuid4()),
+                    duration=itinerary.duration,
+                    start_time=itinerary.start_time,
+                    end_time=itinerary.end_time,
+                    origin=Coordinates(
+                        lat=router_response.from_.lat, lon=router_response.from_.lon
+                    ),
+                    destination=Coordinates(
+                        lat=router_response.to.lat, lon=router_response.to.lon
+                    ),
+                    legs=[
+                        LegDetailed(
+                            mode=leg.mode,
+                            duration=int(leg.duration),
+                            distance=round(leg.distance),
+                            geometry=leg.leg_geometry.points,
+                            steps=[
+                                Step(
+                                    distance=step.distance,
+                                    lon=step.lon,
+                                    lat=step.lat,
+                                    relative_direction=step.relative_direction.value,
+                                    absolute_direction=step.absolute_direction.value,
+                                    street_name=step.street_name,
+                                    bogus_name=step.bogus_name,
+                                )
+                                for step in leg.steps
+                            ],
+                            start_time=leg.start_time,
+                            end_time=leg.end_time,
+                            departure_delay=leg.departure_delay,
+                            arrival_delay=leg.arrival_delay,
+                            real_time=leg.real_time,
+                            trip=self._build_transit_trip(leg),
+                        )
+                        for leg in itinerary.legs
+                    ],
+                )
+                for itinerary in router_response.itineraries
+            ]
+
+    async def _fetch_planned_itineraries(
+        self, request: RoutingPlanRequestModel
+    ) -> list[ItineraryPlanned]:
+        """Fetch itinerary summaries for a plan request, leaving out steps, stops and trips."""
+
+        variables = self._build_plan_variables(request)
+        graphql_response = await self._post_graphql_query(
+            graphql_templates.get(settings.OPEN_TRIP_PLANNER_SUMMARY_TEMPLATE),
+            variables,
+            OTPSummaryPlanGraphQLResponse,
+            operation="plan",
         )
 
-        # Build response
-        response = RoutingPlanResponseModel(itineraries=[])
+        if graphql_response.data is None:
+            raise HTTPException(status_code=502, detail="Routing request failed.")
 
-        # Write itineraries to cache
-        for itinerary in router_response.itineraries:
-            # Produce a unique ID for this itinerary and the journey it represents
-            itinerary_id = str(uuid4())
+        router_response = graphql_response.data.plan
+        with stage_timer("plan", "validation"):
+            return [
+                ItineraryPlanned(
+                    itinerary_id=str(uuid4()),
+                    duration=itinerary.duration,
+                    start_time=itinerary.start_time,
+                    end_time=itinerary.end_time,
+                    origin=Coordinates(
+                        lat=router_response.from_.lat, lon=router_response.from_.lon
+                    ),
+                    destination=Coordinates(
+                        lat=router_response.to.lat, lon=router_response.to.lon
+                    ),
+                    legs=[
+                        LegPlanned(
+                            mode=leg.mode,
+                            duration=int(leg.duration),
+                            distance=round(leg.distance),
+                            geometry=leg.leg_geometry.points,
+                            trip_id=leg.trip.gtfs_id if leg.trip is not None else None,
+                            service_date=leg.service_date,
+                        )
+                        for leg in itinerary.legs
+                    ],
+                    plan_variables=variables,
+                )
+                for itinerary in router_response.itineraries
+            ]
+
+    def _get_geometry_tolerance(self, request: RoutingPlanRequestModel) -> float:
+        """Get the tolerance in meters for simplifying the summary geometries of a request."""
 
-            # Produce ItineraryDetailed model for full itinerary response
-            itinerary_detailed = ItineraryDetailed(
-                itinerary_id=itinerary_id,
+        if request.geometry_tolerance is not None:
+            return request.geometry_tolerance
+        if request.geometry_zoom is not None:
+            return zoom_to_tolerance(request.geometry_zoom, request.origin.lat)
+        return settings.PLAN_GEOMETRY_TOLERANCE
+
+    def _summarize_itineraries(
+        self,
+        itineraries: list[ItineraryDetailed | ItineraryPlanned],
+        geometry_tolerance: float,
+    ) -> list[ItinerarySummary]:
+        """Produce the summaries of planned or full itineraries, with simplified leg geometries."""
+
+        # Full precision geometries remain in the cached itineraries
+        geometries = iter(
+            simplify_polylines(
+                [leg.geometry for itinerary in itineraries for leg in itinerary.legs],
+                geometry_tolerance,
+            )
+        )
+        return [
+            ItinerarySummary(
+                itinerary_id=itinerary.itinerary_id,
                 duration=itinerary.duration,
                 start_time=itinerary.start_time,
                 end_time=itinerary.end_time,
-                origin=Coordinates(
-                    lat=router_response.from_.lat, lon=router_response.from_.lon
-                ),
-                destination=Coordinates(
-                    lat=router_response.to.lat, lon=router_response.to.lon
-                ),
+                origin=itinerary.origin,
+                destination=itinerary.destination,
                 legs=[
-                    LegDetailed(
+                    LegSummary(
                         mode=leg.mode,
                         duration=int(leg.duration),
-                        distance=round(leg.distance),
-                        geometry=leg.leg_geometry.points,
-                        steps=[
-                            Step(
-                                distance=step.distance,
-                                lon=step.lon,
-                                lat=step.lat,
-                                relative_direction=step.relative_direction.value,
-                                absolute_direction=step.absolute_direction.value,
-                                street_name=step.street_name,
-                                bogus_name=step.bogus_name,
-                            )
-                            for step in leg.steps
-                        ],
+                        distance=leg.distance,
+                        geometry=next(geometries),
                     )
                     for leg in itinerary.legs
                 ],
             )
+            for itinerary in itineraries
+        ]
 
-            # Write the full journey to cache
-            serialized_mapping = {
-                k: json.dumps(v) if isinstance(v, (list, dict)) else v
-                for k, v in itinerary_detailed.model_dump(
-                    mode="json", exclude_none=True
-                ).items()
-            }
-            self.redis_client.hset(name=itinerary_id, mapping=serialized_mapping)
+    async def _fetch_plan(
+        self, request: RoutingPlanRequestModel, plan_cache_key: str
+    ) -> list[ItineraryDetailed | ItineraryPlanned]:
+        """Fetch itineraries from the routing engine and share them via the plan cache."""
 
-            # Consider the itinerary to be invalid past its start time
-            current_time = datetime.now()
-            if current_time < itinerary.end_time:
-                self.redis_client.expire(
-                    itinerary_id, (itinerary.end_time - current_time).seconds
-                )
+        if settings.OPEN_TRIP_PLANNER_LAZY_DETAILS:
+            itineraries = await self._fetch_planned_itineraries(request)
+        else:
+            itineraries = await self._fetch_itineraries(
+                self._build_plan_variables(request), operation="plan"
+            )
+        if settings.PLAN_CACHE_ENABLED:
+            with stage_timer("plan", "plan_cache_write"):
+                await self.plan_cache.set(plan_cache_key, itineraries)
+        return itineraries
+
+    async def _plan_itineraries(
+        self, request: RoutingPlanRequestModel
+    ) -> list[ItineraryDetailed | ItineraryPlanned]:
+        """Plan itineraries for a request and write them to the itinerary cache."""
+
+        plan_cache_key = self.plan_cache.build_key(request)
+
+        itineraries = None
+        if settings.PLAN_CACHE_ENABLED:
+            with stage_timer("plan", "plan_cache_read"):
+                itineraries = await self.plan_cache.get(plan_cache_key)
+
+        if itineraries is None:
+            # Identical concurrent requests share a single routing engine request,
+            # other workers can pick up the result from the plan cache
+            itineraries = await self.plan_flight.do(
+                plan_cache_key,
+                lambda: self._fetch_plan(request, plan_cache_key),
+                fetch_shared=(lambda: self.plan_cache.load(plan_cache_key))
+                if settings.PLAN_CACHE_ENABLED
+                else None,
+            )
+
+        # Itineraries shared with other requests still get unique IDs per request
+        itineraries = [
+            itinerary.model_copy(update={"itinerary_id": uuid4()})
+            for itinerary in itineraries
+        ]
+
+        # Write the journeys to cache, planned ones get their details once first requested
+        with stage_timer("plan", "redis_write"):
+            if settings.OPEN_TRIP_PLANNER_LAZY_DETAILS:
+                await self.itinerary_cache.write_planned(itineraries)
             else:
-                # TODO: Throw an exception & return an appropriate error response
-                print("Invalid itinerary start time.")
-
-            # Write an itinerary summary to the response
-            response.itineraries.append(
-                ItinerarySummary(
-                    itinerary_id=itinerary_detailed.itinerary_id,
-                    duration=itinerary_detailed.duration,
-                    start_time=itinerary_detailed.start_time,
-                    end_time=itinerary_detailed.end_time,
-                    origin=itinerary_detailed.origin,
-                    destination=itinerary_detailed.destination,
-                    legs=[
-                        LegSummary(
-                            mode=leg.mode,
-                            duration=int(leg.duration),
-                            distance=leg.distance,
-                            geometry=leg.geometry,
-                        )
-                        for leg in itinerary_detailed.legs
-                    ],
+                await self.itinerary_cache.write(itineraries)
+
+        return itineraries
+
+    async def make_plan_request(
+        self, request: RoutingPlanRequestModel
+    ) -> RoutingPlanResponseModel:
+        """Make a plan request to the OpenTripPlanner routing engine."""
+
+        itineraries = await self._plan_itineraries(request)
+
+        # Build response from itinerary summaries
+        with stage_timer("plan", "summarize"):
+            return RoutingPlanResponseModel(
+                itineraries=self._summarize_itineraries(
+                    itineraries, self._get_geometry_tolerance(request)
+                )
+            )
+
+    def _split_plan_request(
+        self, request: RoutingPlanRequestModel
+    ) -> list[RoutingPlanRequestModel]:
+        """Split a plan request into sub-requests that can be routed concurrently."""
+
+        # Direct modes are routed on their own, as these are usually answered fastest
+        direct_modes = [mode for mode in request.transport_modes if mode in DIRECT_MODES]
+        has_transit_modes = len(direct_modes) < len(request.transport_modes)
+        sub_requests = [
+            request.model_copy(update={"transport_modes": [mode]})
+            for mode in direct_modes
+        ]
+
+        # Transit is routed with all requested modes, to keep combined itineraries
+        if has_transit_modes:
+            sub_requests.append(request)
+        return sub_requests
+
+    def _get_itinerary_signature(
+        self, itinerary: ItineraryDetailed | ItineraryPlanned
+    ) -> tuple:
+        """Identify equivalent itineraries produced by different sub-requests."""
+
+        return (
+            itinerary.start_time,
+            itinerary.end_time,
+            tuple((leg.mode, leg.duration, leg.geometry) for leg in itinerary.legs),
+        )
+
+    async def stream_plan_request(
+        self, request: RoutingPlanRequestModel
+    ) -> AsyncIterator[RoutingPlanStreamItem]:
+        """Make concurrent plan requests per mode group, yielding itineraries as they arrive."""
+
+        async def plan_sub_request(sub_request: RoutingPlanRequestModel):
+            try:
+                return sub_request, await self._plan_itineraries(sub_request), None
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else "Routing request failed."
+                return sub_request, [], detail
+
+        tasks = [
+            asyncio.ensure_future(plan_sub_request(sub_request))
+            for sub_request in self._split_plan_request(request)
+        ]
+        geometry_tolerance = self._get_geometry_tolerance(request)
+        seen_signatures = set()
+        try:
+            for task in asyncio.as_completed(tasks):
+                sub_request, itineraries, error = await task
+                if error is not None:
+                    yield RoutingPlanStreamItem(
+                        transport_modes=sub_request.transport_modes, error=error
+                    )
+                for itinerary in itineraries:
+                    signature = self._get_itinerary_signature(itinerary)
+                    if signature in seen_signatures:
+                        continue
+                    seen_signatures.add(signature)
+                    yield RoutingPlanStreamItem(
+                        transport_modes=sub_request.transport_modes,
+                        itinerary=self._summarize_itineraries(
+                            [itinerary], geometry_tolerance
+                        )[0],
+                    )
+        finally:
+            # Stop outstanding sub-requests if the client goes away
+            for task in tasks:
+                task.cancel()
+
+    def batch_plan_requests(
+        self, requests: list[RoutingPlanRequestModel]
+    ) -> AsyncIterator[RoutingPlanBatchItem]:
+        """Make many plan requests with bounded concurrency, yielding results as they complete."""
+
+        # Validate the batch up front, before any results are streamed
+        if len(requests) > settings.ROUTING_BATCH_MAX_REQUESTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch may contain at most {settings.ROUTING_BATCH_MAX_REQUESTS} requests.",
+            )
+        return self._stream_batch_plan_requests(requests)
+
+    async def _stream_batch_plan_requests(
+        self, requests: list[RoutingPlanRequestModel]
+    ) -> AsyncIterator[RoutingPlanBatchItem]:
+        # Identical requests are only planned once
+        request_indices: dict[str, list[int]] = {}
+        for index, request in enumerate(requests):
+            request_indices.setdefault(request.model_dump_json(), []).append(index)
+
+        async def plan_batch_request(indices: list[int]):
+            # All batches on this worker share one limit, leaving capacity for interactive requests
+            async with self.batch_semaphore:
+                try:
+                    response = await self.make_plan_request(requests[indices[0]])
+                    return indices, response.itineraries, None
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else "Routing request failed."
+                    return indices, None, detail
+
+        tasks = [
+            asyncio.ensure_future(plan_batch_request(indices))
+            for indices in request_indices.values()
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                indices, itineraries, error = await task
+                for index in indices:
+                    yield RoutingPlanBatchItem(
+                        index=index,
+                        status=RoutingPlanBatchItemStatus.failed
+                        if error is not None
+                        else RoutingPlanBatchItemStatus.success,
+                        itineraries=itineraries,
+                        error=error,
+                    )
+        finally:
+            # Stop outstanding requests if the client goes away
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_travel_time(
+        self, variables: dict[str, any]
+    ) -> tuple[int | None, list[str]]:
+        """Fetch the duration and leg modes of the fastest itinerary between two places."""
+
+        graphql_response = await self._post_graphql_query(
+            graphql_templates.get(settings.OPEN_TRIP_PLANNER_TRAVEL_TIME_TEMPLATE),
+            variables,
+            OTPTravelTimeGraphQLResponse,
+            operation="matrix",
+        )
+        if graphql_response.data is None:
+            raise HTTPException(status_code=502, detail="Routing request failed.")
+
+        itineraries = graphql_response.data.plan["itineraries"]
+        if not itineraries:
+            return None, []
+        fastest = min(itineraries, key=lambda itinerary: itinerary["duration"])
+        return fastest["duration"], [leg["mode"].value for leg in fastest["legs"]]
+
+    async def make_matrix_request(
+        self, request: RoutingMatrixRequestModel
+    ) -> RoutingMatrixResponseModel:
+        """Route every origin to every destination per set of transport modes, reusing cached cells."""
+
+        shape = (len(request.transport_modes), len(request.origins), len(request.destinations))
+        if np.prod(shape) > settings.ROUTING_MATRIX_MAX_CELLS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A matrix may contain at most {settings.ROUTING_MATRIX_MAX_CELLS} cells.",
+            )
+
+        # Look up all layers in the cache, collecting the cells left to route
+        with stage_timer("matrix", "cache_read"):
+            layer_keys = [
+                self.travel_time_cache.build_keys(request, transport_modes)
+                for transport_modes in request.transport_modes
+            ]
+            found, durations, leg_modes = self.travel_time_cache.get(
+                [key for keys in layer_keys for key in keys]
+            )
+        found = found.reshape(shape)
+        durations = durations.reshape(shape)
+        leg_modes = leg_modes.reshape(*shape, MAX_LEGS)
+
+        # Cells snapped to the same grid cells are only routed once
+        missing_cells: dict[str, list[tuple[int, int, int]]] = {}
+        for layer, origin, destination in np.argwhere(~found).tolist():
+            key = layer_keys[layer][origin * shape[2] + destination]
+            missing_cells.setdefault(key, []).append((layer, origin, destination))
+
+        # Query variables are built once per layer, only the places change per cell
+        base_variables = [
+            self._build_plan_variables(
+                RoutingPlanRequestModel(
+                    origin=request.origins[0],
+                    destination=request.destinations[0],
+                    date=request.date,
+                    time=request.time,
+                    time_is_arrival=request.time_is_arrival,
+                    transport_modes=transport_modes,
+                    accessible=request.accessible,
+                    num_itineraries=settings.ROUTING_MATRIX_NUM_ITINERARIES,
                 )
             )
+            for transport_modes in request.transport_modes
+        ] if missing_cells else []
+
+        async def route_cell(key: str, cells: list[tuple[int, int, int]]):
+            layer, origin, destination = cells[0]
+            variables = {
+                **base_variables[layer],
+                "from": {"lat": request.origins[origin].lat, "lon": request.origins[origin].lon},
+                "to": {
+                    "lat": request.destinations[destination].lat,
+                    "lon": request.destinations[destination].lon,
+                },
+            }
+            # Matrices share the batch limit of this worker, leaving capacity for interactive requests
+            async with self.batch_semaphore:
+                try:
+                    duration, cell_leg_modes = await self._fetch_travel_time(variables)
+                    return key, cells, duration, cell_leg_modes, False
+                except Exception:
+                    return key, cells, None, [], True
 
-        return response
+        # Start from plain nested lists of the cached cells, without a model per cell
+        with stage_timer("matrix", "assemble"):
+            durations = np.where(
+                found & (durations != NO_ITINERARY), durations, None
+            ).tolist()
+            leg_modes = [
+                [
+                    [
+                        decode_leg_modes(codes) if duration is not None else None
+                        for duration, codes in zip(duration_row, codes_row)
+                    ]
+                    for duration_row, codes_row in zip(duration_layer, codes_layer)
+                ]
+                for duration_layer, codes_layer in zip(durations, leg_modes.tolist())
+            ]
+
+        tasks = [
+            asyncio.ensure_future(route_cell(key, cells)) for key, cells in missing_cells.items()
+        ]
+        failed_cells = 0
+        try:
+            for task in asyncio.as_completed(tasks):
+                key, cells, duration, cell_leg_modes, failed = await task
+                if failed:
+                    # Failed cells are not cached, so that they are routed again next time
+                    failed_cells += len(cells)
+                    continue
+                self.travel_time_cache.set(key, duration, cell_leg_modes)
+                modes = [Mode(mode) for mode in cell_leg_modes] if duration is not None else None
+                for layer, origin, destination in cells:
+                    durations[layer][origin][destination] = duration
+                    leg_modes[layer][origin][destination] = modes
+        finally:
+            # Stop outstanding requests if the client goes away
+            for task in tasks:
+                task.cancel()
+
+        return RoutingMatrixResponseModel.model_construct(
+            durations=durations, leg_modes=leg_modes, failed_cells=failed_cells
+        )
 
     async def get_itinerary(self, itinerary_id: str) -> ItineraryResponseModel:
         """Retrieve a full itinerary from the cache by its journey ID."""
 
-        # Fetch itinerary from cache
-        data = self.redis_client.hgetall(itinerary_id)
+        stored_itinerary = await self.get_itinerary_raw(itinerary_id)
+        return ItineraryResponseModel.model_validate_json(stored_itinerary.to_json())
 
-        # Decode
-        decoded_data = {k.decode(): v.decode() for k, v in data.items()}
+    def _get_itinerary_trips(self, itinerary: ItineraryDetailed | ItineraryPlanned) -> tuple:
+        """Identify an itinerary by the modes of its legs and the trips its transit legs ride."""
 
-        # Deserialize
-        deserialized_data = {
-            k: json.loads(v) if v.startswith("[") or v.startswith("{") else v
-            for k, v in decoded_data.items()
-        }
+        trips = []
+        for leg in itinerary.legs:
+            if isinstance(leg, LegDetailed):
+                trip = (leg.trip.trip_id, leg.trip.service_date) if leg.trip is not None else (None, None)
+            else:
+                trip = (leg.trip_id, leg.service_date)
+            trips.append((leg.mode, *trip))
+        return tuple(trips)
+
+    async def _replace_planned_itineraries(
+        self, planned_itineraries: list[ItineraryPlanned], itineraries: list[ItineraryDetailed]
+    ) -> dict[str, StoredItinerary]:
+        """Replace planned itineraries in the cache with the full itineraries of their plan."""
+
+        # Realtime updates can move itineraries, so they are matched by the trips they ride,
+        # taking the closest departure within the tolerance
+        candidates: dict[tuple, list[ItineraryDetailed]] = {}
+        for itinerary in itineraries:
+            candidates.setdefault(self._get_itinerary_trips(itinerary), []).append(itinerary)
+        details = []
+        unavailable_ids = []
+        for planned_itinerary in planned_itineraries:
+            trip_candidates = candidates.get(self._get_itinerary_trips(planned_itinerary), [])
+            offsets = {
+                index: abs((itinerary.start_time - planned_itinerary.start_time).total_seconds())
+                for index, itinerary in enumerate(trip_candidates)
+            }
+            index = min(offsets, key=offsets.get, default=None)
+            if index is None or offsets[index] > settings.OPEN_TRIP_PLANNER_DETAIL_MATCH_TOLERANCE:
+                unavailable_ids.append(str(planned_itinerary.itinerary_id))
+                continue
+            details.append(
+                trip_candidates.pop(index).model_copy(update={"itinerary_id": planned_itinerary.itinerary_id})
+            )
+
+        # Itineraries without a match are dropped, so that they are not planned again on every request
+        with stage_timer("itinerary_detail", "redis_write"):
+            return await self.itinerary_cache.replace_planned(details, unavailable_ids)
+
+    async def _fetch_plan_details(
+        self, plan_key: str, plan_variables: dict[str, any]
+    ) -> tuple[list[ItineraryDetailed], dict[str, StoredItinerary]]:
+        """Fetch the full details of a plan by planning it again, replacing all its planned itineraries."""
+
+        async with admission_control.admit("plan"):
+            itineraries = await self._fetch_itineraries(plan_variables, operation="itinerary_detail")
+        with stage_timer("itinerary_detail", "redis_read"):
+            planned_itineraries = await self.itinerary_cache.read_planned_plan(plan_key)
+        return itineraries, await self._replace_planned_itineraries(planned_itineraries, itineraries)
+
+    async def _fetch_itinerary_details(self, itinerary_id: str) -> StoredItinerary | None:
+        """Fetch the full details of a planned itinerary, along with the others of its plan."""
+
+        with stage_timer("itinerary_detail", "redis_read"):
+            planned_itinerary = await self.itinerary_cache.read_planned(itinerary_id)
+        if planned_itinerary is None:
+            # Its details may have just been fetched along with another itinerary of its plan
+            return await self.itinerary_cache.read_raw(itinerary_id)
+
+        # Concurrent first requests for any itinerary of the same plan share one request
+        plan_key = get_plan_key(planned_itinerary.plan_variables)
+        itineraries, stored_itineraries = await self.itinerary_detail_flight.do(
+            plan_key, lambda: self._fetch_plan_details(plan_key, planned_itinerary.plan_variables)
+        )
+
+        if itinerary_id not in stored_itineraries:
+            # Itineraries planned after the others of the plan were read are replaced on their own,
+            # others were found to be no longer available or were replaced by another worker
+            with stage_timer("itinerary_detail", "redis_read"):
+                still_planned = await self.itinerary_cache.read_planned(itinerary_id) is not None
+            if still_planned:
+                stored_itineraries = await self._replace_planned_itineraries([planned_itinerary], itineraries)
+            else:
+                stored_itineraries = {itinerary_id: await self.itinerary_cache.read_raw(itinerary_id)}
+        if stored_itineraries.get(itinerary_id) is None:
+            raise HTTPException(status_code=404, detail="Itinerary is no longer available.")
+        return stored_itineraries[itinerary_id]
+
+    async def _fetch_trip_stoptimes(
+        self, trip_id: str, service_date: str
+    ) -> list[OTPStoptime] | None:
+        """Fetch the current stop times of a trip on a service date from the routing engine."""
+
+        graphql_response = await self._post_graphql_query(
+            graphql_templates.get(settings.OPEN_TRIP_PLANNER_REFRESH_TEMPLATE),
+            {"tripId": trip_id, "serviceDate": service_date},
+            OTPTripGraphQLResponse,
+            operation="itinerary_refresh",
+        )
+        if graphql_response.data is None:
+            raise HTTPException(status_code=502, detail="Itinerary refresh failed.")
+
+        # Trips can disappear from the timetable, their legs are then left as they were
+        trip = graphql_response.data.trip
+        return trip.stoptimes_for_date if trip is not None else None
+
+    def _find_leg_stoptimes(
+        self, trip: TransitTrip, stoptimes: list[OTPStoptime]
+    ) -> tuple[OTPStoptime, OTPStoptime] | None:
+        """Find the stop times at which a leg boards and alights its trip."""
+
+        for index, boarding in enumerate(stoptimes):
+            if boarding.stop.gtfs_id != trip.from_stop_id:
+                continue
+            for alighting in stoptimes[index + 1 :]:
+                if alighting.stop.gtfs_id == trip.to_stop_id:
+                    return boarding, alighting
+        return None
+
+    def _apply_realtime_stoptimes(
+        self,
+        itinerary: ItineraryDetailed,
+        trip_stoptimes: dict[tuple[str, str], list[OTPStoptime] | None],
+    ) -> ItineraryDetailed:
+        """Patch the times and delays of transit legs with current stop times, moving the other legs along."""
+
+        legs = list(itinerary.legs)
+        leg_shifts: dict[int, tuple[timedelta, timedelta]] = {}
+        for index, leg in enumerate(legs):
+            if leg.trip is None or leg.start_time is None or leg.end_time is None:
+                continue
+            stoptimes = trip_stoptimes.get((leg.trip.trip_id, leg.trip.service_date))
+            leg_stoptimes = self._find_leg_stoptimes(leg.trip, stoptimes or [])
+            if leg_stoptimes is None:
+                continue
+
+            boarding, alighting = leg_stoptimes
+            start_time = datetime.fromtimestamp(boarding.service_day + boarding.realtime_departure)
+            end_time = datetime.fromtimestamp(alighting.service_day + alighting.realtime_arrival)
+            leg_shifts[index] = (start_time - leg.start_time, end_time - leg.end_time)
+            legs[index] = leg.model_copy(
+                update={
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "duration": int((end_time - start_time).total_seconds()),
+                    "departure_delay": boarding.departure_delay,
+                    "arrival_delay": alighting.arrival_delay,
+                    "real_time": boarding.realtime or alighting.realtime,
+                }
+            )
+
+        if not leg_shifts:
+            return itinerary
+
+        # Other legs keep their durations, following the preceding transit leg,
+        # or leading up to the first one
+        def get_shift(index: int) -> tuple[timedelta, timedelta]:
+            if index in leg_shifts:
+                return leg_shifts[index]
+            preceding = [i for i in leg_shifts if i < index]
+            if preceding:
+                shift = leg_shifts[max(preceding)][1]
+            else:
+                shift = leg_shifts[min(leg_shifts)][0]
+            return shift, shift
+
+        for index, leg in enumerate(legs):
+            if index in leg_shifts or leg.start_time is None or leg.end_time is None:
+                continue
+            start_shift, end_shift = get_shift(index)
+            legs[index] = leg.model_copy(
+                update={"start_time": leg.start_time + start_shift, "end_time": leg.end_time + end_shift}
+            )
+
+        start_time = itinerary.start_time + get_shift(0)[0]
+        end_time = itinerary.end_time + get_shift(len(legs) - 1)[1]
+        return itinerary.model_copy(
+            update={
+                "start_time": start_time,
+                "end_time": end_time,
+                "duration": int((end_time - start_time).total_seconds()),
+                "legs": legs,
+            }
+        )
+
+    async def _refresh_itinerary(self, itinerary_id: str) -> StoredItinerary:
+        stored_itinerary = await self.get_itinerary_raw(itinerary_id)
+        with stage_timer("itinerary_refresh", "validation"):
+            itinerary = ItineraryDetailed.model_validate_json(stored_itinerary.to_json())
+
+        # Only the trips of transit legs are queried, each once
+        trips = list(
+            dict.fromkeys(
+                (leg.trip.trip_id, leg.trip.service_date)
+                for leg in itinerary.legs
+                if leg.trip is not None
+            )
+        )
+        if not trips:
+            return stored_itinerary
+        async with admission_control.admit("plan"):
+            stoptimes = await asyncio.gather(
+                *[self._fetch_trip_stoptimes(trip_id, service_date) for trip_id, service_date in trips]
+            )
+
+        with stage_timer("itinerary_refresh", "patch"):
+            refreshed_itinerary = self._apply_realtime_stoptimes(itinerary, dict(zip(trips, stoptimes)))
+
+        # Unchanged itineraries are not rewritten, so that they keep their ETag
+        if refreshed_itinerary == itinerary:
+            return stored_itinerary
+        with stage_timer("itinerary_refresh", "redis_write"):
+            updated_itinerary = await self.itinerary_cache.update(refreshed_itinerary)
+        if updated_itinerary is None:
+            raise HTTPException(status_code=404, detail="Itinerary not found.")
+        return updated_itinerary
+
+    async def refresh_itinerary_raw(self, itinerary_id: str) -> StoredItinerary:
+        """Refresh the realtime data of a cached itinerary in place, keeping its ID."""
+
+        return await self.itinerary_refresh_flight.do(
+            itinerary_id, lambda: self._refresh_itinerary(itinerary_id)
+        )
+
+    async def get_itinerary_raw(self, itinerary_id: str) -> StoredItinerary:
+        """Retrieve a full itinerary from the cache as stored, without validating it."""
+
+        with stage_timer("itinerary", "redis_read"):
+            stored_itinerary = await self.itinerary_cache.read_raw(itinerary_id)
 
-        # Validate and return the full itinerary
-        return ItineraryResponseModel.model_validate(deserialized_data)
+        # Planned itineraries get their details when they are first requested,
+        # also if they were planned before lazy details were switched off
+        if stored_itinerary is None:
+            stored_itinerary = await self._fetch_itinerary_details(itinerary_id)
+        if stored_itinerary is None:
+            raise HTTPException(status_code=404, detail="Itinerary not found.")
+        return stored_itinerary
@@ -0,0 +1,133 @@
+from datetime import datetime
+import asyncio
+import pytest
+from core.config import settings
+from schemas.coordinates import Coordinates
+from schemas.geocoding import GeocodingAutocompleteRequestModel, SupportedGeocodingProviders
+from schemas.place import Place, PlaceType
+from services.adaptors.geocoding import GeocodingAdaptor
+
+PELIAS = SupportedGeocodingProviders.PELIAS
+LOCAL = SupportedGeocodingProviders.LOCAL
+
+
+def build_place(name: str, address: str | None = None, lat: float = 49.44, lon: float = 7.76) -> Place:
+    return Place(
+        id=f"{name}:{lat}:{lon}",
+        name=name,
+        address=address or f"{name}, Kaiserslautern",
+        type=PlaceType.ADDRESS,
+        coordinates=Coordinates(lat=lat, lon=lon),
+    )
+
+
+def build_request(limit: int = 5) -> GeocodingAutocompleteRequestModel:
+    return GeocodingAutocompleteRequestModel(query="Markt", timestamp=datetime.now(), limit=limit)
+
+
+@pytest.fixture
+def adaptor(monkeypatch) -> GeocodingAdaptor:
+    monkeypatch.setattr(settings, "GEOCODING_RACE_DEADLINE", 0.05)
+    return GeocodingAdaptor([PELIAS, LOCAL], "http://pelias.test/", "key")
+
+
+def answer(adaptor: GeocodingAdaptor, monkeypatch, answers: dict):
+    """Let each provider answer after a delay with places, or fail with an error."""
+
+    async def get_autocomplete_places(provider, request):
+        delay, result = answers[provider]
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(adaptor, "_get_autocomplete_places", get_autocomplete_places)
+
+
+def get_results(adaptor: GeocodingAdaptor, provider: SupportedGeocodingProviders) -> dict[str, int]:
+    stats = adaptor.stats()[provider.value]
+    return {result: stats[result] for result in ("won", "merged", "empty", "late", "failed") if stats[result]}
+
+
+async def test_places_of_providers_answering_by_the_deadline_are_merged(adaptor, monkeypatch):
+    answer(
+        adaptor,
+        monkeypatch,
+        {
+            PELIAS: (0.01, [build_place("Markt"), build_place("Marktplatz")]),
+            LOCAL: (0, [build_place("Marktstraße")]),
+        },
+    )
+    places = await adaptor._race_autocomplete_places(build_request())
+
+    # The preferred provider comes first, however fast the others answered
+    assert [place.name for place in places] == ["Markt", "Marktplatz", "Marktstraße"]
+    assert (get_results(adaptor, PELIAS), get_results(adaptor, LOCAL)) == ({"won": 1}, {"merged": 1})
+
+
+async def test_race_ends_once_a_provider_has_enough_places(adaptor, monkeypatch):
+    answer(
+        adaptor,
+        monkeypatch,
+        {
+            PELIAS: (1.0, []),
+            LOCAL: (0, [build_place(f"Markt {index}") for index in range(5)]),
+        },
+    )
+    places = await asyncio.wait_for(adaptor._race_autocomplete_places(build_request()), timeout=0.5)
+
+    assert len(places) == 5
+    assert (get_results(adaptor, PELIAS), get_results(adaptor, LOCAL)) == ({"late": 1}, {"won": 1})
+
+
+async def test_failed_providers_leave_the_race_to_the_others(adaptor, monkeypatch):
+    answer(
+        adaptor,
+        monkeypatch,
+        {
+            PELIAS: (0, RuntimeError("Unexpected response")),
+            LOCAL: (0.01, [build_place("Markt")]),
+        },
+    )
+    places = await adaptor._race_autocomplete_places(build_request())
+
+    assert [place.name for place in places] == ["Markt"]
+    assert (get_results(adaptor, PELIAS), get_results(adaptor, LOCAL)) == ({"failed": 1}, {"won": 1})
+
+
+async def test_requests_fail_with_the_preferred_error_once_every_provider_failed(adaptor, monkeypatch):
+    error = RuntimeError("Unexpected response")
+    answer(adaptor, monkeypatch, {PELIAS: (0.01, error), LOCAL: (0, ValueError("No index"))})
+
+    with pytest.raises(RuntimeError) as exception_info:
+        await adaptor._race_autocomplete_places(build_request())
+    assert exception_info.value is error
+
+
+def test_duplicate_places_of_other_providers_are_dropped(adaptor):
+    places = adaptor._merge_places(
+        {
+            PELIAS: [build_place("Markt", "Markt 1, Kaiserslautern"), build_place("Rathaus")],
+            LOCAL: [
+                build_place("Marktplatz", "markt 1,  KAISERSLAUTERN", lat=49.5),
+                build_place("rathaus", lat=49.4402),
+                build_place("Rathaus", "Rathaus, Otterberg", lat=49.5),
+                build_place("Stiftskirche"),
+            ],
+        },
+        limit=None,
+    )
+    assert [(place.name, place.coordinates.lat) for place in places] == [
+        ("Markt", 49.44),
+        ("Rathaus", 49.44),
+        ("Rathaus", 49.5),
+        ("Stiftskirche", 49.44),
+    ]
+
+
+def test_merged_places_are_limited(adaptor):
+    places = adaptor._merge_places(
+        {PELIAS: [build_place("Markt")], LOCAL: [build_place(f"Markt {index}") for index in range(5)]},
+        limit=3,
+    )
+    assert [place.name for place in places] == ["Markt", "Markt 0", "Markt 1"]
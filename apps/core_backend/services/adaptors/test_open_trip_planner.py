@@ -0,0 +1,305 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+from fastapi import HTTPException
+import httpx
+import pytest
+from core.admission import AdmissionControl
+from core.backend_pool import NoBackendAvailable
+from core.config import settings
+from schemas.routing import ItineraryDetailed, ItineraryPlanned, LegDetailed, TransitTrip
+from services.adaptors.open_trip_planner import OpenTripPlannerAdaptor
+from services.cache.itinerary import ItineraryCache
+from services.schemas.open_trip_planner import OTPStoptime
+
+SERVICE_DATE = "2030-03-17"
+SERVICE_DAY = datetime(2030, 3, 17)
+START_TIME = SERVICE_DAY + timedelta(hours=8)
+
+
+def build_leg(mode: str, start_time: datetime, duration: int, trip_id: str | None = None) -> LegDetailed:
+    return LegDetailed(
+        mode=mode,
+        duration=duration,
+        distance=duration,
+        geometry="_p~iF~ps|U",
+        steps=[],
+        start_time=start_time,
+        end_time=start_time + timedelta(seconds=duration),
+        trip=TransitTrip(trip_id=trip_id, service_date=SERVICE_DATE, from_stop_id="1:a", to_stop_id="1:b")
+        if trip_id
+        else None,
+    )
+
+
+def build_itinerary(
+    start_time: datetime = START_TIME, modes: tuple[str, ...] = ("WALK", "BUS", "WALK"), trip: str = "trip"
+):
+    legs = []
+    leg_start_time = start_time
+    for index, mode in enumerate(modes):
+        legs.append(build_leg(mode, leg_start_time, 300, trip_id=f"1:{trip}{index}" if mode == "BUS" else None))
+        leg_start_time += timedelta(seconds=300)
+    return ItineraryDetailed(
+        itinerary_id=uuid4(),
+        duration=300 * len(modes),
+        start_time=start_time,
+        end_time=leg_start_time,
+        origin={"lat": 49.44, "lon": 7.76},
+        destination={"lat": 49.45, "lon": 7.77},
+        legs=legs,
+    )
+
+
+def build_stoptime(stop_id: str, scheduled: datetime, delay: int) -> OTPStoptime:
+    seconds = int((scheduled - SERVICE_DAY).total_seconds())
+    return OTPStoptime(
+        stop={"gtfsId": stop_id},
+        serviceDay=int(SERVICE_DAY.timestamp()),
+        scheduledArrival=seconds,
+        realtimeArrival=seconds + delay,
+        arrivalDelay=delay,
+        scheduledDeparture=seconds,
+        realtimeDeparture=seconds + delay,
+        departureDelay=delay,
+        realtime=delay != 0,
+    )
+
+
+@pytest.fixture
+def adaptor(redis_client) -> OpenTripPlannerAdaptor:
+    adaptor = OpenTripPlannerAdaptor()
+    adaptor.itinerary_cache = ItineraryCache(redis_client)
+    return adaptor
+
+
+def test_realtime_stoptimes_move_transit_legs_and_their_neighbours(adaptor):
+    itinerary = build_itinerary()
+    bus = itinerary.legs[1]
+    stoptimes = [
+        build_stoptime("1:z", bus.start_time - timedelta(minutes=5), 60),
+        build_stoptime("1:a", bus.start_time, 120),
+        build_stoptime("1:b", bus.end_time, 180),
+    ]
+
+    refreshed = adaptor._apply_realtime_stoptimes(itinerary, {("1:trip1", SERVICE_DATE): stoptimes})
+
+    walk_before, bus, walk_after = refreshed.legs
+    assert bus.start_time == START_TIME + timedelta(seconds=300 + 120)
+    assert bus.end_time == START_TIME + timedelta(seconds=600 + 180)
+    assert (bus.duration, bus.departure_delay, bus.arrival_delay, bus.real_time) == (360, 120, 180, True)
+
+    # Walking legs keep their durations, leading up to and following the bus
+    assert walk_before.start_time == START_TIME + timedelta(seconds=120)
+    assert walk_after.start_time == bus.end_time
+    assert walk_after.end_time - walk_after.start_time == timedelta(seconds=300)
+    assert refreshed.start_time == START_TIME + timedelta(seconds=120)
+    assert refreshed.end_time == START_TIME + timedelta(seconds=900 + 180)
+    assert refreshed.duration == 900 + 60
+
+
+def test_legs_of_trips_without_stoptimes_are_left_as_they_were(adaptor):
+    itinerary = build_itinerary()
+    assert adaptor._apply_realtime_stoptimes(itinerary, {("1:trip1", SERVICE_DATE): None}) is itinerary
+
+    # Stops served in the wrong order do not match the leg either
+    bus = itinerary.legs[1]
+    stoptimes = [build_stoptime("1:b", bus.start_time, 0), build_stoptime("1:a", bus.end_time, 0)]
+    assert adaptor._find_leg_stoptimes(bus.trip, stoptimes) is None
+
+
+async def test_refresh_rewrites_changed_itineraries_under_their_id(adaptor, monkeypatch):
+    itinerary = build_itinerary(start_time=datetime.now().replace(microsecond=0) + timedelta(hours=1))
+    await adaptor.itinerary_cache.write([itinerary])
+    stored = await adaptor.get_itinerary_raw(str(itinerary.itinerary_id))
+    bus = itinerary.legs[1]
+    delays = {"delay": 0}
+
+    async def fetch_trip_stoptimes(trip_id: str, service_date: str):
+        return [
+            build_stoptime("1:a", bus.start_time, delays["delay"]),
+            build_stoptime("1:b", bus.end_time, delays["delay"]),
+        ]
+
+    monkeypatch.setattr(adaptor, "_fetch_trip_stoptimes", fetch_trip_stoptimes)
+
+    # Unchanged itineraries keep their entity tag
+    unchanged = await adaptor.refresh_itinerary_raw(str(itinerary.itinerary_id))
+    assert unchanged.etag == stored.etag
+
+    delays["delay"] = 240
+    refreshed = await adaptor.refresh_itinerary_raw(str(itinerary.itinerary_id))
+    assert refreshed.etag != stored.etag
+    cached = await adaptor.itinerary_cache.read(str(itinerary.itinerary_id))
+    assert cached.itinerary_id == itinerary.itinerary_id
+    assert cached.legs[1].departure_delay == 240
+    assert cached.end_time == itinerary.end_time + timedelta(seconds=240)
+
+
+@pytest.mark.parametrize(
+    "error, status_code",
+    [
+        (httpx.HTTPStatusError("", request=None, response=httpx.Response(503)), 502),
+        (httpx.ConnectError("Connection refused"), 502),
+        (NoBackendAvailable(), 503),
+    ],
+)
+async def test_failed_routing_engine_requests_are_upstream_errors(adaptor, monkeypatch, error, status_code):
+    async def request(operation, send):
+        raise error
+
+    monkeypatch.setattr("services.adaptors.open_trip_planner.open_trip_planner_backends.request", request)
+    with pytest.raises(HTTPException) as exception_info:
+        await adaptor._send_graphql_request({}, ItineraryDetailed, operation="plan")
+    assert exception_info.value.status_code == status_code
+
+
+PLAN_VARIABLES = {"date": "2030-03-17", "time": "10:00:00", "numItineraries": 3}
+
+
+def build_planned(itinerary: ItineraryDetailed, plan_variables: dict = PLAN_VARIABLES) -> ItineraryPlanned:
+    return ItineraryPlanned(
+        **itinerary.model_dump(exclude={"legs"}),
+        legs=[
+            {
+                **leg.model_dump(include={"mode", "duration", "distance", "geometry"}),
+                "trip_id": leg.trip.trip_id if leg.trip else None,
+                "service_date": leg.trip.service_date if leg.trip else None,
+            }
+            for leg in itinerary.legs
+        ],
+        plan_variables=plan_variables,
+    )
+
+
+class RoutingEngine:
+    """Answers plan queries with the same itineraries under new IDs, as a repeated query would."""
+
+    def __init__(self, itineraries: list[ItineraryDetailed]):
+        self.itineraries = itineraries
+        self.requests = 0
+
+    async def fetch_itineraries(self, variables: dict, operation: str) -> list[ItineraryDetailed]:
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return [itinerary.model_copy(update={"itinerary_id": uuid4()}) for itinerary in self.itineraries]
+
+
+async def plan_lazily(adaptor, monkeypatch, count: int = 3) -> tuple[RoutingEngine, list[ItineraryPlanned]]:
+    start_time = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    itineraries = [
+        build_itinerary(start_time + timedelta(minutes=10 * index), trip=f"trip{index}-") for index in range(count)
+    ]
+    engine = RoutingEngine(itineraries)
+    monkeypatch.setattr(adaptor, "_fetch_itineraries", engine.fetch_itineraries)
+
+    planned_itineraries = [build_planned(itinerary) for itinerary in itineraries]
+    await adaptor.itinerary_cache.write_planned(planned_itineraries)
+    return engine, planned_itineraries
+
+
+async def test_first_request_fills_in_every_planned_itinerary_of_the_plan(adaptor, monkeypatch):
+    engine, planned_itineraries = await plan_lazily(adaptor, monkeypatch)
+
+    for planned_itinerary in planned_itineraries:
+        stored = await adaptor.get_itinerary_raw(str(planned_itinerary.itinerary_id))
+        itinerary = ItineraryDetailed.model_validate_json(stored.to_json())
+        assert itinerary.itinerary_id == planned_itinerary.itinerary_id
+        assert itinerary.start_time == planned_itinerary.start_time
+        assert itinerary.legs[1].trip is not None
+
+    assert engine.requests == 1
+    assert await adaptor.itinerary_cache.read_planned(str(planned_itineraries[0].itinerary_id)) is None
+
+
+async def test_concurrent_first_requests_for_a_plan_share_one_request(adaptor, monkeypatch):
+    engine, planned_itineraries = await plan_lazily(adaptor, monkeypatch)
+
+    # Other plans are fetched on their own
+    [other_itinerary] = engine.itineraries[:1]
+    other_planned = build_planned(other_itinerary.model_copy(update={"itinerary_id": uuid4()}), {"other": True})
+    await adaptor.itinerary_cache.write_planned([other_planned])
+
+    stored_itineraries = await asyncio.gather(
+        *[
+            adaptor.get_itinerary_raw(str(itinerary.itinerary_id))
+            for itinerary in [*planned_itineraries, *planned_itineraries, other_planned]
+        ]
+    )
+    assert len(stored_itineraries) == 7
+    assert engine.requests == 2
+    assert adaptor.itinerary_detail_flight.stats()["coalesced_calls"] == 5
+
+
+async def test_itineraries_moved_by_realtime_updates_are_found_by_their_trips(adaptor, monkeypatch):
+    engine, planned_itineraries = await plan_lazily(adaptor, monkeypatch)
+    delayed = build_itinerary(engine.itineraries[0].start_time + timedelta(minutes=4), trip="trip0-")
+    engine.itineraries[0] = delayed
+
+    stored = await adaptor.get_itinerary_raw(str(planned_itineraries[0].itinerary_id))
+    itinerary = ItineraryDetailed.model_validate_json(stored.to_json())
+    assert itinerary.itinerary_id == planned_itineraries[0].itinerary_id
+    assert itinerary.start_time == delayed.start_time
+
+
+async def test_itineraries_missing_from_the_new_plan_are_not_found_again(adaptor, monkeypatch):
+    engine, planned_itineraries = await plan_lazily(adaptor, monkeypatch)
+
+    # The first itinerary now rides another trip, the second is delayed beyond the tolerance
+    engine.itineraries[0] = build_itinerary(engine.itineraries[0].start_time, trip="other")
+    engine.itineraries[1] = build_itinerary(engine.itineraries[1].start_time + timedelta(hours=1), trip="trip1-")
+
+    for planned_itinerary in planned_itineraries[:2]:
+        with pytest.raises(HTTPException) as exception_info:
+            await adaptor.get_itinerary_raw(str(planned_itinerary.itinerary_id))
+        assert exception_info.value.status_code == 404
+        assert await adaptor.itinerary_cache.read_planned(str(planned_itinerary.itinerary_id)) is None
+
+    # The rest of the plan was filled in by the same request
+    await adaptor.get_itinerary_raw(str(planned_itineraries[2].itinerary_id))
+    assert engine.requests == 1
+
+
+async def test_unknown_itineraries_are_not_found(adaptor, monkeypatch):
+    engine, _ = await plan_lazily(adaptor, monkeypatch)
+    with pytest.raises(HTTPException) as exception_info:
+        await adaptor.get_itinerary_raw(str(uuid4()))
+    assert exception_info.value.status_code == 404
+    assert engine.requests == 0
+
+
+async def test_first_requests_for_details_are_admitted_like_plans(adaptor, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "ADMISSION_PLAN_QUEUE_SIZE", 2)
+    monkeypatch.setattr("services.adaptors.open_trip_planner.admission_control", AdmissionControl())
+    engine, _ = await plan_lazily(adaptor, monkeypatch, count=1)
+
+    active = {"requests": 0, "max": 0}
+    fetch_itineraries = engine.fetch_itineraries
+
+    async def count_itineraries(variables, operation):
+        active["requests"] += 1
+        active["max"] = max(active["max"], active["requests"])
+        try:
+            return await fetch_itineraries(variables, operation)
+        finally:
+            active["requests"] -= 1
+
+    monkeypatch.setattr(adaptor, "_fetch_itineraries", count_itineraries)
+
+    # Each of another plan, so that none of them are coalesced
+    planned_itineraries = [
+        build_planned(engine.itineraries[0].model_copy(update={"itinerary_id": uuid4()}), {"plan": index})
+        for index in range(8)
+    ]
+    await adaptor.itinerary_cache.write_planned(planned_itineraries)
+    results = await asyncio.gather(
+        *[adaptor.get_itinerary_raw(str(itinerary.itinerary_id)) for itinerary in planned_itineraries],
+        return_exceptions=True,
+    )
+
+    assert active["max"] == 2
+    assert engine.requests == 4
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert [result.status_code for result in rejected] == [503] * 4
+    assert rejected[0].headers["Retry-After"] == str(settings.ADMISSION_RETRY_AFTER)
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+from pydantic import TypeAdapter
+from redis.asyncio import Redis
+from core.config import settings
+from core.utils import normalize_text, to_geohash
+from schemas.coordinates import Coordinates
+from schemas.place import Place
+import json
+import time
+
+places_adapter = TypeAdapter(list[Place])
+
+
+class AutocompleteCacheEntry:
+    def __init__(self, places: list[Place], complete: bool, expires_at: float):
+        self.places = places
+        # Whether places contains every match for the query, not just a page of them
+        self.complete = complete
+        self.expires_at = expires_at
+
+
+class AutocompleteCache:
+    """Two-tier autocomplete cache, an in-process LRU backed by an optional shared Redis tier.
+
+    Longer queries can be answered from the results of a shorter prefix, as long as the
+    provider returned every match for that prefix.
+    """
+
+    def __init__(self, namespace: str, redis_client: Redis | None = None):
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.entries: OrderedDict[str, AutocompleteCacheEntry] = OrderedDict()
+        self.hits = {"memory": 0, "memory_prefix": 0, "redis": 0, "redis_prefix": 0}
+        self.misses = 0
+
+    def build_key(
+        self,
+        query: str,
+        focus_point: Coordinates | None,
+        limit: int | None,
+        layers: str | None,
+    ) -> str:
+        """Build a cache key from normalized query text, focus area, result limit and layers."""
+
+        focus_area = (
+            to_geohash(
+                focus_point.lat,
+                focus_point.lon,
+                settings.AUTOCOMPLETE_CACHE_GEOHASH_PRECISION,
+            )
+            if focus_point
+            else "-"
+        )
+        return (
+            f"autocomplete:{self.namespace}:{layers or '-'}:{focus_area}:{limit or '-'}:"
+            f"{normalize_text(query)}"
+        )
+
+    def _prefix_keys(
+        self,
+        query: str,
+        focus_point: Coordinates | None,
+        limit: int | None,
+        layers: str | None,
+    ) -> list[str]:
+        """Build the keys of all shorter prefixes of a query, longest first."""
+
+        query = normalize_text(query)
+        return [
+            self.build_key(query[:length], focus_point, limit, layers)
+            for length in range(
+                len(query) - 1, settings.AUTOCOMPLETE_CACHE_MIN_PREFIX_LENGTH - 1, -1
+            )
+            if query[length - 1] != " "
+        ]
+
+    def _filter_places(self, places: list[Place], query: str) -> list[Place]:
+        """Keep places where every query token is a prefix of a token of the place."""
+
+        query_tokens = normalize_text(query).split()
+        filtered_places = []
+        for place in places:
+            place_tokens = normalize_text(f"{place.name} {place.address}").split()
+            if all(
+                any(place_token.startswith(query_token) for place_token in place_tokens)
+                for query_token in query_tokens
+            ):
+                filtered_places.append(place)
+        return filtered_places
+
+    def _get_memory(self, key: str) -> AutocompleteCacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _set_memory(self, key: str, entry: AutocompleteCacheEntry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > settings.AUTOCOMPLETE_CACHE_SIZE:
+            self.entries.popitem(last=False)
+
+    def _serialize(self, entry: AutocompleteCacheEntry) -> str:
+        return json.dumps(
+            {
+                "complete": entry.complete,
+                "places": places_adapter.dump_python(entry.places, mode="json"),
+            }
+        )
+
+    def _deserialize(self, data: bytes) -> AutocompleteCacheEntry:
+        data = json.loads(data)
+        return AutocompleteCacheEntry(
+            places=places_adapter.validate_python(data["places"]),
+            complete=data["complete"],
+            expires_at=time.monotonic() + settings.AUTOCOMPLETE_CACHE_TTL,
+        )
+
+    async def get(
+        self,
+        query: str,
+        focus_point: Coordinates | None,
+        limit: int | None,
+        layers: str | None,
+    ) -> list[Place] | None:
+        """Find cached places for a query, directly or by filtering a complete prefix result."""
+
+        key = self.build_key(query, focus_point, limit, layers)
+        prefix_keys = self._prefix_keys(query, focus_point, limit, layers)
+
+        # Check the in-process tier
+        entry = self._get_memory(key)
+        if entry is not None:
+            self.hits["memory"] += 1
+            return entry.places
+        for prefix_key in prefix_keys:
+            entry = self._get_memory(prefix_key)
+            if entry is not None and entry.complete:
+                self.hits["memory_prefix"] += 1
+                return self._filter_places(entry.places, query)
+
+        # Check the shared tier for the query and all its prefixes in a single round trip
+        if self.redis_client is not None:
+            values = await self.redis_client.mget([key, *prefix_keys])
+            for index, value in enumerate(values):
+                if value is None:
+                    continue
+                entry = self._deserialize(value)
+                if index == 0:
+                    self._set_memory(key, entry)
+                    self.hits["redis"] += 1
+                    return entry.places
+                if entry.complete:
+                    self._set_memory(prefix_keys[index - 1], entry)
+                    self.hits["redis_prefix"] += 1
+                    return self._filter_places(entry.places, query)
+
+        self.misses += 1
+        return None
+
+    async def set(
+        self,
+        query: str,
+        focus_point: Coordinates | None,
+        limit: int | None,
+        layers: str | None,
+        places: list[Place],
+        complete: bool,
+    ):
+        """Store the places returned by the provider for a query."""
+
+        key = self.build_key(query, focus_point, limit, layers)
+        entry = AutocompleteCacheEntry(
+            places=places,
+            complete=complete,
+            expires_at=time.monotonic() + settings.AUTOCOMPLETE_CACHE_TTL,
+        )
+        self._set_memory(key, entry)
+        if self.redis_client is not None:
+            await self.redis_client.set(
+                key, self._serialize(entry), ex=settings.AUTOCOMPLETE_CACHE_TTL
+            )
+
+    def stats(self) -> dict[str, any]:
+        """Produce hit and miss counters for this worker."""
+
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0,
+        }
@@ -0,0 +1,484 @@
+from datetime import datetime
+from typing import Any, Sequence
+from uuid import UUID
+from pydantic_core import to_jsonable_python
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from core.config import settings
+from core.metrics import itinerary_cache_reads, itinerary_cache_writes, itinerary_cache_evictions
+from schemas.routing import ItineraryBase, ItineraryDetailed, ItineraryPlanned, ItineraryResponseModel
+import gzip
+import hashlib
+import json
+import struct
+import time
+import zlib
+
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+
+# Itineraries are kept under their ID in a namespace of their own, apart from internal keys
+ITINERARY_KEY_PREFIX = "itinerary:"
+
+# Planned itineraries are kept under their own keys until their details are fetched,
+# along with the IDs of the planned itineraries of each plan
+PLANNED_ITINERARY_KEY_PREFIX = "planned_itinerary:"
+PLANNED_PLAN_KEY_PREFIX = "planned_plan:"
+
+# Itinerary IDs refer to a body stored once under the hash of its contents, along with
+# the expiry times and sizes of all bodies for keeping to the memory budget
+BODY_KEY_PREFIX = "itinerary_body:"
+BODY_EXPIRY_KEY = "itinerary_bodies:expiry"
+BODY_SIZES_KEY = "itinerary_bodies:sizes"
+BODY_TOTAL_SIZE_KEY = "itinerary_bodies:total_size"
+
+# Bodies are serialized with a placeholder ID, which is replaced by the ID referring to them
+ID_PLACEHOLDER = UUID(int=0)
+ID_PREFIX = b'{"itinerary_id":"'
+ID_END = len(ID_PREFIX) + len(str(ID_PLACEHOLDER))
+
+# Compressed bodies keep everything up to the ID in a stored deflate block after the gzip header
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+GZIP_ID_OFFSET = len(GZIP_HEADER) + 5 + len(ID_PREFIX)
+
+
+def compress_body(data: bytes) -> bytes:
+    """Gzip a body, leaving its ID uncompressed so that it can be replaced in place."""
+
+    head, tail = data[:ID_END], data[ID_END:]
+    compressor = zlib.compressobj(
+        settings.ITINERARY_CACHE_COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS
+    )
+    return b"".join(
+        [
+            GZIP_HEADER,
+            struct.pack("<BHH", 0, len(head), len(head) ^ 0xFFFF),
+            head,
+            compressor.compress(tail),
+            compressor.flush(),
+            struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF),
+        ]
+    )
+
+
+def patch_body_id(body: bytes, itinerary_id: str) -> bytes:
+    """Replace the placeholder ID of a stored body, without decompressing it."""
+
+    new_id = itinerary_id.encode()
+    if body[:2] != GZIP_MAGIC_NUMBER:
+        return b"".join([ID_PREFIX, new_id, body[ID_END:]])
+
+    # CRC-32 is affine, replacing bytes changes the checksum by the checksum of their
+    # difference, less the checksum of as many zeros
+    size = int.from_bytes(body[-4:], "little")
+    difference = bytearray(size)
+    difference[len(ID_PREFIX) : ID_END] = bytes(
+        a ^ b for a, b in zip(str(ID_PLACEHOLDER).encode(), new_id)
+    )
+    crc = (
+        int.from_bytes(body[-8:-4], "little")
+        ^ zlib.crc32(difference)
+        ^ zlib.crc32(bytes(size))
+    )
+    return b"".join(
+        [
+            body[:GZIP_ID_OFFSET],
+            new_id,
+            body[GZIP_ID_OFFSET + len(new_id) : -8],
+            struct.pack("<I", crc),
+            body[-4:],
+        ]
+    )
+
+
+def get_plan_key(plan_variables: dict[str, Any]) -> str:
+    """Identify a plan by a hash of its query variables."""
+
+    data = json.dumps(to_jsonable_python(plan_variables), sort_keys=True).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def parse_itinerary_id(itinerary_id: str) -> str | None:
+    """Normalize an itinerary ID, returning None if it is not a UUID."""
+
+    try:
+        return str(UUID(itinerary_id))
+    except ValueError:
+        return None
+
+
+class StoredItinerary:
+    """A serialized itinerary as held in the cache, optionally gzip-compressed."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @property
+    def is_gzipped(self) -> bool:
+        return self.data[:2] == GZIP_MAGIC_NUMBER
+
+    def to_json(self) -> bytes:
+        """Get the itinerary as uncompressed JSON."""
+
+        return gzip.decompress(self.data) if self.is_gzipped else self.data
+
+    @property
+    def etag(self) -> str:
+        """Get a weak entity tag, equal for all encodings of the same stored itinerary."""
+
+        return f'W/"{hashlib.blake2b(self.data, digest_size=16).hexdigest()}"'
+
+
+class ItineraryCache:
+    """Stores itineraries by ID, sharing the bodies of identical itineraries between IDs.
+
+    Bodies are kept until the end of their itinerary, unless the memory budget is
+    exceeded. Then the bodies expiring soonest are evicted first.
+    """
+
+    def __init__(self, redis_client: Redis):
+        self.redis_client = redis_client
+        self.enforcing_budget = False
+        self.stored_writes = 0
+        self.deduplicated_writes = 0
+        self.deduplicated_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _serialize_body(self, itinerary: ItineraryBase) -> tuple[str, bytes]:
+        """Serialize an itinerary without its ID, returning the key of its body and the body."""
+
+        data = itinerary.model_copy(update={"itinerary_id": ID_PLACEHOLDER}).model_dump_json().encode()
+        body_key = f"{BODY_KEY_PREFIX}{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+        if (
+            settings.ITINERARY_CACHE_COMPRESSION
+            and len(data) >= settings.ITINERARY_CACHE_COMPRESSION_MIN_SIZE
+        ):
+            data = compress_body(data)
+        return body_key, data
+
+    def _deserialize_hash(self, data: dict[bytes, bytes]) -> bytes:
+        """Restore an itinerary from the legacy Redis hash format as JSON."""
+
+        decoded_data = {k.decode(): v.decode() for k, v in data.items()}
+        deserialized_data = {
+            k: json.loads(v) if v.startswith("[") or v.startswith("{") else v
+            for k, v in decoded_data.items()
+        }
+        return ItineraryResponseModel.model_validate(deserialized_data).model_dump_json().encode()
+
+    def _get_ttl(self, itinerary: ItineraryBase) -> int:
+        # Consider the itinerary to be invalid past its end time
+        return int((itinerary.end_time - datetime.now()).total_seconds())
+
+    async def _write_references(
+        self,
+        references: list[tuple[str, str, bytes, int]],
+        xx: bool = False,
+        delete_keys: Sequence[str] = (),
+        set_members: Sequence[tuple[str, Sequence[str], int]] = (),
+    ) -> list[bool]:
+        """Point keys to bodies in a single round trip, storing bodies that are not stored yet.
+
+        Takes the key, body key, body and TTL of each reference, returning which were written.
+        Keys to delete and members to add to sets, with the TTL of the set, go along.
+        """
+
+        current_time = time.time()
+        async with self.redis_client.pipeline(transaction=True) as pipeline:
+            for key, body_key, body, ttl in references:
+                pipeline.set(body_key, body, ex=ttl, nx=True)
+                pipeline.set(key, body_key, ex=ttl, xx=xx)
+            for key in delete_keys:
+                pipeline.delete(key)
+            for key, members, ttl in set_members:
+                pipeline.sadd(key, *members)
+                pipeline.expire(key, ttl)
+            results = await pipeline.execute()
+
+        # Account for the bodies this call has stored, identical ones were already there
+        stored_bodies = {}
+        for (_, body_key, body, ttl), stored in zip(references, results[0::2]):
+            if stored:
+                self.stored_writes += 1
+                itinerary_cache_writes.inc(("stored",))
+                stored_bodies[body_key] = (len(body), current_time + ttl)
+            else:
+                self.deduplicated_writes += 1
+                self.deduplicated_bytes += len(body)
+                itinerary_cache_writes.inc(("deduplicated",))
+
+        if stored_bodies:
+            async with self.redis_client.pipeline(transaction=True) as pipeline:
+                pipeline.zadd(
+                    BODY_EXPIRY_KEY,
+                    {body_key: expiry_time for body_key, (_, expiry_time) in stored_bodies.items()},
+                )
+                pipeline.hset(
+                    BODY_SIZES_KEY,
+                    mapping={body_key: size for body_key, (size, _) in stored_bodies.items()},
+                )
+                pipeline.incrby(
+                    BODY_TOTAL_SIZE_KEY, sum(size for size, _ in stored_bodies.values())
+                )
+                total_size = (await pipeline.execute())[-1]
+            if total_size > settings.ITINERARY_CACHE_MEMORY_BUDGET:
+                await self._enforce_memory_budget()
+
+        return [bool(written) for written in results[1 : 2 * len(references) : 2]]
+
+    async def _remove_bodies(self, body_keys: list[bytes], evict: bool):
+        """Remove bodies from the accounting of the memory budget, deleting evicted ones."""
+
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for body_key in body_keys:
+                pipeline.zrem(BODY_EXPIRY_KEY, body_key)
+            pipeline.hmget(BODY_SIZES_KEY, body_keys)
+            results = await pipeline.execute()
+
+        # Only the worker that removes a body from the index accounts for it
+        removed_bodies = {
+            body_key: int(size or 0)
+            for body_key, removed, size in zip(body_keys, results[:-1], results[-1])
+            if removed
+        }
+        if not removed_bodies:
+            return
+        async with self.redis_client.pipeline(transaction=True) as pipeline:
+            if evict:
+                pipeline.delete(*removed_bodies)
+            pipeline.hdel(BODY_SIZES_KEY, *removed_bodies)
+            pipeline.decrby(BODY_TOTAL_SIZE_KEY, sum(removed_bodies.values()))
+            await pipeline.execute()
+
+        reason = "budget" if evict else "expired"
+        itinerary_cache_evictions.inc((reason,), len(removed_bodies))
+        if evict:
+            self.evictions += len(removed_bodies)
+
+    async def _enforce_memory_budget(self):
+        """Forget bodies that have expired, then evict those expiring soonest until within budget."""
+
+        if self.enforcing_budget:
+            return
+        self.enforcing_budget = True
+        try:
+            expired_body_keys = await self.redis_client.zrangebyscore(
+                BODY_EXPIRY_KEY, "-inf", time.time()
+            )
+            if expired_body_keys:
+                await self._remove_bodies(expired_body_keys, evict=False)
+
+            while int(await self.redis_client.get(BODY_TOTAL_SIZE_KEY) or 0) > settings.ITINERARY_CACHE_MEMORY_BUDGET:
+                body_keys = await self.redis_client.zrange(
+                    BODY_EXPIRY_KEY, 0, settings.ITINERARY_CACHE_EVICTION_BATCH_SIZE - 1
+                )
+                if not body_keys:
+                    break
+                await self._remove_bodies(body_keys, evict=True)
+        finally:
+            self.enforcing_budget = False
+
+    async def write(self, itineraries: list[ItineraryDetailed]):
+        """Write all itineraries of a plan to the cache in a single round trip."""
+
+        references = []
+        for itinerary in itineraries:
+            ttl = self._get_ttl(itinerary)
+            if ttl > 0:
+                references.append(
+                    (
+                        f"{ITINERARY_KEY_PREFIX}{itinerary.itinerary_id}",
+                        *self._serialize_body(itinerary),
+                        ttl,
+                    )
+                )
+        if references:
+            await self._write_references(references)
+
+    async def update(self, itinerary: ItineraryDetailed) -> StoredItinerary | None:
+        """Replace a cached itinerary under its ID, unless it has expired in the meantime."""
+
+        itinerary_id = str(itinerary.itinerary_id)
+        key = f"{ITINERARY_KEY_PREFIX}{itinerary_id}"
+        body_key, body = self._serialize_body(itinerary)
+
+        # Delays can push back the time the itinerary is valid until, ended ones are left as they are
+        ttl = self._get_ttl(itinerary)
+        if ttl > 0:
+            [updated] = await self._write_references([(key, body_key, body, ttl)], xx=True)
+            # Itineraries written before their keys were namespaced move to the namespaced key
+            if not updated and await self.redis_client.exists(itinerary_id):
+                [updated] = await self._write_references(
+                    [(key, body_key, body, ttl)], delete_keys=[itinerary_id]
+                )
+        else:
+            updated = await self.redis_client.exists(key, itinerary_id)
+        return StoredItinerary(patch_body_id(body, itinerary_id)) if updated else None
+
+    async def write_planned(self, itineraries: list[ItineraryPlanned]):
+        """Write planned itineraries, whose details have not been fetched yet, in a single round trip."""
+
+        references = []
+        plan_ids: dict[str, list[str]] = {}
+        plan_ttls: dict[str, int] = {}
+        for itinerary in itineraries:
+            ttl = self._get_ttl(itinerary)
+            if ttl > 0:
+                references.append(
+                    (
+                        f"{PLANNED_ITINERARY_KEY_PREFIX}{itinerary.itinerary_id}",
+                        *self._serialize_body(itinerary),
+                        ttl,
+                    )
+                )
+                plan_key = get_plan_key(itinerary.plan_variables)
+                plan_ids.setdefault(plan_key, []).append(str(itinerary.itinerary_id))
+                plan_ttls[plan_key] = max(ttl, plan_ttls.get(plan_key, 0))
+        if references:
+            await self._write_references(
+                references,
+                set_members=[
+                    (f"{PLANNED_PLAN_KEY_PREFIX}{plan_key}", ids, plan_ttls[plan_key])
+                    for plan_key, ids in plan_ids.items()
+                ],
+            )
+
+    async def read_planned(self, itinerary_id: str) -> ItineraryPlanned | None:
+        """Retrieve a planned itinerary by its ID."""
+
+        itinerary_id = parse_itinerary_id(itinerary_id)
+        if itinerary_id is None:
+            return None
+        data = await self._read_body(f"{PLANNED_ITINERARY_KEY_PREFIX}{itinerary_id}", itinerary_id)
+        if data is None:
+            return None
+        return ItineraryPlanned.model_validate_json(StoredItinerary(data).to_json())
+
+    async def read_planned_plan(self, plan_key: str) -> list[ItineraryPlanned]:
+        """Retrieve the itineraries of a plan that are still planned, in two round trips."""
+
+        itinerary_ids = [
+            itinerary_id.decode()
+            for itinerary_id in await self.redis_client.smembers(f"{PLANNED_PLAN_KEY_PREFIX}{plan_key}")
+        ]
+        if not itinerary_ids:
+            return []
+        references = await self.redis_client.mget(
+            [f"{PLANNED_ITINERARY_KEY_PREFIX}{itinerary_id}" for itinerary_id in itinerary_ids]
+        )
+
+        # Those whose details were fetched in the meantime are gone
+        planned = [
+            (itinerary_id, reference)
+            for itinerary_id, reference in zip(itinerary_ids, references)
+            if reference is not None
+        ]
+        body_keys = [reference for _, reference in planned if reference.startswith(BODY_KEY_PREFIX.encode())]
+        bodies = dict(zip(body_keys, await self.redis_client.mget(body_keys))) if body_keys else {}
+
+        itineraries = []
+        for itinerary_id, reference in planned:
+            # Planned itineraries written before bodies were shared hold their body directly
+            data = reference
+            if reference in bodies:
+                if bodies[reference] is None:
+                    continue
+                data = patch_body_id(bodies[reference], itinerary_id)
+            itineraries.append(ItineraryPlanned.model_validate_json(StoredItinerary(data).to_json()))
+        return itineraries
+
+    async def replace_planned(
+        self, itineraries: list[ItineraryDetailed], unavailable_ids: Sequence[str] = ()
+    ) -> dict[str, StoredItinerary]:
+        """Store the full details of planned itineraries in their place, in a single round trip.
+
+        Planned itineraries whose details are no longer available are dropped along the way.
+        """
+
+        references = []
+        planned_keys = [f"{PLANNED_ITINERARY_KEY_PREFIX}{itinerary_id}" for itinerary_id in unavailable_ids]
+        stored_itineraries = {}
+        for itinerary in itineraries:
+            itinerary_id = str(itinerary.itinerary_id)
+            body_key, body = self._serialize_body(itinerary)
+            planned_keys.append(f"{PLANNED_ITINERARY_KEY_PREFIX}{itinerary_id}")
+            ttl = self._get_ttl(itinerary)
+            if ttl > 0:
+                references.append((f"{ITINERARY_KEY_PREFIX}{itinerary_id}", body_key, body, ttl))
+            stored_itineraries[itinerary_id] = StoredItinerary(patch_body_id(body, itinerary_id))
+
+        if references:
+            await self._write_references(references, delete_keys=planned_keys)
+        elif planned_keys:
+            await self.redis_client.delete(*planned_keys)
+        return stored_itineraries
+
+    async def _read_body(
+        self, key: str, itinerary_id: str, legacy_key: str | None = None
+    ) -> bytes | None:
+        """Follow the reference under a key to its body, with the ID patched in."""
+
+        data = await self.redis_client.get(key)
+
+        # Itineraries written before their keys were namespaced are stored under their bare ID
+        if data is None and legacy_key is not None:
+            try:
+                data = await self.redis_client.get(legacy_key)
+            except ResponseError:
+                # Itineraries written before the blob format was introduced are hashes
+                data = self._deserialize_hash(await self.redis_client.hgetall(legacy_key))
+
+        # Itineraries written before bodies were shared hold their body directly
+        if data is not None and data.startswith(BODY_KEY_PREFIX.encode()):
+            body = await self.redis_client.get(data)
+            data = patch_body_id(body, itinerary_id) if body is not None else None
+
+        if data is None:
+            self.misses += 1
+            itinerary_cache_reads.inc(("miss",))
+        else:
+            self.hits += 1
+            itinerary_cache_reads.inc(("hit",))
+        return data
+
+    async def read_raw(self, itinerary_id: str) -> StoredItinerary | None:
+        """Retrieve an itinerary by its ID as stored, without decoding it."""
+
+        itinerary_id = parse_itinerary_id(itinerary_id)
+        if itinerary_id is None:
+            return None
+        data = await self._read_body(f"{ITINERARY_KEY_PREFIX}{itinerary_id}", itinerary_id, itinerary_id)
+        return StoredItinerary(data) if data is not None else None
+
+    async def read(self, itinerary_id: str) -> ItineraryResponseModel | None:
+        """Retrieve a full itinerary by its ID."""
+
+        stored_itinerary = await self.read_raw(itinerary_id)
+        if stored_itinerary is None:
+            return None
+        return ItineraryResponseModel.model_validate_json(stored_itinerary.to_json())
+
+    async def stats(self) -> dict[str, any]:
+        """Produce the size of the shared bodies against the memory budget, with counters for this worker."""
+
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.zcard(BODY_EXPIRY_KEY)
+            pipeline.get(BODY_TOTAL_SIZE_KEY)
+            bodies, total_size = await pipeline.execute()
+
+        writes = self.stored_writes + self.deduplicated_writes
+        reads = self.hits + self.misses
+        return {
+            "bodies": bodies,
+            "total_size": int(total_size or 0),
+            "memory_budget": settings.ITINERARY_CACHE_MEMORY_BUDGET,
+            "stored_writes": self.stored_writes,
+            "deduplicated_writes": self.deduplicated_writes,
+            "deduplicated_bytes": self.deduplicated_bytes,
+            "deduplication_ratio": round(self.deduplicated_writes / writes, 4) if writes else 0,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / reads, 4) if reads else 0,
+        }
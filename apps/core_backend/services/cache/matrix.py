@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from datetime import datetime
+from core.config import settings
+from schemas.routing import Mode, RoutingMatrixRequestModel
+import numpy as np
+import time
+
+# Transport modes by their code in the cache, code 0 ends the leg modes of a cell
+LEG_MODES = list(Mode)
+LEG_MODE_CODES = {mode.value: code for code, mode in enumerate(LEG_MODES, start=1)}
+
+# Most legs stored per cell, cells with more legs are not cached
+MAX_LEGS = 16
+
+# Duration of cells for which the routing engine found no itinerary
+NO_ITINERARY = -1
+
+
+def encode_leg_modes(leg_modes: list[str]) -> np.ndarray:
+    codes = np.zeros(MAX_LEGS, dtype=np.uint8)
+    codes[: len(leg_modes)] = [LEG_MODE_CODES[mode] for mode in leg_modes]
+    return codes
+
+
+def decode_leg_modes(codes: list[int]) -> list[Mode]:
+    return [LEG_MODES[code - 1] for code in codes if code]
+
+
+class TravelTimeCache:
+    """In-process cache of travel time matrix cells, held in preallocated arrays.
+
+    Each cell takes a fixed slot holding its duration, the codes of its leg modes and its
+    expiry time, so that cached cells cost no Python objects beyond their key. Slots of
+    the least recently used cells are reused once all are taken.
+    """
+
+    def __init__(self):
+        self.size = settings.ROUTING_MATRIX_CACHE_SIZE
+        self.durations = np.zeros(self.size, dtype=np.int32)
+        self.leg_modes = np.zeros((self.size, MAX_LEGS), dtype=np.uint8)
+        self.expiry_times = np.zeros(self.size, dtype=np.float64)
+        self.slots: OrderedDict[str, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def build_keys(
+        self, request: RoutingMatrixRequestModel, transport_modes: list[Mode]
+    ) -> list[str]:
+        """Build the cache keys of all cells of a matrix layer, by origin and then destination."""
+
+        # Cells share the grid size and time buckets of the plan cache
+        grid_size = settings.PLAN_CACHE_GRID_SIZE
+        timestamp = datetime.strptime(
+            f"{request.date} {request.time}", "%Y-%m-%d %H:%M:%S"
+        ).timestamp()
+        prefix = ":".join(
+            [
+                str(int(timestamp // settings.PLAN_CACHE_TIME_BUCKET)),
+                ",".join(sorted({mode.value for mode in transport_modes})),
+                str(int(request.accessible)),
+                str(int(request.time_is_arrival)),
+            ]
+        )
+        origin_cells = [
+            f"{round(origin.lat / grid_size)}:{round(origin.lon / grid_size)}"
+            for origin in request.origins
+        ]
+        destination_cells = [
+            f"{round(destination.lat / grid_size)}:{round(destination.lon / grid_size)}"
+            for destination in request.destinations
+        ]
+        return [
+            f"{origin_cell}:{destination_cell}:{prefix}"
+            for origin_cell in origin_cells
+            for destination_cell in destination_cells
+        ]
+
+    def get(self, keys: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Look up cells, returning which were found along with their durations and leg mode codes."""
+
+        slots = np.full(len(keys), -1, dtype=np.int64)
+        for index, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is not None:
+                slots[index] = slot
+                self.slots.move_to_end(key)
+
+        # Expired cells count as missing, their slots are reused once they are routed again
+        found = slots >= 0
+        found[found] = self.expiry_times[slots[found]] >= time.time()
+        hits = int(found.sum())
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found, self.durations[slots], self.leg_modes[slots]
+
+    def set(self, key: str, duration: int | None, leg_modes: list[str]):
+        """Store a cell, with a duration of None if no itinerary was found."""
+
+        if len(leg_modes) > MAX_LEGS:
+            return
+
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            if len(self.slots) < self.size:
+                slot = len(self.slots)
+            else:
+                _, slot = self.slots.popitem(last=False)
+        self.slots[key] = slot
+        self.durations[slot] = NO_ITINERARY if duration is None else duration
+        self.leg_modes[slot] = encode_leg_modes(leg_modes)
+        self.expiry_times[slot] = time.time() + settings.ROUTING_MATRIX_CACHE_TTL
+
+    def stats(self) -> dict[str, any]:
+        """Produce hit and miss counters and the memory held by cached cells for this worker."""
+
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.slots),
+            "size": self.size,
+            "array_bytes": self.durations.nbytes + self.leg_modes.nbytes + self.expiry_times.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
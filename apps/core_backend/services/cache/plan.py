@@ -0,0 +1,98 @@
+from datetime import datetime
+from pydantic import TypeAdapter
+from redis.asyncio import Redis
+from core.config import settings
+from schemas.routing import RoutingPlanRequestModel, ItineraryBase
+
+
+class PlanCache:
+    """Shares OTP plan results between requests for nearby places and similar times."""
+
+    def __init__(
+        self, redis_client: Redis, itinerary_model: type[ItineraryBase], namespace: str
+    ):
+        self.redis_client = redis_client
+        self.itineraries_adapter = TypeAdapter(list[itinerary_model])
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    def build_key(self, request: RoutingPlanRequestModel) -> str:
+        """Build a cache key from a normalized plan request."""
+
+        # Snap coordinates to grid cells so requests from nearby points share a key
+        grid_size = settings.PLAN_CACHE_GRID_SIZE
+        cells = [
+            round(value / grid_size)
+            for value in (
+                request.origin.lat,
+                request.origin.lon,
+                request.destination.lat,
+                request.destination.lon,
+            )
+        ]
+
+        # Group requested times into buckets
+        timestamp = datetime.strptime(
+            f"{request.date} {request.time}", "%Y-%m-%d %H:%M:%S"
+        ).timestamp()
+        time_bucket = int(timestamp // settings.PLAN_CACHE_TIME_BUCKET)
+
+        transport_modes = ",".join(sorted({mode.value for mode in request.transport_modes}))
+
+        return ":".join(
+            [
+                self.namespace,
+                *map(str, cells),
+                str(time_bucket),
+                transport_modes,
+                str(int(request.accessible)),
+                str(int(request.time_is_arrival)),
+                str(request.num_itineraries),
+            ]
+        )
+
+    async def load(self, key: str) -> list[ItineraryBase] | None:
+        """Load the itineraries of a previously computed plan without counting a lookup."""
+
+        data = await self.redis_client.get(key)
+        if data is None:
+            return None
+        return self.itineraries_adapter.validate_json(data)
+
+    async def get(self, key: str) -> list[ItineraryBase] | None:
+        """Fetch the itineraries of a previously computed plan."""
+
+        itineraries = await self.load(key)
+        if itineraries is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return itineraries
+
+    async def set(self, key: str, itineraries: list[ItineraryBase]):
+        """Store the itineraries of a plan until the earliest of them departs."""
+
+        if not itineraries:
+            return
+
+        # A plan is stale as soon as its first itinerary has departed
+        earliest_start_time = min(itinerary.start_time for itinerary in itineraries)
+        ttl = min(
+            settings.PLAN_CACHE_TTL,
+            int((earliest_start_time - datetime.now()).total_seconds()),
+        )
+        if ttl <= 0:
+            return
+
+        await self.redis_client.set(key, self.itineraries_adapter.dump_json(itineraries), ex=ttl)
+
+    def stats(self) -> dict[str, any]:
+        """Produce hit and miss counters for this worker."""
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from core.config import settings
+from core.utils import get_distance
+from schemas.place import Place
+from services.index.places import get_spatial_cell, get_spatial_cell_radius
+
+
+class ReverseGeocodingCache:
+    """In-process grid of places seen in autocomplete results and remote reverse lookups.
+
+    Places are bucketed by the same grid cells as the local place index, so that lookups
+    only compare the places of the cells within the distance. The least recently seen
+    places are dropped once the cache is full.
+    """
+
+    def __init__(self):
+        self.places: OrderedDict[str, tuple[tuple[int, int], Place]] = OrderedDict()
+        self.cells: dict[tuple[int, int], dict[str, Place]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, places: list[Place]):
+        """Remember places, refreshing those already known."""
+
+        for place in places:
+            cell = get_spatial_cell(place.coordinates.lat, place.coordinates.lon)
+            previous = self.places.pop(place.id, None)
+            if previous is not None:
+                self._remove_from_cell(place.id, previous[0])
+            self.places[place.id] = (cell, place)
+            self.cells.setdefault(cell, {})[place.id] = place
+
+        while len(self.places) > settings.REVERSE_GEOCODING_CACHE_SIZE:
+            place_id, (cell, _) = self.places.popitem(last=False)
+            self._remove_from_cell(place_id, cell)
+
+    def _remove_from_cell(self, place_id: str, cell: tuple[int, int]):
+        places = self.cells[cell]
+        del places[place_id]
+        if not places:
+            del self.cells[cell]
+
+    def find_nearest(self, lat: float, lon: float, max_distance: float) -> tuple[float, Place] | None:
+        """Find the closest known place within a distance in meters, with its distance."""
+
+        row, column = get_spatial_cell(lat, lon)
+        row_radius, column_radius = get_spatial_cell_radius(lat, max_distance)
+        rows = range(row - row_radius, row + row_radius + 1)
+        columns = range(column - column_radius, column + column_radius + 1)
+
+        # Near the poles, far more cells lie within the distance than hold any places
+        if len(rows) * len(columns) > len(self.cells):
+            cells = [cell for cell in self.cells if cell[0] in rows and cell[1] in columns]
+        else:
+            cells = [(neighbour_row, neighbour_column) for neighbour_row in rows for neighbour_column in columns]
+
+        nearest: tuple[float, Place] | None = None
+        for cell in cells:
+            for place in self.cells.get(cell, {}).values():
+                distance = get_distance(lat, lon, place.coordinates.lat, place.coordinates.lon)
+                if distance <= max_distance and (nearest is None or distance < nearest[0]):
+                    nearest = distance, place
+
+        if nearest is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return nearest
+
+    def stats(self) -> dict[str, any]:
+        """Produce the number of known places with hit and miss counters for this worker."""
+
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.places),
+            "size": settings.REVERSE_GEOCODING_CACHE_SIZE,
+            "cells": len(self.cells),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
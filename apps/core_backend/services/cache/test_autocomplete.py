@@ -0,0 +1,102 @@
+from datetime import datetime
+import pytest
+from core.config import settings
+from schemas.coordinates import Coordinates
+from schemas.geocoding import GeocodingAutocompleteRequestModel, SupportedGeocodingProviders
+from schemas.place import Place, PlaceType
+from services.adaptors.geocoding import PELIAS_AUTOCOMPLETE_SIZE, GeocodingAdaptor
+from services.cache.autocomplete import AutocompleteCache
+
+PELIAS = SupportedGeocodingProviders.PELIAS
+FOCUS_POINT = Coordinates(lat=49.4447, lon=7.7690)
+
+
+def build_place(name: str) -> Place:
+    return Place(
+        id=name,
+        name=name,
+        address=f"{name}, Landstuhl",
+        type=PlaceType.ADDRESS,
+        coordinates=Coordinates(lat=49.44, lon=7.76),
+    )
+
+
+def build_request(query: str) -> GeocodingAutocompleteRequestModel:
+    return GeocodingAutocompleteRequestModel(query=query, timestamp=datetime.now())
+
+
+@pytest.fixture
+def adaptor(monkeypatch) -> GeocodingAdaptor:
+    monkeypatch.setattr(settings, "AUTOCOMPLETE_CACHE_ENABLED", True)
+    return GeocodingAdaptor([PELIAS], "http://pelias.test/", "key")
+
+
+def answer(adaptor: GeocodingAdaptor, monkeypatch, places: list[Place]) -> list[str]:
+    """Let the provider answer every query with places, recording the queries it was asked."""
+
+    queries = []
+
+    async def fetch_autocomplete_places(provider, request):
+        queries.append(request.query)
+        return places
+
+    monkeypatch.setattr(adaptor, "_fetch_autocomplete_places", fetch_autocomplete_places)
+    return queries
+
+
+async def test_longer_queries_are_answered_from_a_complete_prefix():
+    cache = AutocompleteCache("test")
+    places = [build_place("Kaiserbrunnen"), build_place("Kammgarn"), build_place("Kaiserslautern Hbf")]
+    await cache.set("Kai", FOCUS_POINT, 5, None, places, complete=True)
+
+    assert [place.name for place in await cache.get("Kaiser", FOCUS_POINT, 5, None)] == [
+        "Kaiserbrunnen",
+        "Kaiserslautern Hbf",
+    ]
+    assert [place.name for place in await cache.get("Kaiser H", FOCUS_POINT, 5, None)] == [
+        "Kaiserslautern Hbf"
+    ]
+    assert cache.stats()["hits"]["memory_prefix"] == 2
+
+
+async def test_longer_queries_are_answered_from_a_complete_prefix_in_redis(redis_client):
+    places = [build_place("Kaiserbrunnen"), build_place("Kammgarn")]
+    await AutocompleteCache("test", redis_client).set("Kai", None, 5, None, places, complete=True)
+
+    # Another worker only has the shared tier
+    cache = AutocompleteCache("test", redis_client)
+    assert [place.name for place in await cache.get("Kaiser", None, 5, None)] == ["Kaiserbrunnen"]
+    assert cache.stats()["hits"]["redis_prefix"] == 1
+
+
+async def test_prefixes_with_a_full_page_of_places_go_to_the_provider(adaptor, monkeypatch):
+    places = [build_place(f"Kaiserstraße {number}") for number in range(PELIAS_AUTOCOMPLETE_SIZE)]
+    queries = answer(adaptor, monkeypatch, places)
+
+    await adaptor._get_autocomplete_places(PELIAS, build_request("Kai"))
+    await adaptor._get_autocomplete_places(PELIAS, build_request("Kaiser"))
+    assert queries == ["Kai", "Kaiser"]
+
+
+async def test_prefixes_with_fewer_places_than_a_page_answer_longer_queries(adaptor, monkeypatch):
+    queries = answer(adaptor, monkeypatch, [build_place("Kaiserbrunnen"), build_place("Kammgarn")])
+
+    await adaptor._get_autocomplete_places(PELIAS, build_request("Kai"))
+    places = await adaptor._get_autocomplete_places(PELIAS, build_request("Kaiser"))
+    assert queries == ["Kai"]
+    assert [place.name for place in places] == ["Kaiserbrunnen"]
+
+
+async def test_focus_point_and_limit_are_part_of_the_key():
+    cache = AutocompleteCache("test")
+    key = cache.build_key("Kaiser", FOCUS_POINT, 5, None)
+
+    # Focus points within the same geohash cell share a key
+    assert key == cache.build_key("kaiser ", Coordinates(lat=49.4448, lon=7.7691), 5, None)
+    assert key != cache.build_key("Kaiser", None, 5, None)
+    assert key != cache.build_key("Kaiser", Coordinates(lat=49.2354, lon=7.0045), 5, None)
+    assert key != cache.build_key("Kaiser", FOCUS_POINT, 10, None)
+
+    await cache.set("Kaiser", FOCUS_POINT, 5, None, [build_place("Kaiserbrunnen")], complete=True)
+    assert await cache.get("Kaiser", FOCUS_POINT, 10, None) is None
+    assert await cache.get("Kaiser", None, 5, None) is None
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+import gzip
+import json
+import pytest
+from core.config import settings
+from schemas.routing import ItineraryDetailed
+from services.cache.itinerary import (
+    BODY_EXPIRY_KEY,
+    BODY_SIZES_KEY,
+    BODY_TOTAL_SIZE_KEY,
+    ID_PLACEHOLDER,
+    ITINERARY_KEY_PREFIX,
+    ItineraryCache,
+    compress_body,
+    patch_body_id,
+)
+
+
+def build_itinerary(start_time: datetime | None = None, duration: int = 600) -> ItineraryDetailed:
+    start_time = start_time or datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    return ItineraryDetailed(
+        itinerary_id=uuid4(),
+        duration=duration,
+        start_time=start_time,
+        end_time=start_time + timedelta(seconds=duration),
+        origin={"lat": 49.44, "lon": 7.76},
+        destination={"lat": 49.45, "lon": 7.77},
+        legs=[
+            {
+                "mode": "WALK",
+                "duration": duration,
+                "distance": duration,
+                "geometry": "_p~iF~ps|U" * 200,
+                "steps": [],
+                "start_time": start_time,
+                "end_time": start_time + timedelta(seconds=duration),
+            }
+        ],
+    )
+
+
+@pytest.fixture
+def cache(redis_client) -> ItineraryCache:
+    return ItineraryCache(redis_client)
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+def test_ids_are_patched_into_bodies(compressed):
+    itinerary = build_itinerary()
+    data = itinerary.model_copy(update={"itinerary_id": ID_PLACEHOLDER}).model_dump_json().encode()
+    body = compress_body(data) if compressed else data
+
+    itinerary_id = str(itinerary.itinerary_id)
+    patched = patch_body_id(body, itinerary_id)
+
+    # Decompressing checks the CRC-32 of the patched body
+    restored = gzip.decompress(patched) if compressed else patched
+    assert restored == itinerary.model_dump_json().encode()
+    assert len(patched) == len(body)
+
+
+async def test_identical_itineraries_share_a_body(cache, redis_client):
+    itinerary = build_itinerary()
+    twin = itinerary.model_copy(update={"itinerary_id": uuid4()})
+    await cache.write([itinerary, twin, build_itinerary(duration=900)])
+
+    stats = await cache.stats()
+    assert (stats["stored_writes"], stats["deduplicated_writes"], stats["bodies"]) == (2, 1, 2)
+    assert stats["total_size"] == sum(map(int, (await redis_client.hgetall(BODY_SIZES_KEY)).values()))
+
+    for original in (itinerary, twin):
+        stored = await cache.read_raw(str(original.itinerary_id))
+        assert stored.is_gzipped
+        assert ItineraryDetailed.model_validate_json(stored.to_json()) == original
+
+
+async def test_bodies_expiring_soonest_are_evicted_beyond_the_memory_budget(cache, redis_client, monkeypatch):
+    now = datetime.now().replace(microsecond=0)
+    itineraries = [build_itinerary(now + timedelta(hours=hours)) for hours in (3, 1, 2)]
+    await cache.write(itineraries[:1])
+    body_size = int(await redis_client.get(BODY_TOTAL_SIZE_KEY))
+
+    monkeypatch.setattr(settings, "ITINERARY_CACHE_MEMORY_BUDGET", 5 * body_size // 2)
+    monkeypatch.setattr(settings, "ITINERARY_CACHE_EVICTION_BATCH_SIZE", 1)
+    await cache.write(itineraries[1:])
+
+    found = [await cache.read_raw(str(itinerary.itinerary_id)) is not None for itinerary in itineraries]
+    assert found == [True, False, True]
+    stats = await cache.stats()
+    assert (stats["bodies"], stats["evictions"]) == (2, 1)
+    assert stats["total_size"] <= settings.ITINERARY_CACHE_MEMORY_BUDGET
+
+
+async def test_expired_bodies_are_forgotten_without_eviction(cache, redis_client, monkeypatch):
+    await cache.write([build_itinerary()])
+    await redis_client.zadd(BODY_EXPIRY_KEY, {key: 0 for key in await redis_client.zrange(BODY_EXPIRY_KEY, 0, -1)})
+
+    await cache._enforce_memory_budget()
+    stats = await cache.stats()
+    assert (stats["bodies"], stats["total_size"], stats["evictions"]) == (0, 0, 0)
+    assert not await redis_client.hlen(BODY_SIZES_KEY)
+
+
+async def test_itineraries_are_kept_apart_from_internal_keys(cache, redis_client):
+    itinerary = build_itinerary()
+    await cache.write([itinerary])
+
+    assert await redis_client.exists(f"{ITINERARY_KEY_PREFIX}{itinerary.itinerary_id}")
+    assert not await redis_client.exists(str(itinerary.itinerary_id))
+    assert await cache.read_raw(BODY_TOTAL_SIZE_KEY) is None
+    assert await cache.read_planned("itinerary_bodies:sizes") is None
+    assert await cache.read_raw(str(itinerary.itinerary_id).upper()) is not None
+
+
+async def test_itineraries_under_their_bare_id_are_read_and_moved_on_update(cache, redis_client):
+    itinerary = build_itinerary()
+    itinerary_id = str(itinerary.itinerary_id)
+    await redis_client.set(itinerary_id, itinerary.model_dump_json(), ex=3600)
+    assert ItineraryDetailed.model_validate_json((await cache.read_raw(itinerary_id)).to_json()) == itinerary
+
+    delayed = itinerary.model_copy(update={"end_time": itinerary.end_time + timedelta(minutes=5)})
+    stored = await cache.update(delayed)
+    assert ItineraryDetailed.model_validate_json(stored.to_json()) == delayed
+    assert not await redis_client.exists(itinerary_id)
+    assert (await cache.read(itinerary_id)).end_time == delayed.end_time
+
+
+async def test_itineraries_stored_as_hashes_are_read(cache, redis_client):
+    itinerary = build_itinerary()
+    itinerary_id = str(itinerary.itinerary_id)
+    mapping = {
+        key: json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+        for key, value in json.loads(itinerary.model_dump_json()).items()
+    }
+    await redis_client.hset(itinerary_id, mapping=mapping)
+
+    assert (await cache.read(itinerary_id)).itinerary_id == itinerary.itinerary_id
+
+
+async def test_expired_itineraries_are_not_updated(cache):
+    itinerary = build_itinerary()
+    assert await cache.update(itinerary) is None
+    assert await cache.read_raw(str(itinerary.itinerary_id)) is None
+
+
+async def test_entity_tags_follow_the_contents(cache):
+    itinerary = build_itinerary()
+    await cache.write([itinerary])
+    stored = await cache.read_raw(str(itinerary.itinerary_id))
+
+    assert (await cache.read_raw(str(itinerary.itinerary_id))).etag == stored.etag
+    assert (await cache.update(itinerary)).etag == stored.etag
+    delayed = itinerary.model_copy(update={"end_time": itinerary.end_time + timedelta(minutes=5)})
+    assert (await cache.update(delayed)).etag != stored.etag
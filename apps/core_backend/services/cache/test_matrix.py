@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from core.config import settings
+from schemas.routing import Mode, RoutingMatrixRequestModel
+from services.cache.matrix import MAX_LEGS, NO_ITINERARY, TravelTimeCache, decode_leg_modes
+
+
+@pytest.fixture
+def cache(monkeypatch) -> TravelTimeCache:
+    monkeypatch.setattr(settings, "ROUTING_MATRIX_CACHE_SIZE", 3)
+    return TravelTimeCache()
+
+
+def test_cells_are_read_from_their_slots(cache):
+    cache.set("a", 600, ["WALK", "BUS", "WALK"])
+    cache.set("b", None, [])
+
+    found, durations, leg_modes = cache.get(["a", "missing", "b"])
+    assert found.tolist() == [True, False, True]
+    assert durations[[0, 2]].tolist() == [600, NO_ITINERARY]
+    assert decode_leg_modes(leg_modes[0]) == [Mode.walk, Mode.bus, Mode.walk]
+    assert decode_leg_modes(leg_modes[2]) == []
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_slots_are_reused(cache):
+    for key in ("a", "b", "c"):
+        cache.set(key, 60, ["WALK"])
+    cache.get(["a"])
+    cache.set("d", 120, ["BICYCLE"])
+
+    found, durations, _ = cache.get(["a", "b", "c", "d"])
+    assert found.tolist() == [True, False, True, True]
+    assert durations[3] == 120
+    assert sorted(cache.slots.values()) == [0, 1, 2]
+
+
+def test_updating_a_cell_keeps_its_slot(cache):
+    cache.set("a", 60, ["WALK", "BUS", "WALK"])
+    slot = cache.slots["a"]
+    cache.set("a", 90, ["WALK"])
+
+    found, durations, leg_modes = cache.get(["a"])
+    assert cache.slots["a"] == slot
+    assert durations[0] == 90
+    assert decode_leg_modes(leg_modes[0]) == [Mode.walk]
+
+
+def test_expired_cells_are_missing(cache, monkeypatch):
+    monkeypatch.setattr(settings, "ROUTING_MATRIX_CACHE_TTL", -1)
+    cache.set("a", 60, ["WALK"])
+    found, _, _ = cache.get(["a"])
+    assert not found.any()
+
+
+def test_cells_with_too_many_legs_are_not_cached(cache):
+    cache.set("a", 60, ["WALK", "BUS"] * MAX_LEGS)
+    assert not cache.get(["a"])[0].any()
+    assert len(cache.slots) == 0
+
+
+def test_nearby_cells_share_keys(cache):
+    request = RoutingMatrixRequestModel(
+        origins=[{"lat": 49.44, "lon": 7.76}, {"lat": 49.440001, "lon": 7.760001}],
+        destinations=[{"lat": 49.45, "lon": 7.77}, {"lat": 49.6, "lon": 7.9}],
+        date="2030-03-17",
+        time="08:00:00",
+        transport_modes=[["WALK", "BUS"]],
+    )
+    keys = cache.build_keys(request, [Mode.bus, Mode.walk])
+
+    assert len(keys) == 4
+    assert keys[0] == keys[2]
+    assert keys[0] != keys[1]
+    assert keys == cache.build_keys(request, [Mode.walk, Mode.bus])
+    assert np.unique(keys).size == 2
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+import pytest
+from core.config import settings
+from schemas.routing import ItineraryPlanned, RoutingPlanRequestModel
+from services.cache.plan import PlanCache
+
+
+def build_request(**update) -> RoutingPlanRequestModel:
+    return RoutingPlanRequestModel(
+        **{
+            "origin": {"lat": 49.44, "lon": 7.76},
+            "destination": {"lat": 49.45, "lon": 7.77},
+            "date": "2030-03-17",
+            "time": "08:00:00",
+            "transport_modes": ["WALK", "BUS"],
+            **update,
+        }
+    )
+
+
+def build_itinerary(start_time: datetime) -> ItineraryPlanned:
+    return ItineraryPlanned(
+        itinerary_id=uuid4(),
+        duration=600,
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=10),
+        origin={"lat": 49.44, "lon": 7.76},
+        destination={"lat": 49.45, "lon": 7.77},
+        legs=[{"mode": "WALK", "duration": 600, "distance": 800, "geometry": "_p~iF~ps|U"}],
+        plan_variables={"date": "2030-03-17"},
+    )
+
+
+@pytest.fixture
+def plan_cache(redis_client) -> PlanCache:
+    return PlanCache(redis_client, ItineraryPlanned, namespace="plan_summary")
+
+
+async def test_plans_expire_when_their_first_itinerary_departs(plan_cache, redis_client):
+    now = datetime.now()
+    key = plan_cache.build_key(build_request())
+    await plan_cache.set(key, [build_itinerary(now + timedelta(minutes=3)), build_itinerary(now + timedelta(hours=1))])
+
+    assert 170 <= await redis_client.ttl(key) <= 180
+    assert len(await plan_cache.get(key)) == 2
+
+
+async def test_plans_expire_after_the_configured_ttl_at_the_latest(plan_cache, redis_client):
+    key = plan_cache.build_key(build_request())
+    await plan_cache.set(key, [build_itinerary(datetime.now() + timedelta(hours=1))])
+    assert settings.PLAN_CACHE_TTL - 5 <= await redis_client.ttl(key) <= settings.PLAN_CACHE_TTL
+
+
+async def test_departed_and_empty_plans_are_not_cached(plan_cache, redis_client):
+    key = plan_cache.build_key(build_request())
+    await plan_cache.set(key, [build_itinerary(datetime.now() - timedelta(seconds=1))])
+    await plan_cache.set(key, [])
+
+    assert not await redis_client.exists(key)
+    assert await plan_cache.get(key) is None
+    assert plan_cache.stats()["misses"] == 1
+
+
+async def test_loading_shared_plans_is_not_counted(plan_cache):
+    key = plan_cache.build_key(build_request())
+    await plan_cache.set(key, [build_itinerary(datetime.now() + timedelta(hours=1))])
+    [itinerary] = await plan_cache.load(key)
+
+    assert isinstance(itinerary, ItineraryPlanned)
+    assert plan_cache.stats()["hits"] == 0
+
+
+def test_nearby_requests_share_a_key(plan_cache):
+    key = plan_cache.build_key(build_request())
+    assert key.startswith("plan_summary:")
+    assert key == plan_cache.build_key(
+        build_request(origin={"lat": 49.4402, "lon": 7.7598}, time="08:00:30")
+    )
+    assert key == plan_cache.build_key(build_request(transport_modes=["BUS", "WALK"]))
+    assert key != plan_cache.build_key(build_request(time="08:01:00"))
+    assert key != plan_cache.build_key(build_request(accessible=True))
@@ -0,0 +1,52 @@
+from core.config import settings
+from schemas.coordinates import Coordinates
+from schemas.place import Place, PlaceType
+from services.cache.reverse import ReverseGeocodingCache
+
+
+def build_place(place_id: str, lat: float, lon: float) -> Place:
+    return Place(
+        id=place_id,
+        name=place_id,
+        address=f"{place_id}, Kaiserslautern",
+        type=PlaceType.ADDRESS,
+        coordinates=Coordinates(lat=lat, lon=lon),
+    )
+
+
+def test_finds_the_nearest_known_place():
+    cache = ReverseGeocodingCache()
+    cache.add([build_place("a", 49.4435, 7.7700), build_place("b", 49.4411, 7.7639)])
+
+    _, place = cache.find_nearest(49.4409, 7.7641, 50)
+    assert place.id == "b"
+    assert cache.find_nearest(49.4500, 7.7800, 50) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_moved_places_are_found_at_their_new_location():
+    cache = ReverseGeocodingCache()
+    cache.add([build_place("a", 49.4435, 7.7700)])
+    cache.add([build_place("a", 49.4411, 7.7639)])
+
+    assert cache.find_nearest(49.4435, 7.7700, 50) is None
+    assert cache.find_nearest(49.4411, 7.7639, 50)[1].id == "a"
+    assert cache.stats()["cells"] == 1
+
+
+def test_least_recently_seen_places_are_dropped(monkeypatch):
+    monkeypatch.setattr(settings, "REVERSE_GEOCODING_CACHE_SIZE", 2)
+    cache = ReverseGeocodingCache()
+    cache.add([build_place("a", 49.4435, 7.7700), build_place("b", 49.4411, 7.7639)])
+    cache.add([build_place("a", 49.4435, 7.7700), build_place("c", 49.4430, 7.7715)])
+
+    assert list(cache.places) == ["a", "c"]
+    assert cache.find_nearest(49.4411, 7.7639, 50) is None
+
+
+def test_finds_places_near_the_poles():
+    cache = ReverseGeocodingCache()
+    cache.add([build_place("pole", 89.9999, 0.0), build_place("a", 49.4435, 7.7700)])
+
+    assert cache.find_nearest(90.0, 0.0, 50)[1].id == "pole"
+    assert cache.find_nearest(-90.0, 0.0, 50) is None
@@ -0,0 +1,445 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+import csv
+import fcntl
+import json
+import math
+import os
+import shutil
+import numpy as np
+from core.config import settings
+from core.utils import get_distance, normalize_text
+from schemas.coordinates import Coordinates
+from schemas.place import Place, PlaceType
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+# Ranking penalty in meters for places matching the query only by their address, not by their name
+ADDRESS_MATCH_PENALTY = 100_000.0
+
+# Size in degrees of the grid cells places are bucketed in for reverse lookups, and the
+# number of cells in each row of the grid
+SPATIAL_CELL_SIZE = 0.001
+SPATIAL_GRID_COLUMNS = math.ceil(360 / SPATIAL_CELL_SIZE)
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Text fields stored per place, as references into the string table
+PLACE_FIELDS = ("id", "name", "address", "street", "locality", "postcode")
+
+# Arrays making up an index, each stored as a memory-mappable .npy file
+INDEX_ARRAYS = (
+    "strings",
+    "string_offsets",
+    "place_fields",
+    "place_coordinates",
+    "tokens",
+    "token_offsets",
+    "posting_offsets",
+    "postings",
+    "posting_in_name",
+    "place_token_offsets",
+    "place_tokens",
+    "place_token_in_name",
+    "spatial_cells",
+    "spatial_places",
+)
+
+
+@dataclass
+class PlaceRecord:
+    id: str
+    name: str
+    address: str
+    street: str | None
+    locality: str | None
+    postcode: str | None
+    lat: float
+    lon: float
+
+
+def _build_record(properties: dict, lat: float, lon: float, default_id: str) -> PlaceRecord | None:
+    """Build a place record from Pelias-style or CSV properties."""
+
+    name = properties.get("name")
+    if not name:
+        return None
+    street = properties.get("street") or None
+    if street and properties.get("housenumber"):
+        street = f"{street} {properties['housenumber']}"
+    locality = properties.get("locality") or properties.get("city") or None
+    postcode = properties.get("postcode") or properties.get("postalcode") or None
+    address = properties.get("label") or ", ".join(
+        part for part in (name, street if street != name else None, postcode, locality) if part
+    )
+    return PlaceRecord(
+        id=str(properties.get("id") or default_id),
+        name=name,
+        address=address,
+        street=street,
+        locality=locality,
+        postcode=postcode,
+        lat=lat,
+        lon=lon,
+    )
+
+
+def read_places_csv(path: Path) -> Iterator[PlaceRecord]:
+    """Read places from a CSV extract with name, street, housenumber, postcode, locality, lat and lon columns."""
+
+    with open(path, newline="", encoding="utf-8") as file:
+        for index, row in enumerate(csv.DictReader(file)):
+            record = _build_record(row, float(row["lat"]), float(row["lon"]), f"local/{index}")
+            if record is not None:
+                yield record
+
+
+def read_places_geojson(path: Path) -> Iterator[PlaceRecord]:
+    """Read places from the point features of a GeoJSON extract."""
+
+    with open(path, encoding="utf-8") as file:
+        features = json.load(file)["features"]
+    for index, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") != "Point":
+            continue
+        lon, lat = geometry["coordinates"][:2]
+        record = _build_record(feature.get("properties") or {}, lat, lon, f"local/{index}")
+        if record is not None:
+            yield record
+
+
+def read_places(path: Path) -> Iterator[PlaceRecord]:
+    """Read places from a CSV or GeoJSON extract."""
+
+    if path.suffix == ".csv":
+        return read_places_csv(path)
+    if path.suffix in (".geojson", ".json"):
+        return read_places_geojson(path)
+    raise ValueError(f"Unsupported place extract format {path.suffix}, expected CSV or GeoJSON")
+
+
+def get_spatial_cell(lat: float, lon: float) -> tuple[int, int]:
+    """Get the row and column of the grid cell containing a coordinate."""
+
+    return math.floor((lat + 90) / SPATIAL_CELL_SIZE), math.floor((lon + 180) / SPATIAL_CELL_SIZE)
+
+
+def get_spatial_cell_radius(lat: float, distance: float) -> tuple[int, int]:
+    """Get how many rows and columns of grid cells around a coordinate lie within a distance in meters."""
+
+    # Rows shrink towards the poles, but never need more than half the cells of a row either side
+    return (
+        math.ceil(distance / (SPATIAL_CELL_SIZE * METERS_PER_DEGREE)),
+        min(
+            math.ceil(distance / (SPATIAL_CELL_SIZE * METERS_PER_DEGREE * math.cos(math.radians(lat)))),
+            SPATIAL_GRID_COLUMNS // 2,
+        ),
+    )
+
+
+def _pack_strings(values: Iterable[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Pack strings into a single UTF-8 buffer and the offsets of each string within it."""
+
+    encoded_values = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded_values) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded_values], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded_values), dtype=np.uint8), offsets
+
+
+class StringTable:
+    """Read-only sequence of strings packed into a single buffer, for binary search without decoding."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.data[self.offsets[index] : self.offsets[index + 1]].tobytes()
+
+
+class PlaceIndex:
+    """Compact prefix index of places, held in flat arrays that can be memory-mapped.
+
+    Place text fields reference a table of interned strings. Normalized tokens of each
+    place are kept in a sorted vocabulary, so that all tokens starting with a prefix form
+    a contiguous range whose postings, the places containing them, are contiguous too.
+    The tokens of each place are kept as well, to check candidates against further query tokens.
+    For reverse lookups, places are also sorted by their grid cell, so that the places of
+    neighbouring cells in a row are found by binary search.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.strings = StringTable(arrays["strings"], arrays["string_offsets"])
+        self.tokens = StringTable(arrays["tokens"], arrays["token_offsets"])
+        self.place_fields = arrays["place_fields"]
+        self.place_coordinates = arrays["place_coordinates"]
+        self.posting_offsets = arrays["posting_offsets"]
+        self.postings = arrays["postings"]
+        self.posting_in_name = arrays["posting_in_name"]
+        self.place_token_offsets = arrays["place_token_offsets"]
+        self.place_tokens = arrays["place_tokens"]
+        self.place_token_in_name = arrays["place_token_in_name"]
+        self.spatial_cells = arrays["spatial_cells"]
+        self.spatial_places = arrays["spatial_places"]
+
+    @classmethod
+    def build(cls, records: Iterable[PlaceRecord]) -> "PlaceIndex":
+        """Build an index from place records."""
+
+        strings: dict[str, int] = {}
+        place_fields, place_coordinates = [], []
+        token_postings: dict[str, dict[int, bool]] = {}
+        for place_index, record in enumerate(records):
+            place_fields.append(
+                [
+                    strings.setdefault(value, len(strings)) if value is not None else -1
+                    for value in (getattr(record, field) for field in PLACE_FIELDS)
+                ]
+            )
+            place_coordinates.append((record.lat, record.lon))
+
+            # Remember whether each token occurs in the name, to rank name matches first
+            name_tokens = set(normalize_text(record.name).split())
+            address_tokens = set(
+                normalize_text(
+                    " ".join(
+                        value
+                        for value in (record.address, record.street, record.locality, record.postcode)
+                        if value
+                    )
+                ).split()
+            )
+            for token in name_tokens | address_tokens:
+                token_postings.setdefault(token, {})[place_index] = token in name_tokens
+
+        # Sort tokens by their UTF-8 encoding, which is the order binary search compares them in
+        vocabulary = sorted(token_postings, key=str.encode)
+        posting_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum([len(token_postings[token]) for token in vocabulary], out=posting_offsets[1:])
+        postings = np.fromiter(
+            (place for token in vocabulary for place in token_postings[token]),
+            dtype=np.int32,
+            count=posting_offsets[-1],
+        )
+        posting_in_name = np.fromiter(
+            (in_name for token in vocabulary for in_name in token_postings[token].values()),
+            dtype=bool,
+            count=posting_offsets[-1],
+        )
+
+        # Invert the postings into the tokens of each place
+        posting_tokens = np.repeat(np.arange(len(vocabulary), dtype=np.int32), np.diff(posting_offsets))
+        place_order = np.argsort(postings, kind="stable")
+        place_token_offsets = np.zeros(len(place_fields) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(postings, minlength=len(place_fields)), out=place_token_offsets[1:])
+
+        # Sort places by the key of their grid cell, row by row
+        place_coordinates = np.array(place_coordinates, dtype=np.float64).reshape(-1, 2)
+        place_cells = np.floor((place_coordinates[:, 0] + 90) / SPATIAL_CELL_SIZE).astype(
+            np.int64
+        ) * SPATIAL_GRID_COLUMNS + np.floor((place_coordinates[:, 1] + 180) / SPATIAL_CELL_SIZE).astype(np.int64)
+        spatial_order = np.argsort(place_cells, kind="stable")
+
+        string_data, string_offsets = _pack_strings(strings)
+        token_data, token_offsets = _pack_strings(vocabulary)
+        return cls(
+            {
+                "strings": string_data,
+                "string_offsets": string_offsets,
+                "place_fields": np.array(place_fields, dtype=np.int32).reshape(-1, len(PLACE_FIELDS)),
+                "place_coordinates": place_coordinates,
+                "tokens": token_data,
+                "token_offsets": token_offsets,
+                "posting_offsets": posting_offsets,
+                "postings": postings,
+                "posting_in_name": posting_in_name,
+                "place_token_offsets": place_token_offsets,
+                "place_tokens": posting_tokens[place_order],
+                "place_token_in_name": posting_in_name[place_order],
+                "spatial_cells": place_cells[spatial_order],
+                "spatial_places": spatial_order.astype(np.int32),
+            }
+        )
+
+    def save(self, directory: Path):
+        """Save the index to a directory, replacing any previous index there."""
+
+        staging_directory = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        staging_directory.mkdir(parents=True, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(staging_directory / f"{name}.npy", self.arrays[name])
+
+        # Workers that mapped the previous index keep reading it until they reload
+        if directory.exists():
+            shutil.rmtree(directory)
+        staging_directory.rename(directory)
+
+    @classmethod
+    def load(cls, directory: Path) -> "PlaceIndex":
+        """Load an index from a directory, memory-mapping its arrays to share them between processes."""
+
+        # Plain array views of the mappings avoid the indexing overhead of np.memmap
+        return cls(
+            {
+                name: np.asarray(np.load(directory / f"{name}.npy", mmap_mode="r"))
+                for name in INDEX_ARRAYS
+            }
+        )
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+        return all((directory / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+    def __len__(self) -> int:
+        return len(self.place_fields)
+
+    def _find_token_range(self, prefix: str) -> tuple[int, int]:
+        """Find the range of vocabulary tokens starting with a prefix."""
+
+        encoded_prefix = prefix.encode()
+        start = bisect_left(self.tokens, encoded_prefix)
+        # No UTF-8 encoded string contains 0xFF, so this sorts after every token with the prefix
+        end = bisect_left(self.tokens, encoded_prefix + b"\xff", lo=start)
+        return start, end
+
+    def _build_place(self, place_index: int) -> Place:
+        fields = {
+            field: self.strings[string_index].decode() if string_index >= 0 else None
+            for field, string_index in zip(PLACE_FIELDS, self.place_fields[place_index].tolist())
+        }
+        lat, lon = self.place_coordinates[place_index].tolist()
+        return Place(
+            **fields,
+            type=PlaceType.ADDRESS,
+            coordinates=Coordinates(lat=lat, lon=lon),
+        )
+
+    def search(self, query: str, focus_point: Coordinates | None, limit: int) -> list[Place]:
+        """Find places where every query token is a prefix of a place token, closest name matches first."""
+
+        query_tokens = dict.fromkeys(normalize_text(query).split())
+        if not query_tokens or limit <= 0:
+            return []
+
+        # Start from the places of the query token with the fewest postings
+        token_ranges = sorted(
+            map(self._find_token_range, query_tokens),
+            key=lambda token_range: self.posting_offsets[token_range[1]] - self.posting_offsets[token_range[0]],
+        )
+        start, end = token_ranges[0]
+        posting_start, posting_end = self.posting_offsets[start], self.posting_offsets[end]
+        if posting_start == posting_end:
+            return []
+        postings = self.postings[posting_start:posting_end]
+        matches = np.zeros(len(self), dtype=bool)
+        matches[postings] = True
+        name_matches = np.zeros(len(self), dtype=bool)
+        name_matches[postings[self.posting_in_name[posting_start:posting_end]]] = True
+        candidates = np.flatnonzero(matches)
+        candidate_name_matches = name_matches[candidates]
+
+        # Check the remaining query tokens against the tokens of the candidates only
+        for start, end in token_ranges[1:]:
+            token_starts = self.place_token_offsets[candidates]
+            token_counts = self.place_token_offsets[candidates + 1] - token_starts
+            group_starts = np.cumsum(token_counts) - token_counts
+            token_positions = np.arange(token_counts.sum()) + np.repeat(token_starts - group_starts, token_counts)
+            place_tokens = self.place_tokens[token_positions]
+            in_range = (place_tokens >= start) & (place_tokens < end)
+            token_matches = np.logical_or.reduceat(in_range, group_starts)
+            token_name_matches = np.logical_or.reduceat(
+                in_range & self.place_token_in_name[token_positions], group_starts
+            )
+            candidates = candidates[token_matches]
+            candidate_name_matches = (candidate_name_matches & token_name_matches)[token_matches]
+            if not len(candidates):
+                return []
+
+        # Rank name matches first, then by distance to the focus point
+        scores = np.where(candidate_name_matches, 0.0, ADDRESS_MATCH_PENALTY)
+        if focus_point is not None:
+            coordinates = self.place_coordinates[candidates]
+            delta_lat = np.radians(coordinates[:, 0] - focus_point.lat)
+            delta_lon = np.radians(coordinates[:, 1] - focus_point.lon) * np.cos(np.radians(focus_point.lat))
+            scores += EARTH_RADIUS * np.hypot(delta_lat, delta_lon)
+
+        top = np.argpartition(scores, limit)[:limit] if len(candidates) > limit else np.arange(len(candidates))
+        top = top[np.argsort(scores[top], kind="stable")]
+        return [self._build_place(place_index) for place_index in candidates[top].tolist()]
+
+    def find_nearest(self, lat: float, lon: float, max_distance: float) -> tuple[float, Place] | None:
+        """Find the closest place within a distance in meters, with its distance."""
+
+        # Only the places of cells within the distance are compared, each row of cells
+        # being a single range of the sorted cells
+        row, column = get_spatial_cell(lat, lon)
+        row_radius, column_radius = get_spatial_cell_radius(lat, max_distance)
+        nearest_place, nearest_distance = -1, max_distance
+        for neighbour_row in range(row - row_radius, row + row_radius + 1):
+            row_start = neighbour_row * SPATIAL_GRID_COLUMNS
+            start = self.spatial_cells.searchsorted(row_start + max(column - column_radius, 0))
+            end = self.spatial_cells.searchsorted(
+                row_start + min(column + column_radius, SPATIAL_GRID_COLUMNS - 1), side="right"
+            )
+            for place_index in self.spatial_places[start:end].tolist():
+                place_lat, place_lon = self.place_coordinates[place_index].tolist()
+                distance = get_distance(lat, lon, place_lat, place_lon)
+                if distance <= nearest_distance:
+                    nearest_place, nearest_distance = place_index, distance
+
+        if nearest_place < 0:
+            return None
+        return nearest_distance, self._build_place(nearest_place)
+
+
+class LocalPlaceIndex:
+    """The place index of local and reverse geocoding, built once from a regional extract and shared by all workers."""
+
+    def __init__(self):
+        self._index: PlaceIndex | None = None
+
+    def load(self):
+        """Load the index, building it first if the extract is newer than the stored index."""
+
+        index_directory = Path(settings.GEOCODING_LOCAL_INDEX_DIR)
+        source_path = (
+            Path(settings.GEOCODING_LOCAL_SOURCE_PATH)
+            if settings.GEOCODING_LOCAL_SOURCE_PATH
+            else None
+        )
+        index_directory.parent.mkdir(parents=True, exist_ok=True)
+
+        # Let a single worker build the index while the others wait to map it
+        with open(index_directory.with_name(f"{index_directory.name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if source_path is not None and (
+                not PlaceIndex.exists(index_directory)
+                or source_path.stat().st_mtime > (index_directory / "postings.npy").stat().st_mtime
+            ):
+                PlaceIndex.build(read_places(source_path)).save(index_directory)
+
+        if not PlaceIndex.exists(index_directory):
+            raise FileNotFoundError(
+                f"No place index found at {index_directory}, configure GEOCODING_LOCAL_SOURCE_PATH to build one"
+            )
+        self._index = PlaceIndex.load(index_directory)
+
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def get(self) -> PlaceIndex:
+        if self._index is None:
+            raise RuntimeError("The local place index has not been loaded, has the application started?")
+        return self._index
+
+
+local_place_index = LocalPlaceIndex()
@@ -0,0 +1,68 @@
+import pytest
+from core.utils import get_distance
+from services.index.places import PlaceIndex, PlaceRecord, get_spatial_cell
+
+
+def build_record(name: str, lat: float, lon: float) -> PlaceRecord:
+    return PlaceRecord(
+        id=name,
+        name=name,
+        address=f"{name}, 67655 Kaiserslautern",
+        street=name,
+        locality="Kaiserslautern",
+        postcode="67655",
+        lat=lat,
+        lon=lon,
+    )
+
+
+RECORDS = [
+    build_record("Stiftsplatz", 49.4440, 7.7690),
+    build_record("Marktstraße 1", 49.4435, 7.7700),
+    build_record("Rathaus", 49.4430, 7.7715),
+    # Just across a cell boundary to the north and to the west of the point below
+    build_record("Schillerplatz", 49.4411, 7.7639),
+    build_record("Fruchthallstraße 2", 49.4399, 7.7650),
+]
+
+
+@pytest.fixture
+def index() -> PlaceIndex:
+    return PlaceIndex.build(RECORDS)
+
+
+def test_finds_the_nearest_place_with_its_distance(index):
+    distance, place = index.find_nearest(49.4436, 7.7702, 50)
+    assert place.name == "Marktstraße 1"
+    assert distance == pytest.approx(get_distance(49.4436, 7.7702, 49.4435, 7.7700))
+
+
+@pytest.mark.parametrize(
+    "lat, lon, record",
+    [(49.4409, 7.7641, RECORDS[3]), (49.4401, 7.7651, RECORDS[4])],
+)
+def test_finds_places_in_neighbouring_cells(index, lat, lon, record):
+    assert get_spatial_cell(lat, lon) != get_spatial_cell(record.lat, record.lon)
+    _, place = index.find_nearest(lat, lon, 50)
+    assert place.name == record.name
+
+
+def test_finds_nothing_beyond_the_distance(index):
+    assert index.find_nearest(49.4500, 7.7800, 50) is None
+    assert index.find_nearest(49.4436, 7.7702, 5) is None
+    assert PlaceIndex.build([]).find_nearest(49.4436, 7.7702, 50) is None
+
+
+def test_saved_indexes_find_the_same_places(index, tmp_path):
+    index.save(tmp_path / "index")
+    loaded = PlaceIndex.load(tmp_path / "index")
+
+    assert loaded.find_nearest(49.4431, 7.7714, 50) == index.find_nearest(49.4431, 7.7714, 50)
+    assert [place.name for place in loaded.search("markt", None, limit=5)] == ["Marktstraße 1"]
+
+
+def test_finds_places_near_the_poles():
+    index = PlaceIndex.build([build_record("Pole", 89.9999, 0.0), build_record("Elsewhere", 89.9999, 120.0)])
+    _, place = index.find_nearest(90.0, 0.0, 50)
+    assert place.name == "Pole"
+    assert index.find_nearest(-90.0, 0.0, 50) is None
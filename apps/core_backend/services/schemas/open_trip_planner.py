@@ -1,7 +1,14 @@
-from pydantic import BaseModel, field_validator, model_validator
+from pydantic import BaseModel, ConfigDict, field_validator
 from datetime import datetime
+from typing import Any
+from typing_extensions import TypedDict
 from enum import Enum
-from core.utils import to_snake_case
+from core.utils import to_camel_case
+
+# Map camelCase response fields via aliases computed once per model, "from" maps to from_
+camel_case_config = ConfigDict(
+    alias_generator=to_camel_case, validate_by_alias=True, validate_by_name=True
+)
 
 class OTPInputCoordinates(BaseModel):
     lat: float
@@ -78,10 +85,13 @@ class OTPAbsoluteDirection(Enum):
 
 class OTPStop(BaseModel):
     id: str
+    gtfs_id: str | None = None
     name: str
     lat: float
     lon: float
 
+    model_config = camel_case_config
+
 class OTPPlace(BaseModel):
     name: str | None = None
     vertex_type: OTPVertexType | None = None
@@ -109,10 +119,13 @@ class OTPRoute(BaseModel):
 
 class OTPTrip(BaseModel):
     id: str
+    gtfs_id: str | None = None
     route: OTPRoute
     trip_short_name: str | None = None
     trip_headsign: str | None = None
 
+    model_config = camel_case_config
+
 class OTPStep(BaseModel):
     distance: float
     lon: float
@@ -121,13 +134,8 @@ class OTPStep(BaseModel):
     absolute_direction: OTPAbsoluteDirection
     street_name: str
     bogus_name: bool
-    
-    @model_validator(mode="before")
-    @classmethod
-    def remap_model_fields(cls, values: dict[str, any]):
-        for key in list(values.keys()):
-            values[to_snake_case(key)] = values.pop(key)
-        return values
+
+    model_config = camel_case_config
 
 class OTPPickupDropoffType(Enum):
     scheduled = "SCHEDULED"
@@ -145,6 +153,7 @@ class OTPLeg(BaseModel):
     leg_geometry: OTPGeometry
     real_time: bool
     realtime_state: OTPRealtimeState | None
+    service_date: str | None = None
     distance: float
     transit_leg: bool
     from_: OTPPlace
@@ -157,17 +166,9 @@ class OTPLeg(BaseModel):
     pickup_type: OTPPickupDropoffType | None = None
     dropoff_type: OTPPickupDropoffType | None = None
     accessibility_score: float | None
-    
-    @model_validator(mode="before")
-    @classmethod
-    def remap_model_fields(cls, values: dict[str, any]):
-        for key in list(values.keys()):
-            if key == "from":
-                values["from_"] = values.pop("from")
-            else:
-                values[to_snake_case(key)] = values.pop(key)
-        return values
-    
+
+    model_config = camel_case_config
+
     @field_validator("start_time", "end_time", mode="before")
     @classmethod
     def validate_timestamp(cls, value: int | datetime):
@@ -183,14 +184,9 @@ class OTPItinerary(BaseModel):
     duration: int
     legs: list[OTPLeg]
     accessibility_score: float | None
-    
-    @model_validator(mode="before")
-    @classmethod
-    def remap_model_fields(cls, values):
-        for key in list(values.keys()):
-            values[to_snake_case(key)] = values.pop(key)
-        return values
-    
+
+    model_config = camel_case_config
+
     @field_validator("start_time", "end_time", mode="before")
     @classmethod
     def validate_timestamp(cls, value: int | datetime):
@@ -246,12 +242,111 @@ class OTPPlanResponseModel(BaseModel):
         else:
             raise ValueError("Date must be a timestamp in milliseconds since epoch.")
 
-    @model_validator(mode="before")
+    model_config = camel_case_config
+
+class OTPGraphQLError(BaseModel):
+    message: str
+    extensions: dict[str, Any] | None = None
+
+class OTPPlanData(BaseModel):
+    plan: OTPPlanResponseModel
+
+class OTPPlanGraphQLResponse(BaseModel):
+    data: OTPPlanData | None = None
+    errors: list[OTPGraphQLError] | None = None
+
+class OTPSummaryTrip(BaseModel):
+    gtfs_id: str | None = None
+
+    model_config = camel_case_config
+
+class OTPSummaryLeg(BaseModel):
+    mode: OTPMode
+    duration: float
+    distance: float
+    leg_geometry: OTPGeometry
+    service_date: str | None = None
+    trip: OTPSummaryTrip | None = None
+
+    model_config = camel_case_config
+
+class OTPSummaryItinerary(BaseModel):
+    start_time: datetime
+    end_time: datetime
+    duration: int
+    legs: list[OTPSummaryLeg]
+
+    model_config = camel_case_config
+
+    @field_validator("start_time", "end_time", mode="before")
     @classmethod
-    def remap_model_fields(cls, values: dict[str, any]):
-        for key in list(values.keys()):
-            if key == "from":
-                values["from_"] = values.pop("from")
-            else:
-                values[to_snake_case(key)] = values.pop(key)
-        return values
+    def validate_timestamp(cls, value: int | datetime):
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, int):
+            return datetime.fromtimestamp(value / 1000)
+        raise ValueError("Invalid value for start_time or end_time field.")
+
+class OTPSummaryPlanResponseModel(BaseModel):
+    from_: OTPPlace
+    to: OTPPlace
+    itineraries: list[OTPSummaryItinerary]
+
+    model_config = camel_case_config
+
+class OTPSummaryPlanData(BaseModel):
+    plan: OTPSummaryPlanResponseModel
+
+class OTPSummaryPlanGraphQLResponse(BaseModel):
+    data: OTPSummaryPlanData | None = None
+    errors: list[OTPGraphQLError] | None = None
+
+class OTPStoptimeStop(BaseModel):
+    gtfs_id: str
+
+    model_config = camel_case_config
+
+class OTPStoptime(BaseModel):
+    stop: OTPStoptimeStop
+    # Start of the service day as a UNIX timestamp, all other times in seconds since then
+    service_day: int
+    scheduled_arrival: int
+    realtime_arrival: int
+    arrival_delay: int
+    scheduled_departure: int
+    realtime_departure: int
+    departure_delay: int
+    realtime: bool
+
+    model_config = camel_case_config
+
+class OTPTripStoptimes(BaseModel):
+    gtfs_id: str
+    stoptimes_for_date: list[OTPStoptime]
+
+    model_config = camel_case_config
+
+class OTPTripData(BaseModel):
+    trip: OTPTripStoptimes | None = None
+
+class OTPTripGraphQLResponse(BaseModel):
+    data: OTPTripData | None = None
+    errors: list[OTPGraphQLError] | None = None
+
+# Travel time results are kept as plain dicts, matrices can hold thousands of itineraries
+class OTPTravelTimeLeg(TypedDict):
+    mode: OTPMode
+
+class OTPTravelTimeItinerary(TypedDict):
+    duration: int
+    legs: list[OTPTravelTimeLeg]
+
+class OTPTravelTimePlan(TypedDict):
+    itineraries: list[OTPTravelTimeItinerary]
+
+class OTPTravelTimeData(BaseModel):
+    plan: OTPTravelTimePlan
+
+class OTPTravelTimeGraphQLResponse(BaseModel):
+    data: OTPTravelTimeData | None = None
+    errors: list[OTPGraphQLError] | None = None